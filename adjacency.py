@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+"""
+Adjacency index of an obja model.
+"""
+
+import numpy as np
+
+def face_array(model):
+    """
+    Returns the (F, 3) array of the vertex indices of the faces of a model and
+    the (F,) mask of its visible faces, whether the model stores its faces as
+    obja.Face objects or as an array.
+    """
+    if isinstance(model.faces, np.ndarray):
+        return model.faces, model.visible
+    faces = np.array([[face.a, face.b, face.c] for face in model.faces], np.int64).reshape(-1, 3)
+    visible = np.array([face.visible for face in model.faces], bool)
+    return faces, visible
+
+class Adjacency:
+    """
+    The vertex to face and vertex to vertex adjacency of a mesh, stored in
+    compressed sparse row form.
+
+    The faces around vertex i are face_indices[face_offsets[i]:face_offsets[i + 1]],
+    in increasing order, and its neighbours are
+    ring_indices[ring_offsets[i]:ring_offsets[i + 1]]. The faces themselves
+    are kept in face_array.
+    """
+    def __init__(self, faces, nb_vertices, visible = None):
+        """
+        Builds the index from a (F, 3) array of vertex indices. Only the faces
+        set in the visible mask are indexed, if it is given.
+        """
+        faces = np.asarray(faces, np.int64).reshape(-1, 3)
+        if len(faces) > 0:
+            nb_vertices = max(nb_vertices, int(faces.max()) + 1)
+        self.nb_vertices = nb_vertices
+        self.face_array = faces
+
+        # A degenerate face is listed once around each of its vertices
+        corners = np.ones(faces.shape, bool)
+        corners[:, 1] = faces[:, 1] != faces[:, 0]
+        corners[:, 2] = (faces[:, 2] != faces[:, 0]) & (faces[:, 2] != faces[:, 1])
+        if visible is not None:
+            corners &= np.asarray(visible, bool)[:, None]
+        vertices = faces[corners]
+        face_ids = np.nonzero(corners)[0]
+        order = np.argsort(vertices, kind = 'stable')
+        self.face_indices = face_ids[order]
+        self.face_offsets = self._offsets(vertices)
+
+        # Both directions of the three edges of every face
+        edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        if visible is not None:
+            edges = edges[np.repeat(np.asarray(visible, bool), 3)]
+        edges = np.concatenate((edges, edges[:, ::-1]))
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        base = max(nb_vertices, 1)
+        keys = np.sort(edges[:, 0] * base + edges[:, 1])
+        first = np.ones(len(keys), bool)
+        first[1:] = keys[1:] != keys[:-1]
+        keys = keys[first]
+        self.ring_indices = keys % base
+        self.ring_offsets = self._offsets(keys // base)
+
+    def _offsets(self, vertices):
+        """
+        Returns the row offsets of a compressed sparse row index from the row
+        of each of its elements.
+        """
+        offsets = np.zeros(self.nb_vertices + 1, np.int64)
+        np.cumsum(np.bincount(vertices, minlength = self.nb_vertices), out = offsets[1:])
+        return offsets
+
+    @staticmethod
+    def from_model(model):
+        """
+        Builds the index of the visible faces of a model.
+        """
+        faces, visible = face_array(model)
+        return Adjacency(faces, len(model.vertices), visible)
+
+    def faces(self, vertex):
+        """
+        Returns the indices of the faces around a vertex.
+        """
+        if vertex >= self.nb_vertices:
+            return self.face_indices[:0]
+        return self.face_indices[self.face_offsets[vertex]:self.face_offsets[vertex + 1]]
+
+    def neighbours(self, vertex):
+        """
+        Returns the indices of the vertices sharing an edge with a vertex.
+        """
+        if vertex >= self.nb_vertices:
+            return self.ring_indices[:0]
+        return self.ring_indices[self.ring_offsets[vertex]:self.ring_offsets[vertex + 1]]
+
+    def valences(self):
+        """
+        Returns the number of neighbours of every vertex.
+        """
+        return np.diff(self.ring_offsets)
+
+    def ring(self, vertex, r):
+        """
+        Returns the list of the vertices at most r edges away from a vertex,
+        the vertex itself excluded.
+        """
+        return ring(self, vertex, r)
+
+class DynamicAdjacency:
+    """
+    The vertex to face adjacency of a mesh whose faces are edited, stored as
+    one set of face indices per vertex.
+
+    It answers the same queries as Adjacency, and is updated face by face so
+    that an edit costs time proportional to the number of faces it touches.
+    """
+    def __init__(self, faces, nb_vertices, visible = None):
+        """
+        Builds the index from a (F, 3) array of vertex indices. Only the faces
+        set in the visible mask are indexed, if it is given. Both arrays are
+        kept, and must be edited in place along with the index.
+        """
+        index = Adjacency(faces, nb_vertices, visible)
+        self.nb_vertices = index.nb_vertices
+        self.face_array = faces
+        self.visible = visible
+        face_indices = index.face_indices.tolist()
+        offsets = index.face_offsets.tolist()
+        self.vertex_faces = [set(face_indices[offsets[i]:offsets[i + 1]]) for i in range(self.nb_vertices)]
+
+    def to_adjacency(self):
+        """
+        Returns a compressed sparse row index of the current faces.
+        """
+        return Adjacency(self.face_array, self.nb_vertices, self.visible)
+
+    def faces(self, vertex):
+        """
+        Returns the indices of the faces around a vertex, in increasing order.
+        """
+        if vertex >= self.nb_vertices:
+            return np.empty(0, np.int64)
+        return np.array(sorted(self.vertex_faces[vertex]), np.int64)
+
+    def neighbours(self, vertex):
+        """
+        Returns the indices of the vertices sharing an edge with a vertex.
+        """
+        if vertex >= self.nb_vertices or not self.vertex_faces[vertex]:
+            return np.empty(0, np.int64)
+        neighbours = np.unique(self.face_array[list(self.vertex_faces[vertex])])
+        return neighbours[neighbours != vertex]
+
+    def valences(self):
+        """
+        Returns the number of neighbours of every vertex.
+        """
+        return np.array([len(self.neighbours(vertex)) for vertex in range(self.nb_vertices)], np.int64)
+
+    def is_isolated(self, vertex):
+        """
+        Tells whether a vertex belongs to no face.
+        """
+        return vertex >= self.nb_vertices or not self.vertex_faces[vertex]
+
+    def ring(self, vertex, r):
+        """
+        Returns the list of the vertices at most r edges away from a vertex,
+        the vertex itself excluded.
+        """
+        return ring(self, vertex, r)
+
+    def add_face(self, face, vertices):
+        """
+        Indexes a face around each of its vertices.
+        """
+        for vertex in vertices:
+            self.vertex_faces[vertex].add(face)
+
+    def remove_face(self, face, vertices):
+        """
+        Removes a face from the index of each of its vertices.
+        """
+        for vertex in vertices:
+            self.vertex_faces[vertex].discard(face)
+
+class PatchedAdjacency:
+    """
+    The vertex to face adjacency of a mesh whose faces are edited, stored as
+    an Adjacency of the faces when it was built, and one set of face indices
+    per vertex edited since.
+
+    It is built as fast as an Adjacency, and updated face by face as a
+    DynamicAdjacency, with which it shares the faces, add_face and
+    remove_face methods.
+    """
+    def __init__(self, faces, nb_vertices, visible = None):
+        """
+        Builds the index from a (F, 3) array of vertex indices. Only the faces
+        set in the visible mask are indexed, if it is given.
+        """
+        self.base = Adjacency(faces, nb_vertices, visible)
+        self.vertex_faces = dict()
+
+    def faces(self, vertex):
+        """
+        Returns the indices of the faces around a vertex, in increasing order.
+        """
+        if vertex in self.vertex_faces:
+            return np.array(sorted(self.vertex_faces[vertex]), np.int64)
+        return self.base.faces(vertex)
+
+    def edited(self, vertex):
+        """
+        Returns the set of the faces around a vertex, to be edited.
+        """
+        if vertex not in self.vertex_faces:
+            self.vertex_faces[vertex] = set(self.base.faces(vertex).tolist())
+        return self.vertex_faces[vertex]
+
+    def add_face(self, face, vertices):
+        """
+        Indexes a face around each of its vertices.
+        """
+        for vertex in vertices:
+            self.edited(vertex).add(face)
+
+    def remove_face(self, face, vertices):
+        """
+        Removes a face from the index of each of its vertices.
+        """
+        for vertex in vertices:
+            self.edited(vertex).discard(face)
+
+def ring(adjacency, vertex, r):
+    """
+    Returns the list of the vertices at most r edges away from a vertex, the
+    vertex itself excluded, visiting only these vertices.
+    """
+    visited = {vertex}
+    frontier = [vertex]
+    for _ in range(r):
+        next_frontier = []
+        for elt in frontier:
+            for neighbour in adjacency.neighbours(elt).tolist():
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+    visited.remove(vertex)
+    return list(visited)
+
+def get_adjacency(model):
+    """
+    Returns the adjacency index attached to a model, building it on first use.
+
+    The index describes the model as it was when it was built: set
+    model.adjacency to None after editing the faces to have it rebuilt.
+    """
+    if getattr(model, 'adjacency', None) is None:
+        model.adjacency = Adjacency.from_model(model)
+    return model.adjacency
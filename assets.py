@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+Versions of the files served: strong ETags, conditional requests, and an
+in-memory cache of the files most recently served.
+
+The ETag of a file is made of its inode, size and modification time in
+nanoseconds, which change whenever its content does, and its compressed
+variants (see variants.py) get the same tag suffixed with their encoding.
+Repeated requests of an unchanged file are then answered with 304 Not
+Modified (If-None-Match), and a Range request made against an older version
+gets the whole file (If-Range).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+# Default number of bytes kept in memory by an AssetCache
+ASSET_CACHE_SIZE = 1 << 28
+
+# Files larger than this are not kept in memory: they are sent by the kernel
+# (os.sendfile) without being copied, and only small files, for which opening
+# them costs more than sending them, gain from being served from memory
+ASSET_MAX_FILE = 1 << 16
+
+def etag(stat):
+    """
+    Returns the strong ETag of a file given its os.stat.
+    """
+    return '"{:x}-{:x}-{:x}"'.format(stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def variant_etag(tag, coding):
+    """
+    Returns the ETag of the variant of a file encoded with coding.
+    """
+    return tag[:-1] + '-' + coding + '"'
+
+def parse_tags(header):
+    """
+    Returns the entity tags of an If-None-Match or If-Range header, as
+    (weak, tag) pairs, tag keeping its quotes.
+    """
+    tags = []
+    for item in header.split(','):
+        item = item.strip()
+        weak = item.startswith('W/')
+        if weak:
+            item = item[2:]
+        if item:
+            tags.append((weak, item))
+    return tags
+
+def none_match(header, tags):
+    """
+    Returns whether an If-None-Match header matches one of the current tags
+    of a file, in which case it is not modified for the client.
+    """
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag in tags for _, tag in parse_tags(header))
+
+def modified_since(header, mtime):
+    """
+    Returns whether a file modified at mtime (a timestamp) changed after the
+    date of an If-Modified-Since header, or if the header is missing,
+    invalid or later than the current time (RFC 9110, 13.1.3).
+    """
+    if header is None:
+        return True
+    try:
+        date = parsedate_to_datetime(header)
+    except (TypeError, ValueError, IndexError):
+        return True
+    if date is None or date.tzinfo is None or date.timestamp() > time.time():
+        return True
+    return int(mtime) > date.timestamp()
+
+def range_applies(header, tags, last_modified):
+    """
+    Returns whether the Range of a request applies given its If-Range
+    header: the header is missing, or is one of the current tags (strong
+    comparison), or the current Last-Modified date.
+    """
+    if header is None:
+        return True
+    header = header.strip()
+    if header.startswith('"') or header.startswith('W/'):
+        return any(not weak and tag in tags for weak, tag in parse_tags(header))
+    return header == last_modified
+
+class AssetCache:
+    """
+    The content of the files most recently served, up to max_size bytes,
+    the least recently used being dropped first, files larger than max_file
+    bytes being left on disk. A file that changed is read again. It can be
+    shared by threads.
+    """
+    def __init__(self, max_size = ASSET_CACHE_SIZE, max_file = ASSET_MAX_FILE):
+        """
+        Creates an empty cache.
+        """
+        self.max_size = max_size
+        self.max_file = max_file
+        self.size = 0
+        self.files = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Returns the os.stat of a file and its content, or None instead of its
+        content if it is too large to be kept in memory. Raises OSError if
+        the file cannot be read.
+        """
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is not None and entry[0] == key:
+                self.files.move_to_end(path)
+                return entry[1], entry[2]
+        if stat.st_size > self.max_file:
+            return stat, None
+
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            data = file.read()
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if len(data) != stat.st_size:
+            # Being written: served, but not kept
+            return os.stat(path), None
+        with self.lock:
+            previous = self.files.pop(path, None)
+            if previous is not None:
+                self.size -= len(previous[2])
+            self.files[path] = (key, stat, data)
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, (_, _, dropped) = self.files.popitem(last = False)
+                self.size -= len(dropped)
+        return stat, data
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+
+"""
+Progressive streaming server on asyncio.
+
+It serves the same files as server.py with the semantics the viewer relies on
+(js/obja.js): HEAD gives the size of a file, and GET with a Range header
+gives a part of it. Each connection is a coroutine instead of a thread, so
+that many clients downloading models progressively can stay connected:
+
+  - connections are kept alive between requests (HTTP/1.1), and closed after
+    KEEPALIVE_TIMEOUT seconds without a request,
+  - a request can ask for several ranges, sent as multipart/byteranges,
+  - at most max_connections connections are served at once, the next ones
+    waiting to be read, and each response is written at the pace of its
+    client, the file being sent with os.sendfile when possible,
+  - /lod/<model>?faces=N and /lod/<model>?bytes=B give the prefix of a model
+    at a level of detail in one response (see lod.PrefixCache),
+  - clients accepting gzip get whole files compressed, and the blocks of a
+    compressed file and their offsets are served as <file>.gz and
+    <file>.gz.json, whose ranges are ranges of compressed bytes (see
+    variants.py),
+  - files have strong ETags, unchanged ones are answered with 304 Not
+    Modified, and the small ones most used are served from memory (see
+    assets.py).
+
+For example
+
+    ./async_server.py . 8000
+
+serves the current directory on port 8000, like ./server.py . 8000 (or
+./server.py --async . 8000).
+"""
+
+import asyncio
+import email.utils
+import html
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+import uuid
+from urllib.parse import quote, unquote
+import assets
+import lod
+import variants
+
+# Number of connections served at once
+MAX_CONNECTIONS = 1024
+
+# Seconds a connection stays open without a request
+KEEPALIVE_TIMEOUT = 15
+
+# Maximum size of a line of a request
+MAX_LINE = 1 << 16
+
+# Maximum number of header lines of a request
+MAX_HEADERS = 100
+
+# Maximum number of ranges of a request, beyond which the whole file is sent
+MAX_RANGES = 16
+
+RANGE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+REASONS = {
+    200: 'OK', 206: 'Partial Content', 301: 'Moved Permanently', 304: 'Not Modified', 400: 'Bad Request',
+    404: 'Not Found', 416: 'Range Not Satisfiable', 422: 'Unprocessable Content',
+    501: 'Not Implemented',
+}
+
+class HTTPError(Exception):
+    """
+    An error answered to the client, with the connection closed afterwards if
+    the request could not be read entirely.
+    """
+    def __init__(self, status, close = False):
+        super().__init__(REASONS.get(status, ''))
+        self.status = status
+        self.close = close
+
+def translate_path(root, path):
+    """
+    Returns the file of root at the path of a request, without its query and
+    fragment, ignoring its '.' and '..' components (see server.py).
+    """
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    words = [word for word in posixpath.normpath(unquote(path)).split('/') if word]
+    for word in words:
+        word = os.path.split(os.path.splitdrive(word)[1])[1]
+        if word not in (os.curdir, os.pardir):
+            root = os.path.join(root, word)
+    return root
+
+def parse_ranges(header, size):
+    """
+    Returns the (first, last) inclusive byte ranges of a Range header for a
+    file of size bytes, None if the header is not a byte range or has more
+    than MAX_RANGES ranges, or an empty list if none of its ranges is
+    satisfiable. Overlapping and adjacent ranges are merged, in the order of
+    the file (RFC 9110, 14.2), so that no byte is sent twice.
+    """
+    if header is None or not header.startswith('bytes='):
+        return None
+    parts = header[6:].split(',')
+    if len(parts) > MAX_RANGES:
+        return None
+    ranges = []
+    for part in parts:
+        match = RANGE.match(part)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first == '' and last == '':
+            return None
+        if first == '':
+            # Suffix range: the last bytes of the file
+            first, last = max(size - int(last), 0), size - 1
+        else:
+            first, last = int(first), size - 1 if last == '' else min(int(last), size - 1)
+        if first <= last:
+            ranges.append((first, last))
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+async def read_request(reader):
+    """
+    Returns the method, path, version and headers (lowercase names) of the
+    next request of a connection, or None if the client closed it.
+    """
+    try:
+        line = await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, True)
+    words = line.decode('latin-1').split()
+    if len(words) != 3 or not words[2].startswith('HTTP/'):
+        raise HTTPError(400, True)
+
+    headers = dict()
+    for _ in range(MAX_HEADERS + 1):
+        try:
+            line = await reader.readuntil(b"\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise HTTPError(400, True)
+        line = line.decode('latin-1').strip()
+        if line == '':
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HTTPError(400, True)
+
+    # Bodies are not used, but must be skipped to read the next request
+    length = headers.get('content-length', '0')
+    if not length.isdigit() or 'transfer-encoding' in headers:
+        raise HTTPError(400, True)
+    if int(length) > 0:
+        await reader.readexactly(int(length))
+    return words[0], words[1], words[2], headers
+
+def keep_alive(version, headers):
+    """
+    Returns whether the connection of a request stays open after it.
+    """
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+class StreamingServer:
+    """
+    A server of the files of a directory, see the module documentation.
+    """
+    def __init__(self, root, max_connections = MAX_CONNECTIONS):
+        self.root = root
+        self.slots = asyncio.Semaphore(max_connections)
+        self.prefixes = lod.PrefixCache()
+        self.variants = variants.VariantCache()
+        self.assets = assets.AssetCache()
+
+    def headers(self, status, fields, alive):
+        """
+        Returns the status line and header block of a response.
+        """
+        lines = ['HTTP/1.1 {} {}'.format(status, REASONS[status]),
+                 'Server: obja',
+                 'Date: ' + email.utils.formatdate(usegmt = True),
+                 'Connection: ' + ('keep-alive' if alive else 'close')]
+        lines.extend('{}: {}'.format(name, value) for name, value in fields)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def send_error(self, writer, status, alive, fields = ()):
+        """
+        Sends an error response with a short HTML body.
+        """
+        body = '<html><body><h1>{} {}</h1></body></html>\n'.format(status, REASONS[status]).encode()
+        fields = [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', len(body))] + list(fields)
+        writer.write(self.headers(status, fields, alive) + body)
+        await writer.drain()
+
+    async def send_listing(self, writer, path, target, head, alive):
+        """
+        Sends the listing of a directory.
+        """
+        names = sorted(os.listdir(path), key = str.lower)
+        items = []
+        for name in names:
+            link = name + '/' if os.path.isdir(os.path.join(path, name)) else name
+            items.append('<li><a href="{}">{}</a></li>'.format(quote(link), html.escape(link)))
+        title = html.escape(unquote(target.split('?', 1)[0]))
+        body = ('<!DOCTYPE html>\n<html><head><title>Directory listing for {0}</title></head>\n'
+                '<body><h2>Directory listing for {0}</h2><hr><ul>\n{1}\n</ul><hr></body></html>\n')
+        body = body.format(title, '\n'.join(items)).encode()
+        fields = [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', len(body))]
+        writer.write(self.headers(200, fields, alive) + (b"" if head else body))
+        await writer.drain()
+
+    async def send_file(self, writer, path, headers, head, alive):
+        """
+        Sends a file, or the ranges of it given by the Range header, from
+        memory if it is small enough (see assets.AssetCache).
+        """
+        loop = asyncio.get_running_loop()
+        file = None
+        try:
+            if os.path.exists(path):
+                stat, data = await loop.run_in_executor(None, self.assets.get, path)
+                file = open(path, 'rb') if data is None else None
+                resource = None
+            else:
+                # The blocks of a compressed file or their offsets
+                resource = await loop.run_in_executor(None, self.variants.resource, path)
+                if resource is None:
+                    raise FileNotFoundError(path)
+                stat, data, tag, ctype = resource
+        except OSError:
+            await self.send_error(writer, 404, alive)
+            return
+        try:
+            last_modified = email.utils.formatdate(stat.st_mtime, usegmt = True)
+            fields = [('Accept-Ranges', 'bytes'), ('Last-Modified', last_modified)]
+            if resource is None:
+                size = stat.st_size
+                ctype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                tag = assets.etag(stat)
+                tags = (tag, assets.variant_etag(tag, 'gzip'))
+                fields += [('ETag', tag), ('Vary', 'Accept-Encoding')]
+            else:
+                size = len(data)
+                tags = (tag,)
+                fields += [('ETag', tag)]
+
+            if assets.none_match(headers.get('if-none-match'), tags) or (
+                    'if-none-match' not in headers and 'range' not in headers and
+                    not assets.modified_since(headers.get('if-modified-since'), stat.st_mtime)):
+                writer.write(self.headers(304, fields, alive))
+                await writer.drain()
+                return
+            # Ranges are of the file itself, never of its gzip variant
+            ranges = None
+            if assets.range_applies(headers.get('if-range'), (tag,), last_modified):
+                ranges = parse_ranges(headers.get('range'), size)
+            if ranges == []:
+                await self.send_error(writer, 416, alive, [('Content-Range', 'bytes */{}'.format(size))])
+                return
+            # A whole file is compressed, but HEAD gives the size of the file
+            # itself, used by the viewer
+            if resource is None and not head and ranges is None and \
+               variants.accepts_gzip(headers.get('accept-encoding')):
+                if await self.send_compressed(writer, path, ctype, fields, tag, alive):
+                    return
+            if ranges is None:
+                fields += [('Content-Type', ctype), ('Content-Length', size)]
+                writer.write(self.headers(200, fields, alive))
+                parts = [(b"", 0, size - 1)]
+            elif len(ranges) == 1:
+                first, last = ranges[0]
+                fields += [('Content-Type', ctype), ('Content-Length', last - first + 1),
+                           ('Content-Range', 'bytes {}-{}/{}'.format(first, last, size))]
+                writer.write(self.headers(206, fields, alive))
+                parts = [(b"", first, last)]
+            else:
+                boundary = uuid.uuid4().hex
+                parts = []
+                for first, last in ranges:
+                    part = '\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'
+                    parts.append((part.format(boundary, ctype, first, last, size).encode('latin-1'), first, last))
+                end = '\r\n--{}--\r\n'.format(boundary).encode('latin-1')
+                length = sum(len(part) + last - first + 1 for part, first, last in parts) + len(end)
+                fields += [('Content-Type', 'multipart/byteranges; boundary=' + boundary),
+                           ('Content-Length', length)]
+                writer.write(self.headers(206, fields, alive))
+                parts.append((end, 0, -1))
+
+            if head:
+                await writer.drain()
+                return
+            for part, first, last in parts:
+                writer.write(part)
+                if data is not None:
+                    writer.write(memoryview(data)[first:last + 1])
+                    await writer.drain()
+                    continue
+                await writer.drain()
+                if last >= first:
+                    await loop.sendfile(writer.transport, file, first, last - first + 1)
+        finally:
+            if file is not None:
+                file.close()
+
+    async def send_compressed(self, writer, path, ctype, fields, tag, alive):
+        """
+        Sends a whole file compressed with gzip (see variants.py), and
+        returns whether it did.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            variant = await loop.run_in_executor(None, self.variants.get, path)
+        except OSError:
+            return False
+        if variant is None:
+            return False
+        fields = [(name, value) for name, value in fields if name != 'ETag']
+        fields += [('ETag', assets.variant_etag(tag, 'gzip')), ('Content-Type', ctype),
+                   ('Content-Encoding', 'gzip'), ('Content-Length', len(variant.whole))]
+        writer.write(self.headers(200, fields, alive) + variant.whole)
+        await writer.drain()
+        return True
+
+    async def send_lod(self, writer, target, head, alive):
+        """
+        Sends the prefix of a model giving a level of detail, requested as
+        /lod/<model>?faces=N or /lod/<model>?bytes=B (see lod.py).
+        """
+        target, _, query = target[4:].partition('?')
+        path = translate_path(self.root, target)
+        try:
+            offset, faces = lod.prefix_target(query.split('#', 1)[0])
+        except ValueError:
+            await self.send_error(writer, 400, alive)
+            return
+        if not os.path.isfile(path):
+            await self.send_error(writer, 404, alive)
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            prefix = await loop.run_in_executor(None, self.prefixes.get, path, offset, faces)
+        except lod.LodError:
+            await self.send_error(writer, 422, alive)
+            return
+        except OSError:
+            await self.send_error(writer, 404, alive)
+            return
+        ctype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        fields = [('Content-Type', ctype), ('Content-Length', len(prefix))]
+        writer.write(self.headers(200, fields, alive) + (b"" if head else prefix))
+        await writer.drain()
+
+    async def respond(self, writer, request):
+        """
+        Answers a request, and returns whether the connection stays open.
+        """
+        method, target, version, headers = request
+        alive = keep_alive(version, headers)
+        if method not in ('GET', 'HEAD'):
+            await self.send_error(writer, 501, alive)
+            return alive
+        head = method == 'HEAD'
+        if target.startswith('/lod/'):
+            await self.send_lod(writer, target, head, alive)
+            return alive
+
+        path = translate_path(self.root, target)
+        if os.path.isdir(path):
+            location = target.split('?', 1)[0]
+            if not location.endswith('/'):
+                await self.send_error(writer, 301, alive, [('Location', location + '/')])
+                return alive
+            for index in ('index.html', 'index.htm'):
+                if os.path.exists(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                await self.send_listing(writer, path, target, head, alive)
+                return alive
+        await self.send_file(writer, path, headers, head, alive)
+        return alive
+
+    async def handle(self, reader, writer):
+        """
+        Serves the requests of a connection until it is closed.
+        """
+        async with self.slots:
+            try:
+                alive = True
+                while alive:
+                    try:
+                        request = await asyncio.wait_for(read_request(reader), KEEPALIVE_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        break
+                    except HTTPError as error:
+                        await self.send_error(writer, error.status, not error.close)
+                        alive = not error.close
+                        continue
+                    if request is None:
+                        break
+                    alive = await self.respond(writer, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except ConnectionError:
+                    pass
+
+    async def serve(self, port = 8000, host = '', ready = None):
+        """
+        Serves forever on a port, calling ready(port) once listening.
+        """
+        server = await asyncio.start_server(self.handle, host or None, port, limit = MAX_LINE,
+                                            backlog = 1024)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+def main(args = None):
+    """
+    Serves the directory given as first parameter (the current one by
+    default) on the port given as last parameter (8000 by default). The
+    --connections option sets the number of connections served at once.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    args = list(args)
+    max_connections = MAX_CONNECTIONS
+    if '--connections' in args:
+        position = args.index('--connections')
+        max_connections = int(args[position + 1])
+        del args[position:position + 2]
+    port = int(args[-1]) if len(args) > 0 else 8000
+    root = os.path.abspath(args[-2]) if len(args) > 1 else os.getcwd()
+
+    print("serving at port " + str(port))
+    try:
+        asyncio.run(StreamingServer(root, max_connections).serve(port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
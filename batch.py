@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+"""
+Simplification of whole directories of OBJ files into progressive OBJA files.
+
+Each file is simplified by qem.simplify_file in its own process, at most one
+per processor at once, the largest files first. A file taking longer than the
+timeout is stopped. The parameters of each output are written next to it
+(output.obja.params), and a file whose output was built with the same
+parameters after it was last modified is skipped, so that the same command
+run again only processes new or modified files. For example
+
+    ./batch.py --ratio 0.1 --timeout 600 --output results assets
+
+simplifies every .obj file under assets into the results directory.
+"""
+
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.connection import wait
+import lod
+import qem
+from cache import Cache
+
+def input_files(patterns):
+    """
+    Returns the sorted OBJ files given by directories (searched recursively)
+    or glob patterns.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(glob.escape(pattern), '**', '*.obj')
+        paths.update(path for path in glob.glob(pattern, recursive = True) if os.path.isfile(path))
+    return sorted(paths)
+
+def output_paths(paths, directory = None):
+    """
+    Returns the obja path of each input: next to it, or at the same place
+    relative to directory as the input relative to the deepest folder holding
+    all the inputs.
+    """
+    outputs = [os.path.splitext(path)[0] + '.obja' for path in paths]
+    if directory is None or not paths:
+        return outputs
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    return [os.path.join(directory, os.path.relpath(os.path.abspath(output), root)) for output in outputs]
+
+def parameters_path(output_path):
+    """
+    Returns the path of the file holding the parameters an output was built
+    with.
+    """
+    return output_path + '.params'
+
+def temporary_paths(output_path):
+    """
+    Returns the paths of the files written aside while building an output and
+    renamed once complete: the obja, its index (see lod.build_index) and its
+    parameters.
+    """
+    return [output_path + '.tmp', lod.index_path(output_path) + '.tmp', parameters_path(output_path) + '.tmp']
+
+def parameters(options):
+    """
+    Returns the parameters of the simplification given by options, as JSON.
+    """
+    return json.dumps({name: value for name, value in options.items() if name != 'cache'}, sort_keys = True)
+
+def up_to_date(input_path, output_path, options):
+    """
+    Returns whether an output exists, was built with the same parameters and
+    after its input was last modified.
+    """
+    path = parameters_path(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(path):
+        return False
+    with open(path) as file:
+        if file.read() != parameters(options):
+            return False
+    return os.path.getmtime(path) >= os.path.getmtime(input_path)
+
+def simplify(input_path, output_path, options):
+    """
+    Simplifies a file in a worker process, the saliency in this process only,
+    and writes the parameters next to the output. Exits with an error message
+    if it fails.
+    """
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    try:
+        qem.simplify_file(input_path, output_path, workers = 1, **options)
+        temporary = temporary_paths(output_path)[2]
+        with open(temporary, 'w') as output:
+            output.write(parameters(options))
+        os.replace(temporary, parameters_path(output_path))
+    except Exception as error:
+        print("{}: {}".format(input_path, error), file = sys.stderr)
+        sys.exit(1)
+
+def run_jobs(jobs, options, workers = None, timeout = None, report = None):
+    """
+    Simplifies the (input, output) jobs in at most workers processes at once
+    (one per processor by default), stopping the processes running for more
+    than timeout seconds. Returns the status of each job: 'done', 'failed' or
+    'timeout', and calls report(job, status, duration) as each one ends.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pending = list(jobs)
+    pending.reverse()
+    running = dict()
+    statuses = dict()
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop()
+            process = multiprocessing.Process(target = simplify, args = job + (options,))
+            process.start()
+            running[process.sentinel] = (process, job, time.monotonic())
+
+        delay = None
+        if timeout is not None:
+            first = min(start for _, _, start in running.values())
+            delay = max(first + timeout - time.monotonic(), 0)
+        ended = wait(list(running), delay)
+
+        now = time.monotonic()
+        for sentinel, (process, job, start) in list(running.items()):
+            if sentinel in ended:
+                process.join()
+                status = 'done' if process.exitcode == 0 else 'failed'
+            elif timeout is not None and now - start >= timeout:
+                process.terminate()
+                process.join()
+                status = 'timeout'
+            else:
+                continue
+            del running[sentinel]
+            if status != 'done':
+                for path in temporary_paths(job[1]):
+                    if os.path.exists(path):
+                        os.unlink(path)
+            statuses[job] = status
+            if report is not None:
+                report(job, status, now - start)
+    return statuses
+
+def option(args, name, kind, default = None):
+    """
+    Removes an option and its value from a list of parameters, and returns
+    the value converted by kind, or default if the option is missing.
+    """
+    if name not in args:
+        return default
+    position = args.index(name)
+    value = kind(args[position + 1])
+    del args[position:position + 2]
+    return value
+
+def main(args = None):
+    """
+    Simplifies the OBJ files of the directories or glob patterns given as
+    parameters. The options are:
+
+      --ratio r       ratio of faces to keep (0.1 by default)
+      --faces n       number of faces to keep, instead of a ratio
+      --saliency w    weight of the saliency in the cost of the collapses
+      --batched       collapses the edges in rounds (see qem.py)
+      --output dir    directory of the outputs (next to the inputs by default)
+      --workers n     number of files simplified at once (one per processor)
+      --timeout s     time after which the simplification of a file is stopped
+      --cache dir     reuses the results of the same simplifications (see cache.py)
+      --force         simplifies the files whose output is up to date too
+    """
+    if args is None:
+        args = sys.argv[1:]
+    args = list(args)
+    flags = {flag: flag in args for flag in ('--batched', '--force')}
+    args = [arg for arg in args if arg not in flags]
+    options = {
+        'ratio': option(args, '--ratio', float, 0.1),
+        'faces': option(args, '--faces', int),
+        'saliency_weight': option(args, '--saliency', float, 0.0),
+        'batched': flags['--batched'],
+    }
+    directory = option(args, '--output', str)
+    workers = option(args, '--workers', int)
+    timeout = option(args, '--timeout', float)
+    cache = option(args, '--cache', str)
+    if cache is not None:
+        options['cache'] = Cache(cache)
+    if len(args) < 1:
+        print("usage: batch.py [--ratio r | --faces n] [--saliency w] [--batched] [--output dir] "
+              "[--workers n] [--timeout s] [--cache dir] [--force] inputs...", file = sys.stderr)
+        sys.exit(1)
+
+    paths = input_files(args)
+    jobs = []
+    for job in zip(paths, output_paths(paths, directory)):
+        if not flags['--force'] and up_to_date(*job, options):
+            print("skipped {}".format(job[0]))
+        else:
+            jobs.append(job)
+    jobs.sort(key = lambda job: os.path.getsize(job[0]), reverse = True)
+
+    def report(job, status, duration):
+        print("{} {} -> {} ({:.1f} s)".format(status, job[0], job[1], duration), flush = True)
+
+    statuses = run_jobs(jobs, options, workers, timeout, report)
+    failed = sum(status != 'done' for status in statuses.values())
+    print("{} simplified, {} skipped, {} failed".format(
+        len(jobs) - failed, len(paths) - len(jobs), failed))
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
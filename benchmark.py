@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks of the obja tools.
+
+Runs the benchmarks given as parameters (all of them by default), for example
+./benchmark.py parser
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import obja
+import objb
+import qem
+import saliency
+from adjacency import Adjacency
+from mesh import Mesh
+
+def timed(function, *args):
+    """
+    Runs a function and returns its result and its duration in seconds.
+    """
+    t1 = time.time()
+    result = function(*args)
+    t2 = time.time()
+    return result, t2 - t1
+
+def random_mesh(nb_vertices, nb_faces, seed = 0):
+    """
+    Creates random vertices and faces.
+    """
+    generator = np.random.default_rng(seed)
+    vertices = generator.random((nb_vertices, 3))
+    faces = generator.integers(0, nb_vertices, (nb_faces, 3))
+    return vertices, faces
+
+def grid_mesh(n, seed = 0):
+    """
+    Creates a bumpy n x n grid of vertices split into triangles.
+    """
+    generator = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(0, 1, n), np.linspace(0, 1, n))
+    vertices = np.stack([x.ravel(), y.ravel(), 0.01 * generator.random(n * n)], axis = 1)
+    corners = (np.arange(n - 1)[:, None] * n + np.arange(n - 1)).ravel()
+    faces = np.concatenate([
+        np.stack([corners, corners + 1, corners + n], axis = 1),
+        np.stack([corners + 1, corners + n + 1, corners + n], axis = 1),
+    ])
+    return vertices, faces
+
+def write_obj(path, vertices, faces):
+    """
+    Writes vertices and faces in an OBJ file, with the 6 decimals most
+    exporters use.
+    """
+    with open(path, 'w') as f:
+        for vertex in vertices:
+            f.write('v {:.6f} {:.6f} {:.6f}\n'.format(vertex[0], vertex[1], vertex[2]))
+        for face in faces:
+            f.write('f {} {} {}\n'.format(face[0] + 1, face[1] + 1, face[2] + 1))
+
+def bench_parser(nb_vertices = 1000000, nb_faces = 2000000):
+    """
+    Compares the line by line parser of obja.Model with the bulk parser of
+    obja.ArrayModel.
+    """
+    vertices, faces = random_mesh(nb_vertices, nb_faces)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'mesh.obj')
+        write_obj(path, vertices, faces)
+
+        model, t_lines = timed(obja.parse_file, path)
+        array_model, t_bulk = timed(obja.parse_array_file, path)
+        binary_path = os.path.join(directory, 'mesh.objb')
+        objb.obja_to_objb(path, binary_path)
+        binary_model, t_binary = timed(objb.load, binary_path)
+
+    assert np.array_equal(np.array(model.vertices), array_model.vertices)
+    assert np.array_equal([[face.a, face.b, face.c] for face in model.faces], array_model.faces)
+    assert np.array_equal(array_model.faces, binary_model.faces)
+
+    print("parser : {} lines".format(nb_vertices + nb_faces))
+    print("  Model.parse_file      : {:.3f} s".format(t_lines))
+    print("  ArrayModel.parse_file : {:.3f} s (x{:.1f})".format(t_bulk, t_lines / t_bulk))
+    print("  objb.load             : {:.3f} s (x{:.1f})".format(t_binary, t_lines / t_binary))
+
+def bench_writer(nb_vertices = 1000000, nb_faces = 2000000):
+    """
+    Compares writing a model element by element with the bulk methods of
+    obja.Output, with exact and with 6 decimal coordinates.
+    """
+    vertices, faces = random_mesh(nb_vertices, nb_faces)
+
+    def write_elements(f):
+        output = obja.Output(f)
+        for index, vertex in enumerate(vertices):
+            output.add_vertex(index, vertex)
+        for index, face in enumerate(faces.tolist()):
+            output.add_face(index, obja.Face(*face))
+
+    def write_bulk(f, precision):
+        with obja.Output(f, buffer_size = 1 << 20, precision = precision) as output:
+            output.add_vertices(range(nb_vertices), vertices)
+            output.add_faces(range(nb_faces), faces)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ('elements.obj', 'bulk.obj', 'fixed.obj')]
+        with open(paths[0], 'w') as f:
+            _, t_elements = timed(write_elements, f)
+        with open(paths[1], 'w') as f:
+            _, t_bulk = timed(write_bulk, f, None)
+        with open(paths[2], 'w') as f:
+            _, t_fixed = timed(write_bulk, f, 6)
+        with open(paths[0]) as f, open(paths[1]) as g:
+            assert f.read() == g.read()
+
+    print("writer : {} lines".format(nb_vertices + nb_faces))
+    print("  add_vertex / add_face    : {:.3f} s".format(t_elements))
+    print("  add_vertices / add_faces : {:.3f} s (x{:.1f})".format(t_bulk, t_elements / t_bulk))
+    print("  same, with 6 decimals    : {:.3f} s (x{:.1f})".format(t_fixed, t_elements / t_fixed))
+
+def bench_insert(nb_faces = (200000, 2000000), count = 50000):
+    """
+    Times the replay of a stream inserting faces (af) at random indices, with
+    a face edit (efv) after each insertion, in obja.ArrayModel of growing
+    numbers of faces: the time of an insertion does not grow with them.
+    """
+    generator = np.random.default_rng(0)
+    print("insert : {} af + {} efv".format(count, count))
+    for faces in nb_faces:
+        nb_vertices = faces // 2
+        model = obja.ArrayModel()
+        model.add_vertices(generator.random((nb_vertices, 3)))
+        model.add_faces(generator.integers(0, nb_vertices, (faces, 3)))
+
+        positions = generator.integers(1, faces + 1, count)
+        edited = generator.integers(1, faces + 1, count) + np.arange(count)
+        indices = generator.integers(1, nb_vertices + 1, (count, 4))
+        lines = ''.join('af {} {} {} {}\nefv {} 2 {}\n'.format(position, a, b, c, face, d)
+                        for position, face, (a, b, c, d) in zip(positions.tolist(), edited.tolist(),
+                                                                 indices.tolist()))
+        _, t_parse = timed(model.parse_bytes, lines.encode())
+        _, t_sort = timed(lambda: model.faces)
+        print("  {} faces : {:.3f} s ({:.1f} us per line), faces sorted in {:.3f} s".format(
+            faces, t_parse, 1e6 * t_parse / (2 * count), t_sort))
+
+def bench_curvature(n = 708):
+    """
+    Times the whole mesh curvature kernel on a grid of about 500k vertices.
+    """
+    vertices, faces = grid_mesh(n)
+    adjacency, t_index = timed(Adjacency, faces, len(vertices))
+    curvatures, t_curvature = timed(saliency.compute_curvatures, vertices, adjacency)
+    touched = adjacency.ring(n * (n // 2) + n // 2, 1)
+    _, t_update = timed(saliency.update_curvatures, curvatures, vertices, adjacency, touched)
+
+    print("curvature : {} vertices".format(len(vertices)))
+    print("  Adjacency          : {:.3f} s".format(t_index))
+    print("  compute_curvatures : {:.3f} s".format(t_curvature))
+    print("  update_curvatures  : {:.6f} s ({} vertices)".format(t_update, len(touched)))
+
+def bench_saliency(n = 317, r = 2, bins = 25):
+    """
+    Times the whole mesh saliency on a grid of about 100k vertices.
+    """
+    vertices, faces = grid_mesh(n)
+    adjacency = Adjacency(faces, len(vertices))
+    curvatures = saliency.compute_curvatures(vertices, adjacency)
+    areas, t_areas = timed(saliency.vertex_areas, vertices, adjacency)
+    _, t_saliency = timed(saliency.compute_saliency, vertices, adjacency, curvatures, r, bins,
+                          None, areas)
+    local = adjacency.ring(n * (n // 2) + n // 2, r)
+    _, t_local = timed(saliency.compute_saliency, vertices, adjacency, curvatures, r, bins, local)
+    workers = os.cpu_count() or 1
+    _, t_parallel = timed(saliency.parallel_saliency, vertices, adjacency, curvatures, r, bins,
+                          None, areas, workers)
+
+    print("saliency : {} vertices, r = {}, {} bins".format(len(vertices), r, bins))
+    print("  vertex_areas      : {:.3f} s".format(t_areas))
+    print("  compute_saliency  : {:.3f} s".format(t_saliency))
+    print("  parallel_saliency : {:.3f} s ({} workers, x{:.1f})".format(
+        t_parallel, workers, t_saliency / t_parallel))
+    print("  local update      : {:.6f} s ({} vertices)".format(t_local, len(local)))
+
+def bench_qem(n = 708, ratio = 0.1):
+    """
+    Times the quadric simplification of a grid of about 1M faces to ratio
+    times its faces, in rounds.
+    """
+    vertices, faces = grid_mesh(n)
+    mesh, t_mesh = timed(Mesh, vertices, faces)
+    decimater, t_quadrics = timed(qem.BatchQuadricDecimater, mesh)
+    records, t_decimate = timed(decimater.decimate, int(ratio * len(faces)))
+
+    print("qem : {} faces -> {} faces, {} collapses".format(
+        len(faces), np.count_nonzero(mesh.visible), len(records)))
+    print("  Mesh                  : {:.3f} s".format(t_mesh))
+    print("  BatchQuadricDecimater : {:.3f} s".format(t_quadrics))
+    print("  decimate              : {:.3f} s".format(t_decimate))
+
+async def fetch_ranges(port, path, size, count, chunk):
+    """
+    Fetches count consecutive ranges of chunk bytes of a file like the viewer
+    does, on a kept alive connection when the server allows it, and returns
+    the number of bytes received.
+    """
+    received = 0
+    reader = writer = None
+    for k in range(count):
+        start = (k * chunk) % size
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\nRange: bytes={}-{}\r\n\r\n'.format(
+            path, start, start + chunk - 1).encode())
+        head = (await reader.readuntil(b"\r\n\r\n")).decode('latin-1').lower()
+        length = int(head.split('content-length:')[1].split()[0])
+        received += len(await reader.readexactly(length))
+        if head.startswith('http/1.0') or 'connection: close' in head:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+    return received
+
+async def load_test(port, path, size, clients, count, chunk):
+    """
+    Runs clients concurrent fetch_ranges and returns the bytes received and
+    the number of clients whose connection failed.
+    """
+    tasks = [fetch_ranges(port, path, size, count, chunk) for _ in range(clients)]
+    results = await asyncio.gather(*tasks, return_exceptions = True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    return sum(result for result in results if not isinstance(result, Exception)), len(failed)
+
+def bench_server(clients = 500, count = 20, chunk = 65536, size = 1 << 24):
+    """
+    Times clients concurrent clients fetching count ranges of chunk bytes of
+    a file, served by the threaded server.py and by async_server.py.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    print("server : {} clients x {} ranges of {} bytes".format(clients, count, chunk))
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'model.obja'), 'wb') as output:
+            output.write(os.urandom(size))
+        for script in ('server.py', 'async_server.py'):
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            process = subprocess.Popen([sys.executable, os.path.join(root, script), directory, str(port)],
+                                       stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            try:
+                while True:
+                    try:
+                        socket.create_connection(('127.0.0.1', port)).close()
+                        break
+                    except ConnectionRefusedError:
+                        time.sleep(0.05)
+                (received, failed), t_load = timed(asyncio.run, load_test(port, '/model.obja', size, clients, count, chunk))
+            finally:
+                process.terminate()
+                process.wait()
+            print("  {:15} : {:.3f} s, {:.0f} MB/s, {} clients failed".format(
+                script, t_load, received / t_load / 1e6, failed))
+
+BENCHMARKS = {
+    'parser': bench_parser,
+    'writer': bench_writer,
+    'insert': bench_insert,
+    'curvature': bench_curvature,
+    'saliency': bench_saliency,
+    'qem': bench_qem,
+    'server': bench_server,
+}
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+On disk cache of simplification results, addressed by content.
+
+An entry is a directory named after the key of its content, the hash of the
+arrays of the input mesh and of the parameters of the algorithm, holding
+files (an obja, its index, a saliency array...). Reading an entry marks it as
+used, and the least recently used entries are removed once the cache holds
+more than its maximum size.
+
+The cache can be shared by processes. An entry is written in a temporary
+directory and renamed into place, then never modified, and the eviction and
+the renames are done under a lock file: a process never sees a partial entry,
+and an entry removed while it is read is a miss.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Version of the results, part of every key: changing it invalidates the cache
+CACHE_VERSION = 3
+
+# Default directory and maximum size in bytes of the cache
+CACHE_DIRECTORY = os.environ.get('OBJA_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'obja'))
+CACHE_SIZE = 1 << 30
+
+def mesh_key(model):
+    """
+    Returns the hash of the vertices, faces and visibility of an
+    obja.ArrayModel.
+    """
+    digest = hashlib.sha256()
+    for array in (model.vertices, model.faces, model.visible):
+        array = np.ascontiguousarray(array)
+        digest.update('{} {}\n'.format(array.dtype.str, array.shape).encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+def cache_key(mesh, **parameters):
+    """
+    Returns the key of the results of an algorithm on a mesh, given by its
+    mesh_key, for the given parameters.
+    """
+    parameters = dict(parameters, version = CACHE_VERSION, mesh = mesh)
+    return hashlib.sha256(json.dumps(parameters, sort_keys = True).encode()).hexdigest()
+
+class Cache:
+    """
+    A directory of cache entries, holding at most max_size bytes.
+    """
+    def __init__(self, directory = CACHE_DIRECTORY, max_size = CACHE_SIZE):
+        """
+        Opens a cache, created when first written.
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry(self, key):
+        """
+        Returns the directory of an entry.
+        """
+        return os.path.join(self.directory, key[:2], key)
+
+    @contextmanager
+    def lock(self):
+        """
+        Holds the lock of the cache, shared by processes, for a with block.
+        Nothing is locked where fcntl is missing.
+        """
+        os.makedirs(self.directory, exist_ok = True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def store(self, key, write):
+        """
+        Creates an entry, unless it already exists, by calling write with a
+        temporary directory to fill, and evicts the least recently used
+        entries if the cache is too large.
+        """
+        entry = self.entry(key)
+        if os.path.isdir(entry):
+            return
+        temporary = os.path.join(self.directory, '.tmp')
+        os.makedirs(temporary, exist_ok = True)
+        temporary = tempfile.mkdtemp(dir = temporary)
+        try:
+            write(temporary)
+            os.makedirs(os.path.dirname(entry), exist_ok = True)
+            with self.lock():
+                if not os.path.isdir(entry):
+                    os.replace(temporary, entry)
+        finally:
+            shutil.rmtree(temporary, ignore_errors = True)
+        self.evict()
+
+    def get(self, key, name):
+        """
+        Returns the path of a file of an entry and marks the entry as used, or
+        None if it is not cached.
+        """
+        path = os.path.join(self.entry(key), name)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(self.entry(key))
+        except OSError:
+            pass
+        return path
+
+    def fetch(self, key, files):
+        """
+        Copies the files of an entry, given as name: destination, with their
+        modification times (which the index of an obja checks, see lod.py),
+        and returns True if they were all cached.
+        """
+        paths = {name: self.get(key, name) for name in files}
+        if any(path is None for path in paths.values()):
+            return False
+        for name, destination in files.items():
+            temporary = destination + '.tmp'
+            try:
+                shutil.copy2(paths[name], temporary)
+            except OSError:
+                # Evicted in the meantime
+                return False
+            os.replace(temporary, destination)
+        return True
+
+    def put(self, key, files):
+        """
+        Copies files in a new entry, given as name: source (see store).
+        """
+        def write(directory):
+            for name, source in files.items():
+                shutil.copy2(source, os.path.join(directory, name))
+        self.store(key, write)
+
+    def get_array(self, key, name):
+        """
+        Returns an array of an entry, or None if it is not cached.
+        """
+        path = self.get(key, name + '.npy')
+        if path is None:
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def put_array(self, key, name, array):
+        """
+        Stores an array in a new entry (see store).
+        """
+        def write(directory):
+            np.save(os.path.join(directory, name + '.npy'), array)
+        self.store(key, write)
+
+    def entries(self):
+        """
+        Returns the (last use, size, directory) of every entry.
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for prefix in os.scandir(self.directory):
+            # Temporary directories and the lock file start with a dot
+            if prefix.name.startswith('.') or not prefix.is_dir():
+                continue
+            try:
+                for entry in os.scandir(prefix.path):
+                    try:
+                        size = sum(element.stat().st_size for element in os.scandir(entry.path))
+                        entries.append((entry.stat().st_mtime, size, entry.path))
+                    except OSError:
+                        continue
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache holds at most
+        max_size bytes.
+        """
+        with self.lock():
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                shutil.rmtree(path, ignore_errors = True)
+                total -= size
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        shutil.rmtree(self.directory, ignore_errors = True)
+
+def main(args = None):
+    """
+    Prints the number of entries and the size of the cache whose directory is
+    given as parameter (CACHE_DIRECTORY by default), or empties it with
+    --clear.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    clear = '--clear' in args
+    args = [arg for arg in args if arg != '--clear']
+    cache = Cache(args[0] if args else CACHE_DIRECTORY)
+    if clear:
+        cache.clear()
+        return
+    entries = cache.entries()
+    print("{} : {} entries, {:.1f} MB".format(
+        cache.directory, len(entries), sum(size for _, size, _ in entries) / 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""
+Compaction of progressive obja streams.
+
+A stream is cut into refinement steps by its s instructions. Only the state of
+the model at the end of each step matters, so the instructions of a step are
+applied to an obja.ArrayModel and replaced by the changes they make, in this
+order:
+
+  - a v line for each vertex added, at its final position,
+  - an ev line for each vertex already there that moved,
+  - an af line for each face inserted before the last face, then an f line
+    for each face added at the end, with their final vertices,
+  - an efv line for each face already there that changed one vertex, an ef
+    line if it changed more,
+  - a df line for each face deleted, and the last fc line of each face.
+
+Edits cancelling each other disappear, inserted faces are inserted once at
+their final position, and comments are dropped. A stream without s
+instructions would be a single step, compacted to its final model, and is
+refused; mesh.write_progressive writes them.
+"""
+
+import sys
+from itertools import chain, zip_longest
+import numpy as np
+import obja
+import objb
+from instructions import apply_instructions, read_instructions
+
+def steps(batches):
+    """
+    Yields the (blocks, sizes) refinement steps of a stream of batches:
+    blocks is the list of the (instruction, records) batches of the step and
+    sizes the records of the s instructions ending it, or None for the last
+    step.
+    """
+    blocks = []
+    for instruction, records in batches:
+        if instruction == 's':
+            yield blocks, records
+            blocks = []
+        else:
+            blocks.append((instruction, records))
+    yield blocks, None
+
+def added_faces(blocks, nb_faces):
+    """
+    Returns the final positions of the faces added by blocks applied to a
+    model of nb_faces faces, and the final positions of the faces of their fc
+    records.
+    """
+    added = []
+    colored = []
+    count = nb_faces
+    for instruction, records in blocks:
+        if instruction == 'f':
+            added.append(np.arange(count, count + len(records)))
+            count += len(records)
+        elif instruction == 'fc':
+            colored.append(records['face'].astype(np.int64))
+        elif instruction == 'af':
+            added = [np.concatenate([np.empty(0, np.int64)] + added)]
+            colored = [np.concatenate([np.empty(0, np.int64)] + colored)]
+            for face in records['face'].tolist():
+                # The faces from this one are shifted by the insertion
+                added[0][added[0] >= face] += 1
+                colored[0][colored[0] >= face] += 1
+                added[0] = np.append(added[0], face)
+                count += 1
+    added = np.concatenate([np.empty(0, np.int64)] + added)
+    colored = np.concatenate([np.empty(0, np.int64)] + colored)
+    return np.sort(added), colored
+
+def compact_step(model, blocks):
+    """
+    Applies the blocks of a refinement step to an obja.ArrayModel and returns
+    the (instruction, records) blocks making the same changes.
+    """
+    stream = objb.BlockList(blocks)
+    nb_vertices, nb_faces = model.nb_vertices, model.nb_faces
+
+    edited = np.concatenate([stream.gather('ev')[0]['vertex'], stream.gather('tv')[0]['vertex']])
+    edited = np.unique(edited.astype(np.int64))
+    edited = edited[edited < nb_vertices]
+    positions = model.vertices[edited].copy()
+
+    if 'af' in (instruction for instruction, _ in blocks):
+        old_faces = np.arange(nb_faces)
+    else:
+        old_faces = np.concatenate([stream.gather(instruction)[0]['face'] for instruction in ('ef', 'efv', 'df')])
+        old_faces = np.unique(old_faces.astype(np.int64))
+        old_faces = old_faces[old_faces < nb_faces]
+    faces = model.faces[old_faces].copy()
+    visible = model.visible[old_faces].copy()
+
+    apply_instructions(model, blocks)
+
+    added, colored = added_faces(blocks, nb_faces)
+    # Final position of each face that was already there
+    moved = np.ones(model.nb_faces, bool)
+    moved[added] = False
+    moved = np.flatnonzero(moved)[old_faces]
+
+    result = []
+    def append(instruction, *columns):
+        values = np.column_stack(columns) if len(columns) > 1 else np.asarray(columns[0])
+        if len(values) > 0:
+            result.append((instruction, objb.make_records(instruction, values, True)))
+
+    append('v', model.vertices[nb_vertices:])
+    changed = np.any(model.vertices[edited] != positions, axis = 1)
+    append('ev', edited[changed], model.vertices[edited[changed]])
+
+    # Faces inserted in ascending order, then the faces appended at the end
+    tail = len(added)
+    while tail > 0 and added[tail - 1] == model.nb_faces - len(added) + tail - 1:
+        tail -= 1
+    append('af', added[:tail], model.faces[added[:tail]])
+    append('f', model.faces[added[tail:]])
+
+    differences = faces != model.faces[moved]
+    corners = np.count_nonzero(differences, axis = 1)
+    single = np.flatnonzero(corners == 1)
+    corner = np.argmax(differences[single], axis = 1)
+    append('efv', moved[single], corner, model.faces[moved[single], corner])
+    several = moved[corners > 1]
+    append('ef', several, model.faces[several])
+
+    deleted = np.concatenate([added[~model.visible[added]], moved[visible & ~model.visible[moved]]])
+    append('df', np.sort(deleted))
+
+    if len(colored) > 0:
+        colors = stream.gather('fc')[0]['color']
+        last = objb.last_occurrences(colored)
+        append('fc', colored[last], colors[last])
+    return result
+
+def compact(input_path, output_path):
+    """
+    Writes the compacted stream of an obja or objb file as an obja file.
+    Raises ValueError if the file has no s instructions.
+    """
+    stream = steps(read_instructions(input_path))
+    first = next(stream)
+    if first[1] is None:
+        raise ValueError("{} has no s instructions to cut it into steps".format(input_path))
+    model = obja.ArrayModel()
+    with open(output_path, 'w') as output:
+        for blocks, sizes in chain([first], stream):
+            result = compact_step(model, blocks)
+            if sizes is not None:
+                result.append(('s', sizes))
+            objb.write_text(output, objb.BlockList(result))
+
+def checkpoints(path):
+    """
+    Yields the declared size and the obja.ArrayModel at each s instruction of
+    a file, and (None, model) at its end. The same model is updated and
+    yielded each time.
+    """
+    model = obja.ArrayModel()
+    for blocks, sizes in steps(read_instructions(path)):
+        apply_instructions(model, blocks)
+        for size in [None] if sizes is None else sizes['size'].tolist():
+            yield size, model
+
+def verify(input_path, output_path):
+    """
+    Checks that two files give the same models at each of their s
+    instructions and at their end, and returns the number of checkpoints.
+    Raises ValueError otherwise.
+    """
+    count = 0
+    pairs = zip_longest(checkpoints(input_path), checkpoints(output_path))
+    for first, second in pairs:
+        if first is None or second is None:
+            raise ValueError("different number of checkpoints")
+        (size, model), (other_size, other) = first, second
+        if size != other_size:
+            raise ValueError("checkpoint {}: size {} instead of {}".format(count, other_size, size))
+        for name in ('vertices', 'faces', 'visible'):
+            if not np.array_equal(getattr(model, name), getattr(other, name)):
+                raise ValueError("checkpoint {} (size {}): different {}".format(count, size, name))
+        count += 1
+    return count
+
+def main(args = None):
+    """
+    Compacts the obja file given as first parameter into the file given as
+    second parameter, and checks that both give the same models at each
+    checkpoint.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    if len(args) < 2:
+        print("usage: compact.py input.obja output.obja", file = sys.stderr)
+        sys.exit(1)
+
+    try:
+        compact(args[0], args[1])
+        count = verify(args[0], args[1])
+    except ValueError as error:
+        print("compact.py: {}".format(error), file = sys.stderr)
+        sys.exit(1)
+    print("{} checkpoints verified".format(count))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+Configuration of pytest, run from this directory: the tests are in tests/,
+and decimate_test.py is a script, not a test module.
+"""
+
+collect_ignore = ['decimate_test.py']
@@ -21,18 +21,23 @@ class Decimater(obja.Model):
         for (vertex_index, vertex) in enumerate(self.vertices):
             operations.append(('ev', vertex_index, vertex + 0.25))
 
+        # A face is deleted along with its first vertex, so index the faces
+        # by their smallest vertex index instead of sweeping all of them for
+        # every vertex
+        vertex_faces = [[] for _ in self.vertices]
+        for (face_index, face) in enumerate(self.faces):
+            first = min(face.a, face.b, face.c)
+            if face_index not in self.deleted_faces and first < len(vertex_faces):
+                vertex_faces[first].append(face_index)
+
         # Iterate through the vertex
         for (vertex_index, vertex) in enumerate(self.vertices):
 
-            # Iterate through the faces
-            for (face_index, face) in enumerate(self.faces):
-
-                # Delete any face related to this vertex
-                if face_index not in self.deleted_faces:
-                    if vertex_index in [face.a,face.b,face.c]:
-                        self.deleted_faces.add(face_index)
-                        # Add the instruction to operations stack
-                        operations.append(('face', face_index, face))
+            # Delete any face related to this vertex
+            for face_index in vertex_faces[vertex_index]:
+                self.deleted_faces.add(face_index)
+                # Add the instruction to operations stack
+                operations.append(('face', face_index, self.faces[face_index]))
 
             # Delete the vertex
             operations.append(('vertex', vertex_index, vertex))
@@ -41,15 +46,15 @@ class Decimater(obja.Model):
         operations.reverse()
 
         # Write the result in output file
-        output_model = obja.Output(output, random_color=True)
+        with obja.Output(output, random_color=True, buffer_size=1 << 20) as output_model:
 
-        for (ty, index, value) in operations:
-            if ty == "vertex":
-                output_model.add_vertex(index, value)
-            elif ty == "face":
-                output_model.add_face(index, value)   
-            else:
-                output_model.edit_vertex(index, value)
+            for (ty, index, value) in operations:
+                if ty == "vertex":
+                    output_model.add_vertex(index, value)
+                elif ty == "face":
+                    output_model.add_face(index, value)   
+                else:
+                    output_model.edit_vertex(index, value)
 
 def main():
     """
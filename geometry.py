@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Face normals, face areas and vertex areas of a mesh, cached as arrays.
+"""
+
+import numpy as np
+from adjacency import DynamicAdjacency, PatchedAdjacency, face_array
+
+def face_normals(vertices, faces):
+    """
+    Returns the (unnormalized) normal of each face, as obja.Face.normal.
+    """
+    faces = np.asarray(faces, np.int64).reshape(-1, 3)
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    return np.cross(b - a, c - a).reshape(-1, 3)
+
+def face_areas(vertices, faces):
+    """
+    Returns the area of each face, computed term for term as obja.Face.area.
+    """
+    faces = np.asarray(faces, np.int64).reshape(-1, 3)
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    AB = b - a
+    AC = c - a
+    return 0.5*np.sqrt((AB[:, 1]*AC[:, 2] - AB[:, 2]*AC[:, 1])**2
+                       + (AB[:, 2]*AC[:, 0] - AB[:, 0]*AC[:, 2])**2
+                       + (AB[:, 0]*AC[:, 1] - AB[:, 1]*AC[:, 0])**2)
+
+class GeometryCache:
+    """
+    The face normals, face areas and vertex areas of a model, stored as arrays.
+
+    Edits mark the faces and vertices they touch as dirty, and only the dirty
+    faces and the vertices around them are recomputed the next time an array
+    is read. The area of a vertex is a third of the area of the visible faces
+    around it. The faces around a vertex are found with the DynamicAdjacency
+    of the model, or with a PatchedAdjacency kept by the cache and updated
+    along with the dirty faces, so that an update costs time proportional to
+    the number of faces it touches.
+
+    The edits of obja.ArrayModel and mesh.Mesh are tracked once a cache is
+    attached to them (see get_geometry). A list based obja.Model is not
+    tracked: call refresh after editing it.
+    """
+    def __init__(self, model):
+        """
+        Computes the geometry of a model.
+        """
+        self.model = model
+        self.dirty_faces = set()
+        self.dirty_vertices = set()
+        self.refresh()
+
+    def _arrays(self):
+        """
+        Returns the vertex, face and visibility arrays of the model.
+        """
+        faces, visible = face_array(self.model)
+        return np.asarray(self.model.vertices, np.float64).reshape(-1, 3), faces, visible
+
+    def _faces(self, indices):
+        """
+        Returns the (n, 3) vertex indices and the visibility of the faces of
+        the model at an array of indices.
+        """
+        faces = self.model.faces
+        if isinstance(faces, np.ndarray):
+            return np.asarray(faces[indices], np.int64).reshape(-1, 3), self.model.visible[indices]
+        faces = [faces[index] for index in indices.tolist()]
+        return (np.array([[face.a, face.b, face.c] for face in faces], np.int64).reshape(-1, 3),
+                np.array([face.visible for face in faces], bool))
+
+    def _vertices(self, indices):
+        """
+        Returns the positions of the vertices of the model at an array of
+        indices.
+        """
+        vertices = self.model.vertices
+        if isinstance(vertices, np.ndarray):
+            return np.asarray(vertices[indices], np.float64).reshape(-1, 3)
+        return np.array([vertices[index] for index in indices.tolist()], np.float64).reshape(-1, 3)
+
+    def refresh(self):
+        """
+        Recomputes all the arrays from scratch.
+        """
+        vertices, faces, visible = self._arrays()
+        self._corners = np.array(faces, np.int64).reshape(-1, 3)
+        self._visible = np.array(visible, bool)
+        self._normals = face_normals(vertices, faces)
+        self._areas = face_areas(vertices, faces)
+        self._vertex_areas = np.bincount(self._corners[visible].ravel(),
+                                         np.repeat(self._areas[visible], 3), len(vertices)) / 3
+        # Built on first use, if the model has no DynamicAdjacency
+        self._adjacency = None
+        self.dirty_faces.clear()
+        self.dirty_vertices.clear()
+
+    @property
+    def normals(self):
+        """
+        The (F, 3) array of the face normals.
+        """
+        self.update()
+        return self._normals
+
+    @property
+    def areas(self):
+        """
+        The (F,) array of the face areas.
+        """
+        self.update()
+        return self._areas
+
+    @property
+    def vertex_areas(self):
+        """
+        The (N,) array of the vertex areas.
+        """
+        self.update()
+        return self._vertex_areas
+
+    def invalidate_vertices(self, indices):
+        """
+        Marks the faces around vertices that moved as dirty.
+        """
+        self.dirty_vertices.update(int(index) for index in indices)
+
+    def invalidate_faces(self, indices):
+        """
+        Marks faces whose vertices or visibility changed as dirty.
+        """
+        self.dirty_faces.update(int(index) for index in indices)
+
+    def insert_face(self, index):
+        """
+        Shifts the cached faces from index on, for a face inserted before them.
+        """
+        self._corners = np.insert(self._corners, index, 0, axis = 0)
+        self._visible = np.insert(self._visible, index, False)
+        self._normals = np.insert(self._normals, index, 0, axis = 0)
+        self._areas = np.insert(self._areas, index, 0)
+        self._adjacency = None
+        self.dirty_faces = {face + 1 if face >= index else face for face in self.dirty_faces}
+        self.dirty_faces.add(index)
+
+    def _index(self):
+        """
+        Returns the adjacency of the visible faces of the model, as cached in
+        _corners and _visible.
+        """
+        adjacency = getattr(self.model, 'adjacency', None)
+        if isinstance(adjacency, DynamicAdjacency):
+            return adjacency
+        if self._adjacency is None:
+            self._adjacency = PatchedAdjacency(self._corners, len(self._vertex_areas), self._visible)
+        return self._adjacency
+
+    def _incident(self, vertices):
+        """
+        Returns the (vertices, faces) pairs of the visible faces around the
+        given vertices, ordered by face index for each vertex, a pair being
+        repeated for each corner of the face at the vertex.
+        """
+        adjacency = self._index()
+        around = [adjacency.faces(vertex) for vertex in vertices.tolist()]
+        rows = np.repeat(vertices, [len(elt) for elt in around])
+        faces = np.concatenate(around + [np.empty(0, np.int64)]).astype(np.int64)
+        corners = np.count_nonzero(self._corners[faces] == rows[:, None], axis = 1)
+        return np.repeat(rows, corners), np.repeat(faces, corners)
+
+    def update(self):
+        """
+        Recomputes the dirty faces and the area of the vertices around them.
+        """
+        nb_faces, nb_vertices = len(self.model.faces), len(self.model.vertices)
+        if len(self._areas) < nb_faces:
+            added = nb_faces - len(self._areas)
+            self.dirty_faces.update(range(len(self._areas), nb_faces))
+            self._corners = np.concatenate((self._corners, np.zeros((added, 3), np.int64)))
+            self._visible = np.concatenate((self._visible, np.zeros(added, bool)))
+            self._normals = np.concatenate((self._normals, np.zeros((added, 3))))
+            self._areas = np.concatenate((self._areas, np.zeros(added)))
+        if len(self._vertex_areas) < nb_vertices:
+            added = nb_vertices - len(self._vertex_areas)
+            self._vertex_areas = np.concatenate((self._vertex_areas, np.zeros(added)))
+
+        if self.dirty_vertices:
+            moved = np.array(sorted(self.dirty_vertices), np.int64)
+            self.dirty_faces.update(self._incident(moved)[1].tolist())
+            self.dirty_vertices.clear()
+        if not self.dirty_faces:
+            return
+
+        dirty = np.array(sorted(self.dirty_faces), np.int64)
+        self.dirty_faces.clear()
+        faces, visible = self._faces(dirty)
+        affected = np.unique(np.concatenate((self._corners[dirty].ravel(), faces.ravel())))
+        if self._adjacency is not None:
+            shown = self._visible[dirty]
+            for face, before in zip(dirty[shown].tolist(), self._corners[dirty[shown]].tolist()):
+                self._adjacency.remove_face(face, before)
+        self._corners[dirty] = faces
+        self._visible[dirty] = visible
+        if self._adjacency is not None:
+            for face, after in zip(dirty[visible].tolist(), faces[visible].tolist()):
+                self._adjacency.add_face(face, after)
+        positions = self._vertices(faces.ravel())
+        local = np.arange(len(positions)).reshape(-1, 3)
+        self._normals[dirty] = face_normals(positions, local)
+        self._areas[dirty] = face_areas(positions, local)
+
+        # Sums in the order of refresh, so that both give the same areas
+        rows, around = self._incident(affected)
+        ranks = np.searchsorted(affected, rows)
+        self._vertex_areas[affected] = np.bincount(ranks, self._areas[around], len(affected)) / 3
+
+def get_geometry(model):
+    """
+    Returns the geometry cache attached to a model, building it on first use.
+    """
+    if getattr(model, 'geometry', None) is None:
+        model.geometry = GeometryCache(model)
+    return model.geometry
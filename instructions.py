@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Streaming of the instructions of obja and objb files.
+
+The instructions are read as batches of typed records, the (instruction,
+records) blocks of objb.py: records is a numpy record array whose fields are
+given by objb.FIELDS (position for v, vertices for f, vertex and position for
+ev, face, corner and vertex for efv, face for df, face and color for fc, size
+for s...), all the indices starting at 0. The file is read only as far as the
+batches are consumed, so applying the beginning of a progressive stream does
+not parse the rest of it.
+
+The offset of an instruction is the number of records before it: it is its
+line number (starting at 0) in a file holding one instruction per line and no
+comments, strips and polygons giving one record per triangle.
+"""
+
+import mmap
+import sys
+import obja
+import objb
+
+# Maximum number of records of a batch
+INSTRUCTION_BATCH = 65536
+
+def read_instructions(path, batch_size = INSTRUCTION_BATCH):
+    """
+    Yields the (instruction, records) batches of an obja or objb file, in the
+    order of the file. Consecutive records of the same instruction are
+    batched together, batch_size records at most.
+
+    The records of an objb file point into the memory mapped file. Those of
+    an obja file are parsed obja.PARSE_CHUNK bytes at a time, with float64
+    coordinates.
+    """
+    if obja.is_binary_file(path):
+        stream = objb.Stream(objb.map_file(path))
+        for i in range(len(stream)):
+            instruction, records = stream.block(i)
+            for start in range(0, len(records), batch_size):
+                yield instruction, records[start:start + batch_size]
+        return
+
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            for start, end in obja.line_chunks(data, obja.PARSE_CHUNK):
+                blocks = objb.make_blocks(objb.parse_blocks(data[start:end]), True)
+                obja.release_pages(data, start, end)
+                for instruction, records in blocks:
+                    for first in range(0, len(records), batch_size):
+                        yield instruction, records[first:first + batch_size]
+
+def apply_instructions(model, batches, end = None):
+    """
+    Applies batches of records to an obja.ArrayModel, in order, and returns
+    the number of records applied.
+
+    Consecutive batches of instructions that are not objb.ORDERED are
+    gathered, up to INSTRUCTION_BATCH records, and applied at once. If end is
+    given, only the records before the offset end are applied, and no batch
+    is read past it.
+    """
+    applied = 0
+    pending = []
+    nb_pending = 0
+    def flush():
+        objb.apply_stream(model, objb.BlockList(pending))
+        pending.clear()
+        return 0
+
+    for instruction, records in batches:
+        if end is not None and applied + len(records) > end:
+            records = records[:end - applied]
+        if instruction in objb.ORDERED:
+            nb_pending = flush()
+            objb.apply_blocks(model, [(instruction, records)])
+        else:
+            pending.append((instruction, records))
+            nb_pending += len(records)
+            if nb_pending >= INSTRUCTION_BATCH:
+                nb_pending = flush()
+        applied += len(records)
+        if end is not None and applied >= end:
+            break
+    flush()
+    return applied
+
+def load_until(path, end = None, model = None):
+    """
+    Returns an obja.ArrayModel (a new one by default) holding the state of
+    the model of a file once the instructions before the offset end have
+    been applied, reading the file no further.
+    """
+    if model is None:
+        model = obja.ArrayModel()
+    apply_instructions(model, read_instructions(path), end)
+    return model
+
+def main(args = None):
+    """
+    Prints the number of records of each instruction of the file given as
+    first parameter, up to the offset given as second parameter if any.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    if len(args) < 1:
+        print("usage: instructions.py input.obja [end]", file = sys.stderr)
+        sys.exit(1)
+
+    end = int(args[1]) if len(args) > 1 else None
+    counts = dict()
+    total = 0
+    for instruction, records in read_instructions(args[0]):
+        if end is not None and total + len(records) > end:
+            records = records[:end - total]
+        counts[instruction] = counts.get(instruction, 0) + len(records)
+        total += len(records)
+        if end is not None and total >= end:
+            break
+    for instruction in objb.INSTRUCTIONS:
+        if instruction in counts:
+            print("{} {}".format(instruction, counts[instruction]))
+
+if __name__ == '__main__':
+    main()
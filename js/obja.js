@@ -12,6 +12,46 @@ function fetchDataLength(path, callback) {
     xhr.send();
 }
 
+function fetchOffsets(path, callback) {
+    if (typeof DecompressionStream === 'undefined') {
+        callback(null);
+        return;
+    }
+
+    // The offsets of the gzip members of the blocks of the file in path.gz,
+    // served by server.py and async_server.py (see variants.py)
+    let xhr = new XMLHttpRequest();
+
+    xhr.open('GET', path + '.gz.json', true);
+    xhr.onreadystatechange = function () {
+        if (xhr.readyState === 4) {
+            callback(xhr.status === 200 ? JSON.parse(xhr.responseText) : null);
+        }
+    };
+    xhr.send();
+}
+
+function fetchCompressedData(path, offsets, first, last, callback) {
+    let xhr = new XMLHttpRequest();
+
+    xhr.open('GET', path + '.gz', true);
+    xhr.responseType = 'arraybuffer';
+    xhr.setRequestHeader('Range', 'bytes=' + offsets[first] + "-" + (offsets[last] - 1));
+    xhr.onreadystatechange = function () {
+        if (xhr.readyState === 4) {
+            if (xhr.status === 206) {
+                let members = [];
+                for (let i = first; i < last; i++) {
+                    let member = new Blob([xhr.response.slice(offsets[i] - offsets[first], offsets[i + 1] - offsets[first])]);
+                    members.push(new Response(member.stream().pipeThrough(new DecompressionStream('gzip'))).arrayBuffer());
+                }
+                Promise.all(members).then((buffers) => new Blob(buffers).text()).then(callback);
+            }
+        }
+    };
+    xhr.send();
+}
+
 function fetchData(path, start, end, callback) {
     let xhr = new XMLHttpRequest();
 
@@ -180,12 +220,22 @@ class Loader {
         this.timeout = timeout;
         this.currentByte = 0;
         this.remainder = "";
+        this.offsets = null;
     }
 
     start(callback) {
-        fetchDataLength(this.path, (length) => {
-            this.dataLength = length;
-            this.next(callback);
+        fetchOffsets(this.path, (table) => {
+            if (table !== null) {
+                this.dataLength = table.size;
+                this.block = table.block;
+                this.offsets = table.offsets;
+                this.next(callback);
+                return;
+            }
+            fetchDataLength(this.path, (length) => {
+                this.dataLength = length;
+                this.next(callback);
+            });
         });
     }
 
@@ -205,6 +255,14 @@ class Loader {
     downloadAndParseNextChunk(callback) {
 
         let upperBound = Math.min(this.currentByte + this.chunkSize, this.dataLength);
+        let first, last;
+
+        if (this.offsets !== null) {
+            // Chunks of whole blocks, fetched from path.gz
+            first = this.currentByte / this.block;
+            last = Math.min(first + Math.max(1, Math.round(this.chunkSize / this.block)), this.offsets.length - 1);
+            upperBound = Math.min(last * this.block, this.dataLength);
+        }
 
         if (upperBound <= this.currentByte) {
             if (this.remainder !== "") {
@@ -213,7 +271,7 @@ class Loader {
             return;
         }
 
-        fetchData(this.path, this.currentByte, upperBound, (data) => {
+        let parse = (data) => {
 
             this.currentByte = upperBound;
 
@@ -228,7 +286,13 @@ class Loader {
 
             callback(elements);
 
-        });
+        };
+
+        if (this.offsets !== null) {
+            fetchCompressedData(this.path, this.offsets, first, last, parse);
+        } else {
+            fetchData(this.path, this.currentByte, upperBound, parse);
+        }
     }
 }
 
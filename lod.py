@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+
+"""
+Random access to the levels of detail of a progressive obja file.
+
+The index of a file is stored next to it, in a sidecar file with the .lod
+extension (an uncompressed numpy .npz archive). It holds checkpoints at regular
+intervals of the file: the byte offset of each of them, which is the start of a
+line, the number of vertices, faces and visible faces of the model at this
+point, the number of lines before it and the size declared by the last s instruction before it
+(0 if none). It also holds the offset and the size of every s instruction,
+and the size and modification time of the file, so that an index is not used
+once the file changed.
+
+The state of the model at each checkpoint is stored as the changes since the
+previous checkpoint: the vertices and faces added, and the rows of those
+already there that changed. The rows added are kept once, so that the sidecar
+stays about the size of the final model plus the edits, and the model at any
+checkpoint is rebuilt with a slice and a scatter per array. Reaching any level
+of detail then only parses the part of the file after the checkpoint before it.
+"""
+
+import mmap
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs
+import numpy as np
+import obja
+import objb
+
+# Default number of bytes between two checkpoints
+LOD_INTERVAL = 1 << 20
+
+# Lines declaring the size of the model
+SIZE_LINE = re.compile(rb"(?m)^[ \t]*s[ \t]+(\d+)[^\n]*\n?")
+
+# Lines starting a group of instructions, a v line following another one: the
+# vertex splits written by mesh.write_progressive start with their vertex
+GROUP_START = re.compile(rb"(?m)^(?![ \t]*v[ \t])[^\n]*\n(?=[ \t]*v[ \t])")
+
+# Default number of bytes of prefixes kept in memory by a PrefixCache
+PREFIX_CACHE_SIZE = 1 << 28
+
+# Extensions of the files whose levels of detail a PrefixCache serves
+LOD_EXTENSIONS = ('.obja',)
+
+# Errors raised by the parsing of an invalid obja file
+PARSE_ERRORS = (obja.VertexError, obja.FaceError, obja.FaceVertexError, obja.UnknownInstruction,
+                ValueError, IndexError)
+
+# Arrays of the model stored in the index, with their empty value
+ARRAYS = {
+    'vertices': np.empty((0, 3), np.float64),
+    'faces': np.empty((0, 3), np.int32),
+    'visible': np.empty((0,), bool),
+}
+
+def index_path(path):
+    """
+    Returns the path of the index of an obja file.
+    """
+    return path + '.lod'
+
+def changed_rows(previous, current):
+    """
+    Returns the indices of the rows of previous that differ in current, current
+    being an array with at least as many rows.
+    """
+    different = previous != current[:len(previous)]
+    if different.ndim > 1:
+        different = np.any(different, axis = 1)
+    return np.flatnonzero(different)
+
+class LodError(Exception):
+    """
+    The levels of detail of a file cannot be served: it is not an obja file,
+    or it cannot be parsed.
+    """
+    pass
+
+def build_index(path, interval = LOD_INTERVAL, save = True):
+    """
+    Parses an obja file and returns its LodIndex, with a checkpoint about
+    every interval bytes, at the start of the file and at its end. The index
+    is written next to the file if save is set.
+    """
+    columns = {name: [0] for name in ('offsets', 'nb_vertices', 'nb_faces', 'nb_visible', 'lines', 'sizes')}
+    markers = {'offsets': [], 'sizes': [], 'visible': []}
+    changes = {name: [] for name in ARRAYS}
+    bounds = {name: [0] for name in ARRAYS}
+    previous = dict(ARRAYS)
+    model = obja.ArrayModel()
+
+    with open(path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        size = file.seek(0, 2)
+        chunks = []
+        if size > 0:
+            data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+            chunks = obja.line_chunks(data, interval)
+        for start, end in chunks:
+            for first, last in obja.line_chunks(data[start:end], obja.PARSE_CHUNK):
+                chunk = data[start + first:start + last]
+                position = 0
+                for match in SIZE_LINE.finditer(chunk):
+                    model.parse_bytes(chunk[position:match.end()])
+                    position = match.end()
+                    markers['offsets'].append(start + first + match.end())
+                    markers['sizes'].append(int(match.group(1)))
+                    markers['visible'].append(int(np.count_nonzero(model.visible)))
+                model.parse_bytes(chunk[position:])
+            obja.release_pages(data, start, end)
+
+            for name in ARRAYS:
+                current = getattr(model, name)
+                rows = changed_rows(previous[name], current)
+                changes[name].append((rows, current[rows], current[len(previous[name]):].copy()))
+                bounds[name].append(bounds[name][-1] + len(rows))
+                previous[name] = current.copy()
+            columns['offsets'].append(end)
+            columns['nb_vertices'].append(model.nb_vertices)
+            columns['nb_faces'].append(model.nb_faces)
+            columns['nb_visible'].append(int(np.count_nonzero(model.visible)))
+            columns['lines'].append(model.line)
+            columns['sizes'].append(markers['sizes'][-1] if len(markers['sizes']) > 0 else 0)
+        if size > 0:
+            data.close()
+
+    arrays = {name: np.array(values, np.int64) for name, values in columns.items()}
+    arrays['marker_offsets'] = np.array(markers['offsets'], np.int64)
+    arrays['marker_sizes'] = np.array(markers['sizes'], np.int64)
+    arrays['marker_visible'] = np.array(markers['visible'], np.int64)
+    arrays['source_size'] = np.array(size, np.int64)
+    arrays['source_mtime'] = np.array(stat.st_mtime_ns, np.int64)
+    for name, empty in ARRAYS.items():
+        parts = changes[name]
+        arrays[name] = np.concatenate([empty] + [added for _, _, added in parts])
+        arrays[name + '_changes'] = np.concatenate([np.empty(0, np.int64)] + [rows for rows, _, _ in parts])
+        arrays[name + '_values'] = np.concatenate([empty] + [values for _, values, _ in parts])
+        arrays[name + '_bounds'] = np.array(bounds[name], np.int64)
+
+    if save:
+        # Written aside and renamed, so that readers never see a partial index
+        temporary = index_path(path) + '.tmp'
+        with open(temporary, 'wb') as output:
+            np.savez(output, **arrays)
+        os.replace(temporary, index_path(path))
+    return LodIndex(path, arrays)
+
+def copy_model(model):
+    """
+    Returns a copy of an obja.ArrayModel.
+    """
+    copy = obja.ArrayModel(max(model.nb_vertices, model.nb_faces))
+    copy.add_vertices(model.vertices)
+    copy.add_faces(model.faces)
+    copy.visible[:] = model.visible
+    copy.line = model.line
+    return copy
+
+class LodIndex:
+    """
+    The index of the levels of detail of an obja file.
+
+    The offsets, nb_vertices, nb_faces, nb_visible (the faces not deleted),
+    lines and sizes arrays hold the columns of the checkpoints, and
+    marker_offsets, marker_sizes and marker_visible the offset following each
+    s instruction, the size it declares and the number of faces visible
+    there.
+    """
+    def __init__(self, path, arrays = None):
+        """
+        Loads the index of an obja file, unless its arrays are given. Raises
+        ValueError if the size or the modification time of the file changed
+        since the index was built.
+        """
+        self.path = path
+        if arrays is None:
+            with np.load(index_path(path)) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+        stat = os.stat(path)
+        if any(name not in arrays for name in ('source_mtime', 'nb_visible', 'marker_visible')) \
+                or int(arrays['source_size']) != stat.st_size \
+                or int(arrays['source_mtime']) != stat.st_mtime_ns:
+            raise ValueError("{} is out of date".format(index_path(path)))
+        self.arrays = arrays
+        self.offsets = arrays['offsets']
+        self.nb_vertices = arrays['nb_vertices']
+        self.nb_faces = arrays['nb_faces']
+        self.nb_visible = arrays['nb_visible']
+        self.lines = arrays['lines']
+        self.sizes = arrays['sizes']
+        self.marker_offsets = arrays['marker_offsets']
+        self.marker_sizes = arrays['marker_sizes']
+        self.marker_visible = arrays['marker_visible']
+
+    def __len__(self):
+        """
+        Returns the number of checkpoints.
+        """
+        return len(self.offsets)
+
+    def snapshot(self, k):
+        """
+        Returns the obja.ArrayModel holding the state of the model at
+        checkpoint k.
+        """
+        counts = {'vertices': self.nb_vertices[k], 'faces': self.nb_faces[k], 'visible': self.nb_faces[k]}
+        state = dict()
+        for name, count in counts.items():
+            array = self.arrays[name][:count].copy()
+            end = self.arrays[name + '_bounds'][k]
+            rows = self.arrays[name + '_changes'][:end]
+            last = objb.last_occurrences(rows)
+            array[rows[last]] = self.arrays[name + '_values'][:end][last]
+            state[name] = array
+
+        model = obja.ArrayModel(max(len(state['vertices']), len(state['faces'])))
+        model.add_vertices(state['vertices'])
+        model.add_faces(state['faces'])
+        model.visible[:] = state['visible']
+        model.line = int(self.lines[k])
+        return model
+
+    def load(self, offset = None, faces = None, size = None):
+        """
+        Returns the obja.ArrayModel obtained by applying a prefix of the file,
+        given by exactly one of:
+
+          - offset: the lines ending before this byte offset,
+          - faces: the prefix given by end(faces = faces),
+          - size: the lines up to the last s instruction declaring at most this
+            size (none if the first one declares more).
+
+        The model is rebuilt from the last checkpoint before the end of the
+        prefix, and only the lines after it are parsed.
+        """
+        if sum(target is not None for target in (offset, faces, size)) != 1:
+            raise ValueError("exactly one of offset, faces and size must be given")
+        if size is not None:
+            marker = np.searchsorted(self.marker_sizes, size, 'right') - 1
+            offset = int(self.marker_offsets[marker]) if marker >= 0 else 0
+
+        with open(self.path, 'rb') as file:
+            if file.seek(0, 2) == 0:
+                return obja.ArrayModel()
+            data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                if faces is not None:
+                    offset = self.faces_end(data, faces)
+                return self.load_offset(data, offset)
+            finally:
+                data.close()
+
+    def load_offset(self, data, offset):
+        """
+        Returns the model of the lines of a mapped file ending before offset.
+        """
+        if offset >= len(data):
+            offset = len(data)
+        else:
+            offset = data.rfind(b"\n", 0, offset) + 1
+        k = np.searchsorted(self.offsets, offset, 'right') - 1
+        model = self.snapshot(k)
+        model.parse_bytes(data[self.offsets[k]:offset])
+        return model
+
+    def groups(self, data, start, end):
+        """
+        Returns the offsets after start and up to end of a mapped file where
+        a group of instructions starts (see GROUP_START).
+        """
+        line = data.rfind(b"\n", 0, max(start - 1, 0)) + 1
+        # The line starting at end tells whether a group starts there
+        stop = data.find(b"\n", end)
+        matches = GROUP_START.finditer(data, line, len(data) if stop < 0 else stop)
+        return [match.end() for match in matches if start < match.end() <= end]
+
+    def last_group(self, data, k):
+        """
+        Returns the offset of the last group of instructions of a mapped file
+        starting up to checkpoint k, or 0.
+        """
+        while k > 0:
+            groups = self.groups(data, int(self.offsets[k - 1]), int(self.offsets[k]))
+            if groups:
+                return groups[-1]
+            k -= 1
+        return 0
+
+    def faces_end(self, data, faces):
+        """
+        Returns the end of the prefix of a mapped file giving a level of
+        detail of at most faces faces, the faces deleted not being counted:
+        the prefix ending before the first s instruction after which more
+        faces are visible, or the whole file if there is none. A file without
+        s instructions is cut at the start of a group of instructions, so
+        that a vertex split is never cut: its prefixes are assumed to show
+        more faces as they grow, and are bisected from the checkpoint before
+        the first one showing too many faces.
+        """
+        if len(self.marker_offsets) > 0:
+            markers = np.flatnonzero(self.marker_visible > faces)
+            if len(markers) > 0:
+                return int(self.marker_offsets[markers[0] - 1]) if markers[0] > 0 else 0
+            return len(data) if self.nb_visible[-1] <= faces else int(self.marker_offsets[-1])
+        over = np.flatnonzero(self.nb_visible > faces)
+        if len(over) == 0:
+            return len(data)
+
+        k = over[0] - 1
+        model = self.snapshot(k)
+        position = int(self.offsets[k])
+        groups = self.groups(data, position, int(self.offsets[k + 1]))
+        found = None
+        low, high = 0, len(groups)
+        while low < high:
+            middle = (low + high) // 2
+            probe = copy_model(model)
+            probe.parse_bytes(data[position:groups[middle]])
+            if np.count_nonzero(probe.visible) > faces:
+                high = middle
+            else:
+                model, position, found = probe, groups[middle], groups[middle]
+                low = middle + 1
+        return found if found is not None else self.last_group(data, k)
+
+    def end(self, offset = None, faces = None):
+        """
+        Returns the length of the prefix of the file given by exactly one of:
+
+          - offset: the prefix ending at the last s instruction before this
+            byte offset, or at the last line ending before it if there is no
+            such instruction,
+          - faces: the prefix giving a level of detail of at most this number
+            of faces (see faces_end).
+        """
+        if (offset is None) == (faces is None):
+            raise ValueError("exactly one of offset and faces must be given")
+        with open(self.path, 'rb') as file:
+            size = file.seek(0, 2)
+            if size == 0:
+                return 0
+            data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                if offset is not None:
+                    if offset >= size:
+                        return size
+                    marker = np.searchsorted(self.marker_offsets, offset, 'right') - 1
+                    if marker >= 0:
+                        return int(self.marker_offsets[marker])
+                    return data.rfind(b"\n", 0, offset) + 1
+
+                return self.faces_end(data, faces)
+            finally:
+                data.close()
+
+def open_index(path, interval = LOD_INTERVAL, save = True):
+    """
+    Returns the index of an obja file, building it if it is missing or out of
+    date, and writing it if save is set.
+    """
+    try:
+        return LodIndex(path)
+    except (OSError, ValueError):
+        return build_index(path, interval, save)
+
+def load_lod(path, offset = None, faces = None, size = None):
+    """
+    Returns the model of a prefix of an obja file (see LodIndex.load), using
+    its index, built first if needed.
+    """
+    return open_index(path).load(offset, faces, size)
+
+def prefix_target(query):
+    """
+    Returns the (offset, faces) target of LodIndex.end given by a query
+    string holding either bytes=B or faces=N. Raises ValueError otherwise.
+    """
+    fields = parse_qs(query)
+    values = [fields.get(name, []) for name in ('bytes', 'faces')]
+    if sorted(len(value) for value in values) != [0, 1] or not all(value.isdigit() for value in sum(values, [])):
+        raise ValueError("expected bytes=B or faces=N")
+    return tuple(int(value[0]) if value else None for value in values)
+
+class PrefixCache:
+    """
+    The prefixes of obja files at levels of detail (see LodIndex.end), kept
+    in memory up to max_size bytes, the least recently used being dropped
+    first. The indices of the files are kept too: an index written next to a
+    file is used if it is up to date, and the others are built in memory,
+    so that serving a directory never writes in it. A file that changed is
+    indexed again. It can be shared by threads.
+    """
+    def __init__(self, max_size = PREFIX_CACHE_SIZE):
+        """
+        Creates an empty cache.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.prefixes = OrderedDict()
+        self.indices = dict()
+        self.lock = threading.Lock()
+
+    def index(self, path, key):
+        """
+        Returns the index of a file, whose version is key. Raises LodError if
+        the file cannot be parsed.
+        """
+        with self.lock:
+            entry = self.indices.get(path)
+        if entry is None or entry[0] != key:
+            try:
+                index = open_index(path, save = False)
+            except PARSE_ERRORS as error:
+                # Kept, so that an invalid file is parsed once
+                index = LodError("{} cannot be parsed: {}".format(os.path.basename(path), error))
+            entry = (key, index)
+            with self.lock:
+                self.indices[path] = entry
+        if isinstance(entry[1], LodError):
+            raise entry[1]
+        return entry[1]
+
+    def get(self, path, offset = None, faces = None):
+        """
+        Returns the bytes of a prefix of an obja file, given as in
+        LodIndex.end. Raises LodError if it is not an obja file or cannot be
+        parsed, and OSError if it cannot be read.
+        """
+        if os.path.splitext(path)[1].lower() not in LOD_EXTENSIONS:
+            raise LodError("{} is not an obja file".format(os.path.basename(path)))
+        stat = os.stat(path)
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        prefix_key = (path, key, offset, faces)
+        with self.lock:
+            prefix = self.prefixes.get(prefix_key)
+            if prefix is not None:
+                self.prefixes.move_to_end(prefix_key)
+                return prefix
+
+        index = self.index(path, key)
+        try:
+            end = index.end(offset, faces)
+        except PARSE_ERRORS as error:
+            raise LodError("{} cannot be parsed: {}".format(os.path.basename(path), error))
+        with open(path, 'rb') as file:
+            prefix = file.read(end)
+        with self.lock:
+            if prefix_key not in self.prefixes:
+                self.prefixes[prefix_key] = prefix
+                self.size += len(prefix)
+            while self.size > self.max_size:
+                _, dropped = self.prefixes.popitem(last = False)
+                self.size -= len(dropped)
+        return prefix
+
+def main(args = None):
+    """
+    Builds the index of the obja files given as parameters, with a checkpoint
+    every --interval bytes (LOD_INTERVAL by default).
+    """
+    if args is None:
+        args = sys.argv[1:]
+    interval = LOD_INTERVAL
+    if '--interval' in args:
+        position = args.index('--interval')
+        interval = int(args[position + 1])
+        args = args[:position] + args[position + 2:]
+    if len(args) < 1:
+        print("usage: lod.py [--interval bytes] input.obja...", file = sys.stderr)
+        sys.exit(1)
+
+    for path in args:
+        index = build_index(path, interval)
+        print("{} : {} checkpoints".format(index_path(path), len(index)))
+
+if __name__ == '__main__':
+    main()
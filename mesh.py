@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+Triangle mesh simplified in place by edge collapses.
+"""
+
+import numpy as np
+import obja
+from adjacency import DynamicAdjacency, face_array
+
+# Size of the buffer of the obja.Output created by the writers
+OUTPUT_BUFFER = 1 << 20
+
+# Minimum number of bytes between the s lines of a progressive stream: one per
+# vertex split would make lod.py index it slowly, for a few bytes per step
+STEP_SIZE = 1 << 12
+
+class CollapseRecord:
+    """
+    What an edge collapse changed, so that it can be undone or written as a
+    vertex split.
+    """
+    def __init__(self, kept, removed, kept_position, removed_position):
+        """
+        Creates the record of the collapse of the vertex removed into the
+        vertex kept, from their positions before the collapse.
+        """
+        self.kept = kept
+        self.removed = removed
+        self.kept_position = kept_position
+        self.removed_position = removed_position
+        # (face, corner) whose vertex went from removed to kept
+        self.edited_faces = []
+        # (face, [a, b, c]) hidden because they held both vertices
+        self.removed_faces = []
+
+    def __str__(self):
+        return "CollapseRecord({} <- {})".format(self.kept, self.removed)
+
+    def __repr__(self):
+        return str(self)
+
+class Mesh:
+    """
+    A triangle mesh that edge collapses edit in place.
+
+    The vertices are a (N, 3) array and the faces a (F, 3) array of vertex
+    indices. Collapsing an edge hides the faces it degenerates instead of
+    removing them, so vertex and face indices never change. The faces around
+    each vertex are kept in adjacency, a DynamicAdjacency updated by every
+    collapse, and the faces and vertices a collapse touches are reported to
+    the geometry cache attached to the mesh, if any (see
+    geometry.get_geometry).
+    """
+    def __init__(self, vertices, faces, visible = None):
+        """
+        Creates a mesh from copies of its vertex and face arrays.
+        """
+        self.vertices = np.array(vertices, np.float64).reshape(-1, 3)
+        self.faces = np.array(faces, np.int64).reshape(-1, 3)
+        if visible is None:
+            visible = np.ones(len(self.faces), bool)
+        self.visible = np.array(visible, bool)
+        self.removed = np.zeros(len(self.vertices), bool)
+        self.adjacency = DynamicAdjacency(self.faces, len(self.vertices), self.visible)
+        self.geometry = None
+
+    @staticmethod
+    def from_model(model):
+        """
+        Creates a mesh from an obja model.
+        """
+        faces, visible = face_array(model)
+        return Mesh(np.array(model.vertices, np.float64), faces, visible)
+
+    def collapse(self, kept, removed, position = None):
+        """
+        Merges the vertex removed into the vertex kept, moved to position if
+        it is given, and returns the record of the collapse.
+
+        Only the faces around the vertex removed are visited.
+        """
+        record = CollapseRecord(kept, removed,
+                                self.vertices[kept].copy(), self.vertices[removed].copy())
+
+        for face in sorted(self.adjacency.vertex_faces[removed]):
+            indices = self.faces[face].tolist()
+            if kept in indices:
+                record.removed_faces.append((face, indices))
+                self.visible[face] = False
+                self.adjacency.remove_face(face, indices)
+            else:
+                corner = indices.index(removed)
+                self.faces[face, corner] = kept
+                record.edited_faces.append((face, corner))
+                self.adjacency.remove_face(face, [removed])
+                self.adjacency.add_face(face, [kept])
+
+        if position is not None:
+            self.vertices[kept] = position
+        self.removed[removed] = True
+        self.touch(record)
+        return record
+
+    def touch(self, record):
+        """
+        Reports the faces and vertices of a collapse to the geometry cache, if
+        any.
+        """
+        if self.geometry is not None:
+            self.geometry.invalidate_faces(face for face, _ in record.edited_faces)
+            self.geometry.invalidate_faces(face for face, _ in record.removed_faces)
+            self.geometry.invalidate_vertices([record.kept, record.removed])
+
+    def isolated_vertices(self, record):
+        """
+        Returns the vertices that a collapse left without any face, looking
+        only at the faces it removed.
+        """
+        vertices = {vertex for _, indices in record.removed_faces for vertex in indices}
+        vertices.add(record.kept)
+        return sorted(vertex for vertex in vertices
+                      if vertex != record.removed and self.adjacency.is_isolated(vertex))
+
+    def undo(self, record):
+        """
+        Undoes a collapse, which must be the last one not undone yet.
+        """
+        for face, corner in reversed(record.edited_faces):
+            self.faces[face, corner] = record.removed
+            self.adjacency.remove_face(face, [record.kept])
+            self.adjacency.add_face(face, [record.removed])
+
+        for face, indices in reversed(record.removed_faces):
+            self.faces[face] = indices
+            self.visible[face] = True
+            self.adjacency.add_face(face, indices)
+
+        self.vertices[record.kept] = record.kept_position
+        self.vertices[record.removed] = record.removed_position
+        self.removed[record.removed] = False
+        self.touch(record)
+
+def write_mesh(output, mesh):
+    """
+    Writes the vertices that were not removed and the visible faces of a mesh
+    in an obja.Output, and returns it.
+
+    A file given instead of an obja.Output is written through a buffered
+    obja.Output, flushed before returning.
+    """
+    if not isinstance(output, obja.Output):
+        with obja.Output(output, buffer_size = OUTPUT_BUFFER) as output:
+            return write_mesh(output, mesh)
+
+    vertices = np.flatnonzero(~mesh.removed)
+    output.add_vertices(vertices, mesh.vertices[vertices])
+    faces = np.flatnonzero(mesh.visible)
+    output.add_faces(faces, mesh.faces[faces])
+
+    return output
+
+def write_progressive(output, mesh, records, step = STEP_SIZE):
+    """
+    Writes a mesh simplified by collapses as a progressive OBJA stream: the
+    simplified mesh, then the vertex splits undoing the collapses from the last
+    one to the first one. An s line declaring the size of the stream so far
+    follows the simplified mesh, the first vertex split ending step bytes or
+    more after the previous s line, and the last one: they cut the stream
+    into refinement steps (see compact.py and lod.py).
+
+    A file given instead of an obja.Output is written through a buffered
+    obja.Output, flushed before returning.
+    """
+    if not isinstance(output, obja.Output):
+        with obja.Output(output, buffer_size = OUTPUT_BUFFER) as output:
+            return write_progressive(output, mesh, records, step)
+
+    write_mesh(output, mesh)
+    output.declare_size()
+    declared = output.written
+
+    for record in reversed(records):
+        output.add_vertex(record.removed, record.removed_position)
+        output.edit_vertex(record.kept, record.kept_position)
+        for face, corner in record.edited_faces:
+            output.edit_face_vertex(face, corner + 1, record.removed)
+        for face, indices in record.removed_faces:
+            output.add_face(face, obja.Face(*indices))
+        if output.written - declared >= step:
+            output.declare_size()
+            declared = output.written
+    if output.written > declared:
+        output.declare_size()
+
+    return output
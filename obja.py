@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
+import mmap
 import sys
+from array import array
+import warnings
 import numpy as np
 from math import sqrt
 import random
@@ -30,7 +33,7 @@ class Face:
         a, b, c = vertices[self.a], vertices[self.b], vertices[self.c]
         AB = b - a
         AC = c - a
-        area = 0.5*sqrt((AB[1]*AC[2] - AB[2]*AC[1])**2 + (AB[2]*AC[0] - AB[0]*AC[2])**2 + (AB[0]*AC[1] - AC[1]*AC[0])**2)
+        area = 0.5*sqrt((AB[1]*AC[2] - AB[2]*AC[1])**2 + (AB[2]*AC[0] - AB[0]*AC[2])**2 + (AB[0]*AC[1] - AB[1]*AC[0])**2)
         return area
 
     def from_array(array):
@@ -192,10 +195,15 @@ class Model:
 
     def parse_file(self, path):
         """
-        Parses an OBJA file.
+        Parses an OBJA file, or loads a binary objb file.
         """
+        if is_binary_file(path):
+            model = parse_array_file(path).to_model()
+            self.vertices += model.vertices
+            self.faces += model.faces
+            return
         with open(path, "r") as file:
-            for line in file.readlines():
+            for line in file:
                 self.parse_line(line)
 
     def parse_line(self, line):
@@ -264,6 +272,701 @@ class Model:
             return
             # raise UnknownInstruction(split[0], self.line)
 
+def is_binary_file(path):
+    """
+    Tells whether a file is a binary objb file rather than an obja file.
+    """
+    import objb
+    with open(path, "rb") as file:
+        return objb.is_binary(file.read(len(objb.MAGIC)))
+
+def parse_indices(array):
+    """
+    Converts an array of strings representing vector indices (starting at 1)
+    into a list of indices starting at 0.
+    """
+    return [int(string.split('/')[0]) - 1 for string in array]
+
+WHITESPACE = np.zeros(256, bool)
+WHITESPACE[list(b" \t\n\r\v\f")] = True
+
+EDIT_INSTRUCTIONS = [b"ev", b"tv", b"af", b"tf", b"ts", b"ef", b"df"]
+
+MAX_COPIED_RUNS = 1024
+
+# Number of bytes of a file parsed at once by ArrayModel.parse_file
+PARSE_CHUNK = 1 << 22
+
+def line_chunks(data, size):
+    """
+    Returns the (start, end) offsets of consecutive chunks of about size bytes
+    of a buffer, each of them ending after a new line except the last one.
+    """
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = min(start + size, len(data))
+        if end < len(data):
+            newline = data.rfind(b"\n", start, end)
+            if newline < 0:
+                newline = data.find(b"\n", end)
+            end = len(data) if newline < 0 else newline + 1
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def release_pages(data, start, end):
+    """
+    Tells the system that the pages of a memory mapped file between two
+    offsets are not needed anymore, so that they stop counting in the memory
+    of the process, if the system supports it.
+    """
+    if hasattr(mmap, "MADV_DONTNEED"):
+        start -= start % mmap.PAGESIZE
+        data.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+def split_lines(buffer):
+    """
+    Returns the start and end offsets of the lines of a buffer of bytes ending
+    with a new line, the end offsets pointing at the new line characters.
+    """
+    ends = np.flatnonzero(buffer == ord('\n'))
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    return starts, ends
+
+def classify_lines(buffer, starts):
+    """
+    Sorts the lines of a buffer by instruction.
+
+    Returns three boolean masks over the lines: the vertices (v), the faces (f)
+    and the instructions that must be interpreted in order. Lines starting with
+    white space are interpreted in order as well, every other line is ignored.
+    """
+    # The buffer ends with a new line, so clipping reads new lines past its end
+    first, second, third, fourth = (buffer.take(starts + i, mode = 'clip') for i in range(4))
+    is_vertex = (first == ord('v')) & WHITESPACE[second]
+    is_face = (first == ord('f')) & WHITESPACE[second]
+    pair = first.astype(np.uint16) << 8 | second
+    codes = [instruction[0] << 8 | instruction[1] for instruction in EDIT_INSTRUCTIONS]
+    is_edit = np.isin(pair, codes) & WHITESPACE[third]
+    is_edit |= (pair == (ord('e') << 8 | ord('f'))) & (third == ord('v')) & WHITESPACE[fourth]
+    is_edit |= WHITESPACE[first] & (first != ord('\n'))
+    return is_vertex, is_face, is_edit
+
+def select_lines(buffer, starts, ends, mask):
+    """
+    Gathers the selected lines of a buffer, replacing their one character
+    instruction by a space.
+
+    Returns the gathered bytes and the offsets of their new line characters.
+    """
+    lengths = ends[mask] - starts[mask] + 1
+    newlines = np.cumsum(lengths) - 1
+    bounds = np.flatnonzero(np.diff(mask, prepend = False, append = False))
+    if len(bounds) <= MAX_COPIED_RUNS:
+        # Lines of the same kind usually come in a few long runs
+        runs = bounds.reshape(-1, 2)
+        text = np.concatenate([buffer[starts[first]:ends[last - 1] + 1] for first, last in runs]
+                              + [np.empty(0, np.uint8)])
+    else:
+        text = buffer[np.repeat(mask, ends - starts + 1)]
+    text[newlines - lengths + 1] = ord(' ')
+    return text, newlines
+
+def parse_numbers(text, newlines, width, dtype = np.float64, strip_slashes = False):
+    """
+    Parses lines of white space separated numbers, each line starting with a
+    space.
+
+    Lines are expected to hold width numbers, which is checked without
+    counting the tokens of every line when it is the case. If strip_slashes is
+    set, the end of tokens such as 1/2/3 is dropped. Returns the flat array of
+    numbers and how many of them each line holds, or None if one of the tokens
+    is not a number.
+    """
+    if strip_slashes and np.any(text == ord('/')):
+        positions = np.arange(len(text))
+        last_slash = np.maximum.accumulate(np.where(text == ord('/'), positions, -1))
+        last_space = np.maximum.accumulate(np.where(text <= ord(' '), positions, -1))
+        text[last_slash > last_space] = ord(' ')
+
+    space = text <= ord(' ')
+    token_starts = np.flatnonzero(~space[1:] & space[:-1]) + 1
+
+    if len(token_starts) == width * len(newlines) and \
+            np.all(token_starts[::width][1:] > newlines[:-1]) and \
+            np.all(token_starts[width - 1::width] < newlines):
+        counts = np.full(len(newlines), width)
+    else:
+        counts = np.bincount(np.searchsorted(newlines, token_starts), minlength = len(newlines))
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            numbers = np.fromstring(text.tobytes(), dtype = dtype, sep = ' ')
+    except ValueError:
+        return None
+    if len(numbers) != len(token_starts):
+        return None
+    return numbers, counts
+
+def gather_rows(numbers, counts, width):
+    """
+    Returns the first width numbers of each line, skipping the lines that hold
+    less than width numbers.
+    """
+    if np.all(counts == width):
+        return numbers.reshape(-1, width)
+    offsets = (np.cumsum(counts) - counts)[counts >= width]
+    return numbers[offsets[:, None] + np.arange(width)]
+
+def gather_strips(numbers, counts):
+    """
+    Returns the triangles of the strips declared by each line, a line with k
+    indices declaring k - 2 triangles.
+    """
+    if np.all(counts == 3):
+        return numbers.reshape(-1, 3), np.ones(len(counts), np.int64)
+    triangles = np.maximum(counts - 2, 0)
+    offsets = np.cumsum(counts) - counts
+    firsts = np.cumsum(triangles) - triangles
+    corners = np.repeat(offsets - firsts, triangles) + np.arange(triangles.sum())
+    return numbers[corners[:, None] + np.arange(3)], triangles
+
+# Number of faces of a block of FaceOrder, which holds between one and two times
+# this number of faces once split
+ORDER_BLOCK = 1024
+
+class FaceOrder:
+    """
+    The order of the faces of an ArrayModel in which faces were inserted.
+
+    The faces stay where they were stored, in slots, and the order holds the
+    slot of each face index, in blocks of at most 2 * ORDER_BLOCK slots with a
+    Fenwick tree of the lengths of the blocks. Finding the slot of the face at
+    an index, or inserting a face before it, costs O(log F + ORDER_BLOCK)
+    instead of the O(F) of shifting the following faces.
+    """
+    def __init__(self, count = 0):
+        """
+        Initializes the order of count faces stored in order.
+        """
+        self.blocks = []
+        self.length = 0
+        self.flat = None
+        self.tree = [0]
+        self.extend(np.arange(count))
+
+    def __len__(self):
+        """
+        Returns the number of faces.
+        """
+        return self.length
+
+    def rebuild(self):
+        """
+        Rebuilds the Fenwick tree of the lengths of the blocks.
+        """
+        tree = [0] + [len(block) for block in self.blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def grow(self, block, count):
+        """
+        Adds count to the length of a block in the Fenwick tree.
+        """
+        i = block + 1
+        while i < len(self.tree):
+            self.tree[i] += count
+            i += i & -i
+
+    def locate(self, index):
+        """
+        Returns the block holding the face at an index and the position of the
+        face in the block, or the end of the last block for the index past the
+        last face.
+        """
+        block = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step > 0:
+            if block + step < len(self.tree) and self.tree[block + step] <= index:
+                block += step
+                index -= self.tree[block]
+            step >>= 1
+        if block == len(self.blocks):
+            return block - 1, len(self.blocks[-1])
+        return block, index
+
+    def extend(self, slots):
+        """
+        Appends the slots of faces after the last face.
+        """
+        slots = np.asarray(slots, np.int64)
+        start = 0
+        if self.blocks:
+            start = min(len(slots), 2 * ORDER_BLOCK - len(self.blocks[-1]))
+            self.blocks[-1].frombytes(slots[:start].tobytes())
+            self.grow(len(self.blocks) - 1, start)
+        if start < len(slots):
+            for first in range(start, len(slots), ORDER_BLOCK):
+                self.blocks.append(array('q', slots[first:first + ORDER_BLOCK].tobytes()))
+            self.rebuild()
+        self.length += len(slots)
+        self.flat = None
+
+    def insert(self, index, slot):
+        """
+        Inserts the slot of a face before the face at an index.
+        """
+        if not self.blocks:
+            self.extend([slot])
+            return
+        block, position = self.locate(index)
+        self.blocks[block].insert(position, slot)
+        self.grow(block, 1)
+        self.length += 1
+        self.flat = None
+        if len(self.blocks[block]) > 2 * ORDER_BLOCK:
+            half = len(self.blocks[block]) // 2
+            self.blocks[block:block + 1] = [self.blocks[block][:half], self.blocks[block][half:]]
+            self.rebuild()
+
+    def slots(self):
+        """
+        Returns the array of the slot of each face.
+        """
+        if self.flat is None:
+            self.flat = np.concatenate([np.empty(0, np.int64)] +
+                                       [np.frombuffer(block, np.int64) for block in self.blocks])
+        return self.flat
+
+    def select(self, indices):
+        """
+        Returns the slots of the faces at an array of indices.
+        """
+        indices = np.asarray(indices, np.int64)
+        if self.flat is None and len(indices) * ORDER_BLOCK < self.length:
+            slots = []
+            for index in indices.tolist():
+                block, position = self.locate(index)
+                slots.append(self.blocks[block][position])
+            return np.array(slots, np.int64).reshape(indices.shape)
+        return self.slots()[indices]
+
+class ArrayModel(Model):
+    """
+    The OBJA model, stored as a structure of arrays.
+
+    The vertices are kept in a (N, 3) float64 array, the faces in a (F, 3) int32
+    array of vertex indices, and the visibility of each face in a boolean mask.
+    The arrays grow by doubling their capacity, so adding an element costs
+    amortized constant time. The edits are reported to the geometry cache
+    attached to the model, if any (see geometry.get_geometry).
+
+    Once a face is inserted before others (af), the faces stay in the slots
+    where they were stored and a FaceOrder gives the slot of each face index,
+    so that insertions and edits do not shift the faces. They are stored in
+    order again the next time the faces or visible arrays are read.
+    """
+    def __init__(self, capacity = 1024):
+        """
+        Intializes an empty model able to hold capacity vertices and faces
+        before growing.
+        """
+        capacity = max(capacity, 1)
+        self._vertices = np.empty((capacity, 3), np.float64)
+        self._faces = np.empty((capacity, 3), np.int32)
+        self._visible = np.empty((capacity,), bool)
+        self.nb_vertices = 0
+        self.nb_faces = 0
+        self.geometry = None
+        self.order = None
+        # Sets the line counter, and the vertices and faces to empty arrays
+        super().__init__()
+
+    @property
+    def vertices(self):
+        """
+        The (N, 3) array of the vertices of the model.
+        """
+        return self._vertices[:self.nb_vertices]
+
+    @vertices.setter
+    def vertices(self, vertices):
+        """
+        Replaces the vertices of the model by a (N, 3) array.
+        """
+        self.nb_vertices = 0
+        self.add_vertices(vertices)
+
+    @property
+    def faces(self):
+        """
+        The (F, 3) array of the vertex indices of the faces of the model.
+        """
+        self.sort_faces()
+        return self._faces[:self.nb_faces]
+
+    @faces.setter
+    def faces(self, faces):
+        """
+        Replaces the faces of the model by a (F, 3) array of vertex indices,
+        all of them visible.
+        """
+        self.order = None
+        self.nb_faces = 0
+        self.add_faces(faces)
+
+    @property
+    def visible(self):
+        """
+        The (F,) boolean mask of the faces that are not deleted.
+        """
+        self.sort_faces()
+        return self._visible[:self.nb_faces]
+
+    def sort_faces(self):
+        """
+        Stores the faces in their order again, if faces were inserted.
+        """
+        if self.order is not None:
+            slots = self.order.slots()
+            self._faces[:self.nb_faces] = self._faces[slots]
+            self._visible[:self.nb_faces] = self._visible[slots]
+            self.order = None
+
+    def face_slots(self, indices):
+        """
+        Returns the positions in the face arrays of the faces at an array of
+        indices.
+        """
+        indices = np.asarray(indices, np.int64)
+        if self.order is None:
+            return indices
+        return self.order.select(indices)
+
+    def reserve_vertices(self, count):
+        """
+        Makes sure count more vertices can be added without reallocating.
+        """
+        needed = self.nb_vertices + count
+        if needed > len(self._vertices):
+            capacity = max(needed, 2 * len(self._vertices))
+            vertices = np.empty((capacity, 3), np.float64)
+            vertices[:self.nb_vertices] = self.vertices
+            self._vertices = vertices
+
+    def reserve_faces(self, count):
+        """
+        Makes sure count more faces can be added without reallocating.
+        """
+        needed = self.nb_faces + count
+        if needed > len(self._faces):
+            capacity = max(needed, 2 * len(self._faces))
+            faces = np.empty((capacity, 3), np.int32)
+            faces[:self.nb_faces] = self._faces[:self.nb_faces]
+            visible = np.empty((capacity,), bool)
+            visible[:self.nb_faces] = self._visible[:self.nb_faces]
+            self._faces = faces
+            self._visible = visible
+
+    def add_vertices(self, vertices):
+        """
+        Appends a (n, 3) array of vertices to the model.
+        """
+        vertices = np.asarray(vertices, np.float64).reshape(-1, 3)
+        self.reserve_vertices(len(vertices))
+        self._vertices[self.nb_vertices:self.nb_vertices + len(vertices)] = vertices
+        self.nb_vertices += len(vertices)
+
+    def add_faces(self, faces, visible = True):
+        """
+        Appends a (n, 3) array of vertex indices (starting at 0) to the model.
+        """
+        faces = np.asarray(faces).reshape(-1, 3)
+        self.reserve_faces(len(faces))
+        self._faces[self.nb_faces:self.nb_faces + len(faces)] = faces
+        self._visible[self.nb_faces:self.nb_faces + len(faces)] = visible
+        if self.order is not None and len(faces) > 0:
+            self.order.extend(np.arange(self.nb_faces, self.nb_faces + len(faces)))
+        self.nb_faces += len(faces)
+
+    def insert_face(self, index, face, visible = True):
+        """
+        Inserts a face before the face at the specified index (starting at 0),
+        shifting the following faces.
+
+        The following faces are only shifted in the FaceOrder of the model,
+        unless a geometry cache is attached to it.
+        """
+        if self.geometry is not None:
+            self.sort_faces()
+            self.reserve_faces(1)
+            end = self.nb_faces
+            self._faces[index + 1:end + 1] = self._faces[index:end]
+            self._visible[index + 1:end + 1] = self._visible[index:end]
+            self._faces[index] = face
+            self._visible[index] = visible
+            self.nb_faces += 1
+            self.geometry.insert_face(index)
+            return
+
+        if index == self.nb_faces:
+            self.add_faces(face, visible)
+            return
+        if self.order is None:
+            self.order = FaceOrder(self.nb_faces)
+        self.reserve_faces(1)
+        self._faces[self.nb_faces] = face
+        self._visible[self.nb_faces] = visible
+        self.order.insert(index, self.nb_faces)
+        self.nb_faces += 1
+
+    def edit_faces(self, indices, faces):
+        """
+        Changes the vertices of the faces at an array of indices, from a (n, 3)
+        array. The last change of a face repeated in indices wins.
+        """
+        indices = np.asarray(indices, np.int64)
+        self._faces[self.face_slots(indices)] = faces
+        self.touch_faces(np.unique(indices))
+
+    def edit_face_vertices(self, indices, corners, vertices):
+        """
+        Changes one of the vertices (0, 1 or 2) of each of the faces at an
+        array of indices.
+        """
+        indices = np.asarray(indices, np.int64)
+        self._faces[self.face_slots(indices), corners] = vertices
+        self.touch_faces(np.unique(indices))
+
+    def delete_faces(self, indices):
+        """
+        Marks the faces at an array of indices as deleted.
+        """
+        indices = np.asarray(indices, np.int64)
+        self._visible[self.face_slots(indices)] = False
+        self.touch_faces(np.unique(indices))
+
+    def touch_vertices(self, indices):
+        """
+        Reports vertices that moved to the geometry cache, if any.
+        """
+        if self.geometry is not None:
+            self.geometry.invalidate_vertices(indices)
+
+    def touch_faces(self, indices):
+        """
+        Reports faces that were edited to the geometry cache, if any.
+        """
+        if self.geometry is not None:
+            self.geometry.invalidate_faces(indices)
+
+    def get_vertex_index(self, string):
+        """
+        Gets the index (starting at 0) of a vertex from a string representing
+        its index, starting at 1.
+        """
+        index = int(string) - 1
+        if index >= self.nb_vertices:
+            raise VertexError(index + 1, self.line)
+        return index
+
+    def get_face_index(self, string):
+        """
+        Gets the index (starting at 0) of a face from a string representing its
+        index, starting at 1.
+        """
+        index = int(string) - 1
+        if index >= self.nb_faces:
+            raise FaceError(index + 1, self.line)
+        return index
+
+    def test_face(self, indices):
+        """
+        Tests if a face references only vertices that exist when the face is declared.
+        """
+        for index in indices:
+            if index >= self.nb_vertices:
+                raise VertexError(index + 1, self.line)
+
+    def parse_file(self, path):
+        """
+        Parses an OBJA file, or loads a binary objb file.
+
+        The file is memory mapped and parsed PARSE_CHUNK bytes at a time, so
+        that only the arrays of the model grow with its size. They grow by
+        doubling, which costs less than a first pass counting the lines.
+        """
+        if is_binary_file(path):
+            import objb
+            objb.load(path, self)
+            return
+        with open(path, "rb") as file:
+            if file.seek(0, 2) == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                for start, end in line_chunks(data, PARSE_CHUNK):
+                    self.parse_bytes(data[start:end])
+                    release_pages(data, start, end)
+
+    def parse_bytes(self, data):
+        """
+        Parses the content of an OBJA file.
+
+        The v and f lines are converted in bulk. The other instructions depend
+        on the state of the model when they appear, so they are interpreted one
+        by one with parse_line, once the vertices and faces declared before them
+        have been added.
+        """
+        if len(data) == 0:
+            return
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        buffer = np.frombuffer(data, np.uint8)
+        starts, ends = split_lines(buffer)
+        is_vertex, is_face, is_edit = classify_lines(buffer, starts)
+
+        vertices = np.empty((0, 3), np.float64)
+        parsed = parse_numbers(*select_lines(buffer, starts, ends, is_vertex), 3)
+        if parsed is None:
+            is_edit |= is_vertex
+            is_vertex = np.zeros_like(is_vertex)
+        else:
+            numbers, counts = parsed
+            # Lines with less than 3 coordinates raise in parse_line
+            short = np.flatnonzero(is_vertex)[counts < 3]
+            is_edit[short] = True
+            is_vertex[short] = False
+            vertices = gather_rows(numbers, counts, 3)
+
+        faces = np.empty((0, 3), np.int64)
+        face_lines = np.empty((0,), np.int64)
+        parsed = parse_numbers(*select_lines(buffer, starts, ends, is_face), 3, np.int64, strip_slashes = True)
+        if parsed is None:
+            is_edit |= is_face
+        else:
+            faces, triangles = gather_strips(*parsed)
+            faces = faces - 1
+            face_lines = np.repeat(np.flatnonzero(is_face), triangles)
+
+        # Number of vertices declared before each line
+        vertex_counts = np.cumsum(is_vertex)
+        face_vertex_counts = vertex_counts[face_lines]
+        line_offset = self.line
+        # Number of vertices and faces already taken from the bulk arrays
+        added = [0, 0]
+
+        def extend(nb_vertices, nb_faces):
+            self.add_vertices(vertices[added[0]:nb_vertices])
+            added[0] = nb_vertices
+            block = faces[added[1]:nb_faces]
+            limits = face_vertex_counts[added[1]:nb_faces] + self.nb_vertices - added[0]
+            invalid = np.flatnonzero(block.max(axis = 1, initial = -1) >= limits)
+            if len(invalid) > 0:
+                first = invalid[0]
+                self.add_faces(block[:first])
+                self.line = line_offset + face_lines[added[1] + first] + 1
+                raise VertexError(block[first][block[first] >= limits[first]][0] + 1, self.line)
+            self.add_faces(block)
+            added[1] = nb_faces
+
+        for line in np.flatnonzero(is_edit):
+            extend(vertex_counts[line], np.searchsorted(face_lines, line))
+            self.line = line_offset + line
+            self.parse_line(data[starts[line]:ends[line]].decode())
+        extend(len(vertices), len(faces))
+        self.line = line_offset + len(starts)
+
+    def parse_line(self, line):
+        """
+        Parses a line of obja file.
+        """
+        self.line += 1
+
+        split = line.split()
+
+        if len(split) == 0:
+            return
+
+        if split[0] == "v":
+            self.add_vertices(np.array(split[1:4], np.double))
+
+        elif split[0] == "ev":
+            index = self.get_vertex_index(split[1])
+            self._vertices[index] = np.array(split[2:5], np.double)
+            self.touch_vertices([index])
+
+        elif split[0] == "tv":
+            index = self.get_vertex_index(split[1])
+            self._vertices[index] += np.array(split[2:5], np.double)
+            self.touch_vertices([index])
+
+        elif split[0] == "af":
+            pos = int(split[1])
+            self.insert_face(pos - 1, parse_indices(split[2:2+3]))
+
+        elif split[0] == "f" or split[0] == "tf":
+            for i in range(1, len(split) - 2):
+                indices = parse_indices(split[i:i+3])
+                self.test_face(indices)
+                self.add_faces(indices)
+
+        elif split[0] == "ts":
+            for i in range(1, len(split) - 2):
+                if i % 2 == 1:
+                    indices = parse_indices([split[i], split[i + 1], split[i + 2]])
+                else:
+                    indices = parse_indices([split[i], split[i + 2], split[i + 1]])
+                self.test_face(indices)
+                self.add_faces(indices)
+
+        elif split[0] == "ef":
+            face = self.get_face_index(split[1])
+            self.edit_faces([face], [parse_indices(split[2:5])])
+
+        elif split[0] == "efv":
+            face = self.get_face_index(split[1])
+            vector = int(split[2])
+            if vector < 1 or vector > 3:
+                raise FaceVertexError(vector, self.line)
+            self.edit_face_vertices([face], [vector - 1], [int(split[3]) - 1])
+
+        elif split[0] == "df":
+            face = self.get_face_index(split[1])
+            self.delete_faces([face])
+
+        else:
+            return
+
+    def to_model(self):
+        """
+        Converts the model into a list based obja.Model.
+        """
+        model = Model()
+        model.vertices = [vertex.copy() for vertex in self.vertices]
+        model.faces = [Face(int(a), int(b), int(c), bool(visible))
+                       for (a, b, c), visible in zip(self.faces, self.visible)]
+        return model
+
+    @staticmethod
+    def from_model(model):
+        """
+        Creates an array model from a list based obja.Model.
+        """
+        output = ArrayModel(max(len(model.vertices), len(model.faces)))
+        if len(model.vertices) > 0:
+            output.add_vertices(np.array(model.vertices, np.float64))
+        if len(model.faces) > 0:
+            output.add_faces([[face.a, face.b, face.c] for face in model.faces])
+            output._visible[:output.nb_faces] = [face.visible for face in model.faces]
+        return output
+
 def parse_file(path):
     """
     Parses a file and returns the model.
@@ -272,11 +975,125 @@ def parse_file(path):
     model.parse_file(path)
     return model
 
+def parse_array_file(path):
+    """
+    Parses a file and returns the model stored as arrays.
+    """
+    model = ArrayModel()
+    model.parse_file(path)
+    return model
+
+# Number of lines formatted at once by the bulk methods of Output
+OUTPUT_CHUNK = 65536
+
+def mapped_indices(mapping, indices):
+    """
+    Returns the array of mapping[index] + 1 for an array of indices, as the
+    indices of the elements in the obja file.
+    """
+    indices = np.asarray(indices, np.int64).ravel()
+    if len(indices) < 1024 or len(mapping) == 0:
+        return np.array([mapping[index] for index in indices.tolist()], np.int64) + 1
+
+    keys = np.fromiter(mapping.keys(), np.int64, len(mapping))
+    values = np.fromiter(mapping.values(), np.int64, len(mapping))
+    low, high = int(keys.min()), int(keys.max())
+    if high - low < 4 * len(keys):
+        # Compact keys are looked up in a table, holes are marked by -1
+        table = np.full(high - low + 2, -1, np.int64)
+        table[keys - low] = values
+        positions = np.clip(indices - low, -1, high - low + 1)
+        mapped = table[positions]
+        found = mapped >= 0
+    else:
+        order = np.argsort(keys)
+        keys, values = keys[order], values[order]
+        positions = np.minimum(np.searchsorted(keys, indices), len(keys) - 1)
+        mapped = values[positions]
+        found = keys[positions] == indices
+    if not np.all(found):
+        raise KeyError(int(indices[np.argmin(found)]))
+    return mapped + 1
+
+def integer_digits(values):
+    """
+    Returns the (n, w) array of the ASCII digits of non negative integers,
+    right aligned and padded with null bytes.
+    """
+    width = len(str(int(values.max()))) if len(values) > 0 else 1
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype = np.int64)
+    digits = values[:, None] // powers % 10 + ord('0')
+    significant = (values[:, None] >= powers) | (powers == 1)
+    return np.where(significant, digits, 0).astype(np.uint8)
+
+def decimal_digits(values, precision):
+    """
+    Returns the (n, w) array of the ASCII characters of numbers written with
+    precision decimals, as '{:.precisionf}' up to the rounding of the last
+    decimal, padded with null bytes. Returns None if a number is not finite
+    or too large to be rounded exactly.
+    """
+    scale = 10 ** precision
+    scaled = np.rint(np.abs(values) * scale)
+    if not np.all(scaled < 2.0**53):
+        return None
+    scaled = scaled.astype(np.int64)
+    sign = np.where(np.signbit(values), ord('-'), 0).astype(np.uint8)[:, None]
+    columns = [sign, integer_digits(scaled // scale)]
+    if precision > 0:
+        powers = 10 ** np.arange(precision - 1, -1, -1, dtype = np.int64)
+        columns.append(np.full((len(values), 1), ord('.'), np.uint8))
+        columns.append((scaled[:, None] % scale // powers % 10 + ord('0')).astype(np.uint8))
+    return np.concatenate(columns, axis = 1)
+
+def format_lines(instruction, columns, precision = None):
+    """
+    Returns the text of the lines made of an instruction followed by a value
+    of each column, formatted as the characters of whole arrays.
+
+    Integer columns are always formatted this way, float columns only when a
+    precision is given: otherwise, or if a column cannot be formatted this way,
+    the lines are formatted by str.format.
+    """
+    fields = []
+    for column in columns:
+        if np.issubdtype(column.dtype, np.integer) and (len(column) == 0 or column.min() >= 0):
+            fields.append(integer_digits(column.astype(np.int64)))
+        elif np.issubdtype(column.dtype, np.floating) and precision is not None:
+            fields.append(decimal_digits(column, precision))
+        else:
+            fields.append(None)
+
+    if any(field is None for field in fields):
+        number = '{}' if precision is None else '{:.%df}' % precision
+        line = instruction + ''.join(' ' + number if np.issubdtype(column.dtype, np.floating) else ' {}'
+                                     for column in columns) + '\n'
+        values = [value for row in zip(*[column.tolist() for column in columns]) for value in row]
+        return (line * len(columns[0])).format(*values)
+
+    nb_lines = len(columns[0])
+    separator = np.full((nb_lines, 1), ord(' '), np.uint8)
+    parts = [np.frombuffer(instruction.encode(), np.uint8)[None].repeat(nb_lines, axis = 0)]
+    for field in fields:
+        parts += [separator, field]
+    parts.append(np.full((nb_lines, 1), ord('\n'), np.uint8))
+    characters = np.concatenate(parts, axis = 1).ravel()
+    return characters[characters != 0].tobytes().decode('ascii')
+
 class Output:
     """
     The type for a model that outputs as obja.
+
+    Each element can be written with its own method call, or many elements of
+    the same kind at once with the bulk methods (add_vertices, add_faces...),
+    which format OUTPUT_CHUNK lines at a time from whole arrays. Coordinates
+    are written exactly, or with precision decimals if it is given, which is
+    much faster for the bulk methods. If buffer_size is positive, the text is
+    written to the output only once buffer_size characters have been
+    gathered, and flush must be called when done (or the Output used as a
+    context manager).
     """
-    def __init__(self, output, random_color = False):
+    def __init__(self, output, random_color = False, buffer_size = 0, precision = None):
         """
         Initializes the index mapping dictionnaries.
         """
@@ -284,58 +1101,175 @@ class Output:
         self.face_mapping = dict()
         self.output = output
         self.random_color = random_color
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        self.precision = precision
+        number = '{}' if precision is None else '{:.%df}' % precision
+        self.coordinates = ' '.join([number] * 3)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def write(self, text):
+        """
+        Writes text in the output, through the buffer if there is one.
+        """
+        self.written += len(text)
+        if self.buffer_size <= 0:
+            self.output.write(text)
+            return
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered text in the output.
+        """
+        if self.buffer:
+            self.output.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def declare_size(self):
+        """
+        Writes an s line declaring the number of bytes written before it.
+        """
+        self.write('s {}\n'.format(self.written))
+
+    def write_lines(self, instruction, columns):
+        """
+        Writes a line for each row of the columns, OUTPUT_CHUNK lines at a
+        time.
+        """
+        for start in range(0, len(columns[0]), OUTPUT_CHUNK):
+            chunk = [column[start:start + OUTPUT_CHUNK] for column in columns]
+            self.write(format_lines(instruction, chunk, self.precision))
 
     def add_vertex(self, index, vertex):
         """
         Adds a new vertex to the model with the specified index.
         """
         self.vertex_mapping[index] = len(self.vertex_mapping)
-        print('v {} {} {}'.format(vertex[0], vertex[1], vertex[2]), file = self.output)
+        self.write(('v ' + self.coordinates + '\n').format(vertex[0], vertex[1], vertex[2]))
+
+    def add_vertices(self, indices, vertices):
+        """
+        Adds new vertices to the model with the specified indices, from a
+        (n, 3) array of coordinates.
+        """
+        indices = np.asarray(indices).ravel().tolist()
+        start = len(self.vertex_mapping)
+        self.vertex_mapping.update(zip(indices, range(start, start + len(indices))))
+        vertices = np.asarray(vertices, np.float64).reshape(-1, 3)
+        self.write_lines('v', [vertices[:, 0], vertices[:, 1], vertices[:, 2]])
 
     def edit_vertex(self, index, vertex):
         """
         Changes the coordinates of a vertex.
         """
         if len(self.vertex_mapping) == 0:
-            print('ev {} {} {} {}'.format(index, vertex[0], vertex[1],vertex[2]), file = self.output)
+            self.write(('ev {} ' + self.coordinates + '\n').format(index, vertex[0], vertex[1],vertex[2]))
         else:
-            print('ev {} {} {} {}'.format(self.vertex_mapping[index] + 1, vertex[0], vertex[1],vertex[2]), file = self.output)
+            self.write(('ev {} ' + self.coordinates + '\n').format(self.vertex_mapping[index] + 1, vertex[0], vertex[1],vertex[2]))
+
+    def edit_vertices(self, indices, vertices):
+        """
+        Changes the coordinates of vertices, from a (n, 3) array of
+        coordinates.
+        """
+        indices = np.asarray(indices, np.int64).ravel()
+        if len(self.vertex_mapping) > 0:
+            indices = mapped_indices(self.vertex_mapping, indices)
+        vertices = np.asarray(vertices, np.float64).reshape(-1, 3)
+        self.write_lines('ev', [indices, vertices[:, 0], vertices[:, 1], vertices[:, 2]])
 
     def add_face(self, index, face):
         """
         Adds a face to the model.
         """
         self.face_mapping[index] = len(self.face_mapping)
-        print('f {} {} {}'.format(
+        self.write('f {} {} {}\n'.format(
                 self.vertex_mapping[face.a] + 1,
                 self.vertex_mapping[face.b] + 1,
                 self.vertex_mapping[face.c] + 1,
-            ),
-            file = self.output
+            )
         )
 
         if self.random_color:
-            print('fc {} {} {} {}'.format(
+            self.write('fc {} {} {} {}\n'.format(
                 len(self.face_mapping),
                 random.uniform(0, 1),
                 random.uniform(0, 1),
-                random.uniform(0, 1)),
-                file = self.output
+                random.uniform(0, 1))
+            )
+
+    def add_faces(self, indices, faces):
+        """
+        Adds faces to the model with the specified indices, from a (n, 3)
+        array of the indices of their vertices.
+        """
+        indices = np.asarray(indices).ravel().tolist()
+        start = len(self.face_mapping)
+        self.face_mapping.update(zip(indices, range(start, start + len(indices))))
+        faces = mapped_indices(self.vertex_mapping, faces).reshape(-1, 3)
+
+        if not self.random_color:
+            self.write_lines('f', [faces[:, 0], faces[:, 1], faces[:, 2]])
+            return
+
+        # The colours are drawn in the same order as by add_face
+        line = 'f {} {} {}\nfc {} {} {} {}\n'
+        for number, face in enumerate(faces.tolist(), start + 1):
+            self.write(line.format(*face, number, random.uniform(0, 1),
+                                   random.uniform(0, 1), random.uniform(0, 1)))
+
+    def edit_face_vertex(self, index, vertex, vertex_index):
+        """
+        Changes one of the vertices (1, 2 or 3) of the specified face.
+        """
+        self.write('efv {} {} {}\n'.format(
+                self.face_mapping[index] + 1,
+                vertex,
+                self.vertex_mapping[vertex_index] + 1
             )
+        )
+
+    def edit_face_vertices(self, indices, vertices, vertex_indices):
+        """
+        Changes one of the vertices (1, 2 or 3) of each of the specified faces.
+        """
+        self.write_lines('efv', [mapped_indices(self.face_mapping, indices),
+                                 np.asarray(vertices, np.int64).ravel(),
+                                 mapped_indices(self.vertex_mapping, vertex_indices)])
 
     def edit_face(self, index, face):
         """
         Changes the indices of the vertices of the specified face.
         """
-        print('ef {} {} {} {}'.format(
+        self.write('ef {} {} {} {}\n'.format(
                 self.face_mapping[index] + 1,
                 self.vertex_mapping[face.a] + 1,
                 self.vertex_mapping[face.b] + 1,
                 self.vertex_mapping[face.c] + 1
-            ),
-            file = self.output
+            )
         )
 
+    def edit_faces(self, indices, faces):
+        """
+        Changes the indices of the vertices of the specified faces, from a
+        (n, 3) array.
+        """
+        faces = mapped_indices(self.vertex_mapping, faces).reshape(-1, 3)
+        self.write_lines('ef', [mapped_indices(self.face_mapping, indices),
+                                faces[:, 0], faces[:, 1], faces[:, 2]])
+
 def main():
     if len(sys.argv) == 1:
         print("obja needs a path to an obja file")
@@ -0,0 +1,713 @@
+#!/usr/bin/env python3
+
+"""
+Binary encoding of the obja instruction stream.
+
+An objb file holds the same instructions as an obja file, as blocks of fixed
+size little endian records. The file starts with a header:
+
+    magic     4 bytes   b'OBJB'
+    version   uint16
+    flags     uint16    bit 0 set if the coordinates are float64
+    blocks    uint32    number of blocks
+    vertices  uint64    number of v records
+    faces     uint64    number of f and af records
+    records   uint64    number of records
+    reserved  uint32
+
+and each block is a run of records of the same instruction:
+
+    opcode    uint32    index of the instruction in INSTRUCTIONS
+    count     uint32    number of records
+    records   count * the size of a record of the instruction
+
+The records (see FIELDS) hold vertex, face and corner indices starting at 0 as
+uint32, and coordinates and colours as float32, or float64 if the flag is set.
+A block can be read as a numpy record array pointing into the file, without
+parsing or copying anything. Strips, fans and polygons are stored as
+triangles, comments are dropped.
+"""
+
+import mmap
+import struct
+import sys
+import numpy as np
+import obja
+
+MAGIC = b'OBJB'
+
+VERSION = 1
+
+DOUBLE = 1
+
+HEADER = struct.Struct('<4sHHIQQQI')
+
+BLOCK = struct.Struct('<II')
+
+INSTRUCTIONS = ['v', 'f', 'ev', 'tv', 'af', 'ef', 'efv', 'df', 'fc', 's']
+
+# Fields of the records of each instruction: name, type and width. The
+# coordinate type depends on the file.
+FIELDS = {
+    'v': [('position', 'float', 3)],
+    'f': [('vertices', '<u4', 3)],
+    'ev': [('vertex', '<u4', 1), ('position', 'float', 3)],
+    'tv': [('vertex', '<u4', 1), ('translation', 'float', 3)],
+    'af': [('face', '<u4', 1), ('vertices', '<u4', 3)],
+    'ef': [('face', '<u4', 1), ('vertices', '<u4', 3)],
+    'efv': [('face', '<u4', 1), ('corner', '<u4', 1), ('vertex', '<u4', 1)],
+    'df': [('face', '<u4', 1)],
+    'fc': [('face', '<u4', 1), ('color', 'float', 3)],
+    's': [('size', '<u8', 1)],
+}
+
+# Maximum number of records of a block
+MAX_BLOCK = 2**32 - 1
+
+def record_dtype(instruction, double = False):
+    """
+    Returns the numpy type of the records of an instruction.
+    """
+    fields = []
+    for name, kind, width in FIELDS[instruction]:
+        if kind == 'float':
+            kind = '<f8' if double else '<f4'
+        fields.append((name, kind, (width,)) if width > 1 else (name, kind))
+    return np.dtype(fields)
+
+def make_records(instruction, values, double = False):
+    """
+    Builds the records of an instruction from a (n, k) array holding the
+    values of their fields side by side.
+    """
+    dtype = record_dtype(instruction, double)
+    values = np.asarray(values).reshape(-1, sum(width for _, _, width in FIELDS[instruction]))
+    records = np.empty(len(values), dtype)
+    column = 0
+    for name, kind, width in FIELDS[instruction]:
+        field = values[:, column:column + width]
+        if kind != 'float':
+            if np.any(field < 0) or np.any(field >= np.iinfo(kind).max):
+                raise ValueError("{} index out of range in {} instruction".format(name, instruction))
+        records[name] = field if width > 1 else field[:, 0]
+        column += width
+    return records
+
+def make_blocks(blocks, double = False):
+    """
+    Builds the records of (instruction, values) blocks, those of all the
+    blocks of an instruction at once, and returns the (instruction, records)
+    blocks.
+    """
+    result = [None] * len(blocks)
+    for instruction in set(instruction for instruction, _ in blocks):
+        selected = [i for i, (elt, _) in enumerate(blocks) if elt == instruction]
+        records = make_records(instruction, np.concatenate([blocks[i][1] for i in selected]), double)
+        bounds = np.cumsum([len(blocks[i][1]) for i in selected])[:-1]
+        for i, part in zip(selected, np.split(records, bounds)):
+            result[i] = (instruction, part)
+    return result
+
+def line_values(split):
+    """
+    Returns the instruction and the record values of a split obja line, or
+    None if the line holds no instruction. A strip, a fan or a polygon gives
+    the values of several records.
+    """
+    instruction = split[0]
+    if instruction == 'v':
+        if len(split) < 4:
+            raise ValueError("vertex with less than 3 coordinates")
+        return 'v', [[float(value) for value in split[1:4]]]
+    elif instruction == 'f' or instruction == 'tf':
+        return 'f', [obja.parse_indices(split[i:i+3]) for i in range(1, len(split) - 2)]
+    elif instruction == 'ts':
+        return 'f', [obja.parse_indices([split[i], split[i + 1], split[i + 2]] if i % 2 == 1
+                                        else [split[i], split[i + 2], split[i + 1]])
+                     for i in range(1, len(split) - 2)]
+    elif instruction == 'ev' or instruction == 'tv':
+        return instruction, [[int(split[1]) - 1] + [float(value) for value in split[2:5]]]
+    elif instruction == 'af' or instruction == 'ef':
+        return instruction, [[int(split[1]) - 1] + obja.parse_indices(split[2:5])]
+    elif instruction == 'efv':
+        return 'efv', [[int(split[1]) - 1, int(split[2]) - 1, int(split[3]) - 1]]
+    elif instruction == 'df':
+        return 'df', [[int(split[1]) - 1]]
+    elif instruction == 'fc':
+        return 'fc', [[int(split[1]) - 1] + [float(value) for value in split[2:5]]]
+    elif instruction == 's':
+        return 's', [[int(split[1])]]
+    return None
+
+def parse_blocks(data):
+    """
+    Parses the content of an obja file into a list of (instruction, values)
+    blocks, values being the (n, k) array of the fields of the n records of
+    the block (see make_records).
+
+    As in obja.ArrayModel.parse_bytes, the v and f lines are converted in
+    bulk and the other lines one by one.
+    """
+    if len(data) == 0:
+        return []
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    buffer = np.frombuffer(data, np.uint8)
+    starts, ends = obja.split_lines(buffer)
+    is_vertex, is_face, _ = obja.classify_lines(buffer, starts)
+
+    vertices = np.empty((0, 3), np.float64)
+    parsed = obja.parse_numbers(*obja.select_lines(buffer, starts, ends, is_vertex), 3)
+    if parsed is None or np.any(parsed[1] < 3):
+        is_vertex = np.zeros_like(is_vertex)
+    else:
+        vertices = obja.gather_rows(*parsed, 3)
+
+    faces = np.empty((0, 3), np.int64)
+    triangles = np.empty(0, np.int64)
+    parsed = obja.parse_numbers(*obja.select_lines(buffer, starts, ends, is_face), 3, np.int64,
+                                strip_slashes = True)
+    if parsed is None:
+        is_face = np.zeros_like(is_face)
+    else:
+        faces, triangles = obja.gather_strips(*parsed)
+        faces = faces - 1
+
+    # The other lines holding something else than white space
+    solid = np.cumsum(~obja.WHITESPACE[buffer])
+    others = solid[ends] - np.where(starts > 0, solid[starts - 1], 0) > 0
+    others &= ~is_vertex & ~is_face
+
+    # Bulk lines in consecutive lines of the same kind, one line at a time otherwise
+    kinds = np.where(is_vertex, 0, np.where(is_face, 1, 2))[is_vertex | is_face | others]
+    lines = np.flatnonzero(is_vertex | is_face | others)
+    bounds = np.flatnonzero(np.diff(kinds, prepend = -1, append = -1))
+    face_offsets = np.concatenate(([0], np.cumsum(triangles)))
+
+    blocks = []
+    def append(instruction, values):
+        if blocks and blocks[-1][0] == instruction:
+            blocks[-1][1].append(values)
+        else:
+            blocks.append((instruction, [values]))
+
+    nb_vertices = nb_face_lines = 0
+    for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        if kinds[first] == 0:
+            append('v', vertices[nb_vertices:nb_vertices + last - first])
+            nb_vertices += last - first
+        elif kinds[first] == 1:
+            append('f', faces[face_offsets[nb_face_lines]:face_offsets[nb_face_lines + last - first]])
+            nb_face_lines += last - first
+        else:
+            # Rows of consecutive lines of the same instruction are gathered first
+            instruction, rows = None, []
+            for line in lines[first:last].tolist():
+                parsed = line_values(data[starts[line]:ends[line]].decode().split())
+                if parsed is None:
+                    continue
+                if parsed[0] != instruction:
+                    if rows:
+                        append(instruction, np.array(rows))
+                    instruction, rows = parsed[0], []
+                rows += parsed[1]
+            if rows:
+                append(instruction, np.array(rows))
+
+    return [(instruction, np.concatenate(values) if len(values) > 1 else values[0])
+            for instruction, values in blocks]
+
+def single_precision(blocks):
+    """
+    Tells whether the coordinates and colours of blocks of values are written
+    the same when stored as float32, that is if their shortest float32
+    representation reads back as the same number.
+    """
+    for instruction, values in blocks:
+        if any(kind == 'float' for _, kind, _ in FIELDS[instruction]):
+            for start in range(0, len(values), obja.OUTPUT_CHUNK):
+                floats = np.asarray(values[start:start + obja.OUTPUT_CHUNK, -3:], np.float64)
+                if not np.array_equal(floats.astype(np.float32).astype(str).astype(np.float64), floats):
+                    return False
+    return True
+
+def write_blocks(output, blocks, double = None):
+    """
+    Writes blocks of values (see parse_blocks) in a binary file. The
+    coordinates are stored as float64 if double is set, and as float32 if it
+    is not. By default, float32 is used only if it represents the coordinates
+    exactly (see single_precision).
+    """
+    if double is None:
+        double = not single_precision(blocks)
+
+    chunks = []
+    for instruction, records in make_blocks(blocks, double):
+        for start in range(0, len(records), MAX_BLOCK):
+            chunks.append((instruction, records[start:start + MAX_BLOCK]))
+
+    nb_vertices = sum(len(records) for instruction, records in chunks if instruction == 'v')
+    nb_faces = sum(len(records) for instruction, records in chunks if instruction in ('f', 'af'))
+    nb_records = sum(len(records) for _, records in chunks)
+    output.write(HEADER.pack(MAGIC, VERSION, DOUBLE if double else 0, len(chunks),
+                             nb_vertices, nb_faces, nb_records, 0))
+    for instruction, records in chunks:
+        output.write(BLOCK.pack(INSTRUCTIONS.index(instruction), len(records)))
+        output.write(records.tobytes())
+
+def is_binary(data):
+    """
+    Tells whether bytes start like an objb file.
+    """
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+def read_header(data):
+    """
+    Returns the header of an objb file as a dictionnary.
+    """
+    if len(data) < HEADER.size or not is_binary(data):
+        raise ValueError("not an objb file")
+    _, version, flags, nb_blocks, nb_vertices, nb_faces, nb_records, _ = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError("unsupported objb version {}".format(version))
+    return {
+        'double': bool(flags & DOUBLE),
+        'blocks': nb_blocks,
+        'vertices': nb_vertices,
+        'faces': nb_faces,
+        'records': nb_records,
+    }
+
+def block_positions(opcodes, counts):
+    """
+    Returns the position in the stream of the first record of each block, and
+    the numbers of v and f records before it, from the opcodes and numbers
+    of records of the blocks.
+    """
+    positions = np.cumsum(counts) - counts
+    vertices = np.where(opcodes == INSTRUCTIONS.index('v'), counts, 0)
+    faces = np.where(opcodes == INSTRUCTIONS.index('f'), counts, 0)
+    return positions, np.cumsum(vertices) - vertices, np.cumsum(faces) - faces
+
+class Stream:
+    """
+    The blocks of an objb file, indexed without reading their records.
+
+    The block i holds counts[i] records of INSTRUCTIONS[opcodes[i]], starting
+    at the byte offsets[i] of the data, and its first record is the record
+    positions[i] of the stream. nb_vertices[i] and nb_faces[i] are the numbers
+    of v and f records before it.
+    """
+    def __init__(self, data):
+        """
+        Reads the header and the block headers of the content of an objb
+        file, which can be any buffer, a memory mapping for example.
+        """
+        self.data = data
+        self.header = read_header(data)
+        self.dtypes = [record_dtype(instruction, self.header['double']) for instruction in INSTRUCTIONS]
+        sizes = [dtype.itemsize for dtype in self.dtypes]
+
+        nb_blocks = self.header['blocks']
+        opcodes = [0] * nb_blocks
+        counts = [0] * nb_blocks
+        offsets = [0] * nb_blocks
+        offset = HEADER.size
+        for i in range(nb_blocks):
+            if offset + BLOCK.size > len(data):
+                raise ValueError("truncated objb file")
+            opcode, count = BLOCK.unpack_from(data, offset)
+            if opcode >= len(INSTRUCTIONS):
+                raise ValueError("unknown objb opcode {}".format(opcode))
+            offset += BLOCK.size
+            opcodes[i], counts[i], offsets[i] = opcode, count, offset
+            offset += count * sizes[opcode]
+        if offset > len(data):
+            raise ValueError("truncated objb file")
+
+        self.opcodes = np.array(opcodes, np.int64)
+        self.counts = np.array(counts, np.int64)
+        self.offsets = np.array(offsets, np.int64)
+        self.positions, self.nb_vertices, self.nb_faces = block_positions(self.opcodes, self.counts)
+
+    def __len__(self):
+        """
+        Returns the number of blocks.
+        """
+        return len(self.opcodes)
+
+    def block(self, i):
+        """
+        Returns the instruction of a block and its records, as a numpy record
+        array pointing into the data.
+        """
+        opcode = self.opcodes[i]
+        return INSTRUCTIONS[opcode], np.frombuffer(self.data, self.dtypes[opcode],
+                                                   self.counts[i], self.offsets[i])
+
+    def blocks(self):
+        """
+        Returns the list of the (instruction, records) blocks.
+        """
+        return [self.block(i) for i in range(len(self))]
+
+    def gather(self, instruction):
+        """
+        Returns the records of all the blocks of an instruction concatenated,
+        the position of each of them in the stream and the index of its block.
+        """
+        opcode = INSTRUCTIONS.index(instruction)
+        dtype = self.dtypes[opcode]
+        selected = np.flatnonzero(self.opcodes == opcode)
+        counts = self.counts[selected]
+        firsts = np.cumsum(counts) - counts
+        if len(selected) == 1:
+            records = self.block(selected[0])[1]
+        elif len(selected) <= obja.MAX_COPIED_RUNS:
+            records = np.concatenate([self.block(i)[1] for i in selected] + [np.empty(0, dtype)])
+        else:
+            # Many small blocks are copied record by record in one go
+            starts = np.repeat(self.offsets[selected] - firsts * dtype.itemsize, counts)
+            starts += np.arange(counts.sum()) * dtype.itemsize
+            data = np.frombuffer(self.data, np.uint8)
+            records = data[starts[:, None] + np.arange(dtype.itemsize)].view(dtype)[:, 0]
+        positions = np.repeat(self.positions[selected] - firsts, counts) + np.arange(counts.sum())
+        return records, positions, np.repeat(selected, counts)
+
+class BlockList:
+    """
+    A list of (instruction, records) blocks held in memory, indexed as the
+    blocks of a Stream.
+    """
+    def __init__(self, blocks):
+        """
+        Indexes a list of blocks.
+        """
+        self.list = blocks
+        self.opcodes = np.array([INSTRUCTIONS.index(instruction) for instruction, _ in blocks], np.int64)
+        self.counts = np.array([len(records) for _, records in blocks], np.int64)
+        self.positions, self.nb_vertices, self.nb_faces = block_positions(self.opcodes, self.counts)
+
+    def __len__(self):
+        """
+        Returns the number of blocks.
+        """
+        return len(self.list)
+
+    def block(self, i):
+        """
+        Returns the instruction of a block and its records.
+        """
+        return self.list[i]
+
+    def blocks(self):
+        """
+        Returns the list of the (instruction, records) blocks.
+        """
+        return self.list
+
+    def gather(self, instruction):
+        """
+        Returns the records of all the blocks of an instruction concatenated,
+        the position of each of them in the list and the index of its block.
+        """
+        selected = np.flatnonzero(self.opcodes == INSTRUCTIONS.index(instruction))
+        counts = self.counts[selected]
+        if len(selected) == 0:
+            records = np.empty(0, record_dtype(instruction))
+        else:
+            records = np.concatenate([self.list[i][1] for i in selected.tolist()])
+        firsts = np.cumsum(counts) - counts
+        positions = np.repeat(self.positions[selected] - firsts, counts) + np.arange(counts.sum())
+        return records, positions, np.repeat(selected, counts)
+
+def read_blocks(data):
+    """
+    Returns the header of an objb file and the list of its (instruction,
+    records) blocks, the records being numpy record arrays pointing into data.
+    """
+    stream = Stream(data)
+    return stream.header, stream.blocks()
+
+def last_occurrences(keys):
+    """
+    Returns the sorted positions of the last occurrence of each key.
+    """
+    _, positions = np.unique(keys[::-1], return_index = True)
+    return np.sort(len(keys) - 1 - positions)
+
+def face_error(records, nb_vertices):
+    """
+    Returns the mask of the f records using a vertex past nb_vertices (an
+    array, or a number for all of them), the first such vertex of each record
+    and the exception it raises.
+    """
+    vertices = records['vertices']
+    outside = vertices >= np.reshape(nb_vertices, (-1, 1))
+    first = vertices[np.arange(len(vertices)), np.argmax(outside, axis = 1)]
+    return np.any(outside, axis = 1), first, obja.VertexError
+
+def invalid_record(model, instruction, records):
+    """
+    Returns the position of the first record of a block that cannot be
+    applied to a model and the exception parse_line raises for it, or None if
+    every record is valid.
+    """
+    if instruction == 'f':
+        errors = [face_error(records, model.nb_vertices)]
+    elif instruction == 'ev' or instruction == 'tv':
+        errors = [(records['vertex'] >= model.nb_vertices, records['vertex'], obja.VertexError)]
+    elif instruction == 'ef' or instruction == 'efv' or instruction == 'df':
+        errors = [(records['face'] >= model.nb_faces, records['face'], obja.FaceError)]
+        if instruction == 'efv':
+            errors.append((records['corner'] > 2, records['corner'], obja.FaceVertexError))
+    else:
+        return None
+
+    invalid = np.zeros(len(records), bool)
+    for mask, _, _ in errors:
+        invalid |= mask
+    if not np.any(invalid):
+        return None
+    position = int(np.argmax(invalid))
+    for mask, values, error in errors:
+        if mask[position]:
+            return position, error(int(values[position]) + 1, model.line + position + 1)
+
+def apply_records(model, instruction, records):
+    """
+    Applies a block of valid records to a model, as a whole.
+    """
+    if instruction == 'v':
+        model.add_vertices(records['position'])
+
+    elif instruction == 'f':
+        model.add_faces(records['vertices'].astype(np.int64))
+
+    elif instruction == 'ev' or instruction == 'tv':
+        vertices = records['vertex'].astype(np.int64)
+        if instruction == 'ev':
+            last = last_occurrences(vertices)
+            model.vertices[vertices[last]] = records['position'][last]
+        else:
+            np.add.at(model.vertices, vertices, records['translation'].astype(np.float64))
+        model.touch_vertices(np.unique(vertices))
+
+    elif instruction == 'af':
+        for position, (face, vertices) in enumerate(zip(records['face'].tolist(),
+                                                        records['vertices'].tolist())):
+            if face > model.nb_faces:
+                model.line += position + 1
+                raise obja.FaceError(face + 1, model.line)
+            model.insert_face(face, vertices)
+
+    elif instruction == 'ef' or instruction == 'efv' or instruction == 'df':
+        faces = records['face'].astype(np.int64)
+        if instruction == 'ef':
+            last = last_occurrences(faces)
+            model.edit_faces(faces[last], records['vertices'][last])
+        elif instruction == 'efv':
+            corners = records['corner'].astype(np.int64)
+            last = last_occurrences(faces * 3 + corners)
+            model.edit_face_vertices(faces[last], corners[last], records['vertex'][last])
+        else:
+            model.delete_faces(faces)
+
+    model.line += len(records)
+
+# Instructions whose effect depends on the state of the model when they appear
+ORDERED = ('tv', 'af')
+
+def apply_blocks(model, blocks):
+    """
+    Applies blocks of records to an obja.ArrayModel, a whole block at a time.
+
+    The model ends as if the instructions had been parsed one by one. An
+    invalid index raises the same exception as obja.ArrayModel.parse_line,
+    after the records before it have been applied, model.line being the
+    number of the record (starting at 1).
+    """
+    for instruction, records in blocks:
+        invalid = invalid_record(model, instruction, records)
+        if invalid is not None:
+            position, error = invalid
+            apply_records(model, instruction, records[:position])
+            model.line += 1
+            raise error
+        apply_records(model, instruction, records)
+
+def apply_stream(model, stream):
+    """
+    Applies the blocks of a Stream or a BlockList none of which is ORDERED to
+    a model at once.
+
+    The vertices and faces are only appended, so an index always designates
+    the same element, and the vertices and faces end with the last value an
+    ev, ef or efv record gave them. The validity of each record is checked
+    against the number of vertices and faces declared before its block.
+    """
+    gathered = {}
+    for instruction in ('v', 'f', 'ev', 'ef', 'efv', 'df'):
+        records, positions, blocks = stream.gather(instruction)
+        gathered[instruction] = (records, positions, model.nb_vertices + stream.nb_vertices[blocks],
+                                 model.nb_faces + stream.nb_faces[blocks])
+
+    # The first invalid record, if any, and the exception it raises
+    checks = []
+    records, positions, vertices, _ = gathered['f']
+    checks.append((positions,) + face_error(records, vertices))
+    records, positions, vertices, _ = gathered['ev']
+    checks.append((positions, records['vertex'] >= vertices, records['vertex'], obja.VertexError))
+    for instruction in ('ef', 'efv', 'df'):
+        records, positions, _, faces = gathered[instruction]
+        checks.append((positions, records['face'] >= faces, records['face'], obja.FaceError))
+    records, positions, _, faces = gathered['efv']
+    checks.append((positions, (records['corner'] > 2) & (records['face'] < faces),
+                   records['corner'], obja.FaceVertexError))
+
+    end = int(stream.counts.sum())
+    error = None
+    for positions, invalid, values, exception in checks:
+        if np.any(invalid):
+            first = int(np.argmax(invalid))
+            if positions[first] < end:
+                end = int(positions[first])
+                error = exception(int(values[first]) + 1, model.line + end + 1)
+
+    def kept(instruction):
+        records, positions, _, _ = gathered[instruction]
+        count = np.searchsorted(positions, end)
+        return records[:count], positions[:count]
+
+    model.add_vertices(kept('v')[0]['position'])
+    model.add_faces(kept('f')[0]['vertices'].astype(np.int64))
+
+    records = kept('ev')[0]
+    vertices = records['vertex'].astype(np.int64)
+    last = last_occurrences(vertices)
+    model.vertices[vertices[last]] = records['position'][last]
+    model.touch_vertices(np.unique(vertices))
+
+    # Corners edited by ef and efv records, in the order of the stream
+    (ef, ef_positions), (efv, efv_positions) = kept('ef'), kept('efv')
+    corner_faces = np.concatenate((np.repeat(ef['face'], 3), efv['face'])).astype(np.int64)
+    corners = np.concatenate((np.tile(np.arange(3), len(ef)), efv['corner'])).astype(np.int64)
+    corner_vertices = np.concatenate((ef['vertices'].ravel(), efv['vertex']))
+    order = np.argsort(np.concatenate((np.repeat(ef_positions, 3), efv_positions)), kind = 'stable')
+    last = order[last_occurrences((corner_faces * 3 + corners)[order])]
+    model.edit_face_vertices(corner_faces[last], corners[last], corner_vertices[last])
+    model.delete_faces(kept('df')[0]['face'])
+
+    model.line += end
+    if error is not None:
+        model.line += 1
+        raise error
+
+def map_file(path):
+    """
+    Returns a read only memory mapping of a file. It is closed once nothing
+    points into it anymore, the records read from it included.
+    """
+    with open(path, 'rb') as file:
+        if file.seek(0, 2) == 0:
+            raise ValueError("not an objb file")
+        return mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+
+def load(path, model = None):
+    """
+    Loads an objb file in an obja.ArrayModel (a new one by default) and returns
+    it. The file is memory mapped and its records copied straight into the
+    arrays of the model, all at once if no instruction is ORDERED and a block
+    at a time otherwise.
+    """
+    if model is None:
+        model = obja.ArrayModel()
+    stream = Stream(map_file(path))
+    model.reserve_vertices(stream.header['vertices'])
+    model.reserve_faces(stream.header['faces'])
+    if np.any(np.isin(stream.opcodes, [INSTRUCTIONS.index(instruction) for instruction in ORDERED])):
+        apply_blocks(model, stream.blocks())
+    else:
+        apply_stream(model, stream)
+    return model
+
+def text_columns(instruction, records):
+    """
+    Returns the columns of the obja lines of records: indices start at 1 and
+    float32 numbers are written with their shortest representation, so that
+    encoding the text again gives the same records.
+    """
+    columns = []
+    for name, kind, width in FIELDS[instruction]:
+        field = records[name].reshape(len(records), width)
+        for i in range(width):
+            column = field[:, i]
+            if column.dtype == np.float32:
+                column = column.astype(str)
+            elif np.issubdtype(column.dtype, np.integer):
+                column = column.astype(np.int64) + (kind == '<u4')
+            columns.append(column)
+    return columns
+
+def write_text(output, stream):
+    """
+    Writes the records of a Stream as obja text.
+
+    The records of each instruction are formatted together, OUTPUT_CHUNK
+    lines at a time, and their lines put back in the order of the stream.
+    """
+    gathered = [stream.gather(instruction) for instruction in INSTRUCTIONS]
+    nb_records = int(stream.counts.sum())
+    for start in range(0, nb_records, obja.OUTPUT_CHUNK):
+        end = min(start + obja.OUTPUT_CHUNK, nb_records)
+        lines = [None] * (end - start)
+        for instruction, (records, positions, _) in zip(INSTRUCTIONS, gathered):
+            first, last = np.searchsorted(positions, [start, end])
+            if first == last:
+                continue
+            text = obja.format_lines(instruction, text_columns(instruction, records[first:last]))
+            for position, line in zip((positions[first:last] - start).tolist(), text.splitlines(True)):
+                lines[position] = line
+        output.write(''.join(lines))
+
+def obja_to_objb(input_path, output_path, double = None):
+    """
+    Converts an obja file into an objb file.
+    """
+    with open(input_path, 'rb') as file:
+        blocks = parse_blocks(file.read())
+    with open(output_path, 'wb') as output:
+        write_blocks(output, blocks, double)
+
+def objb_to_obja(input_path, output_path):
+    """
+    Converts an objb file into an obja file.
+    """
+    stream = Stream(map_file(input_path))
+    with open(output_path, 'w') as output:
+        write_text(output, stream)
+
+def main(args = None):
+    """
+    Converts the file given as first parameter into the file given as second
+    parameter, from obja to objb or back depending on the first bytes of the
+    input. When encoding, --single or --double forces the type of the
+    coordinates.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    double = True if '--double' in args else False if '--single' in args else None
+    args = [arg for arg in args if arg not in ('--single', '--double')]
+    if len(args) != 2:
+        print("usage: objb.py [--single|--double] input output", file = sys.stderr)
+        sys.exit(1)
+
+    with open(args[0], 'rb') as file:
+        binary = is_binary(file.read(len(MAGIC)))
+    if binary:
+        objb_to_obja(args[0], args[1])
+    else:
+        obja_to_objb(args[0], args[1], double)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+
+"""
+Simplification of a mesh by quadric error metrics (Garland and Heckbert,
+Surface simplification using quadric error metrics, 1997).
+"""
+
+import os
+import sys
+import numpy as np
+import obja
+import lod
+from geometry import face_normals
+from adjacency import DynamicAdjacency
+from mesh import CollapseRecord, Mesh, write_progressive
+from scheduler import CollapseQueue
+
+# Weight of the planes keeping the boundary edges in place
+BOUNDARY_WEIGHT = 1000.0
+
+def face_planes(vertices, faces):
+    """
+    Returns the (F, 4) array of the planes (a, b, c, d) of the faces, with
+    (a, b, c) a unit normal, and of zeros for degenerate faces.
+    """
+    normals = face_normals(vertices, faces)
+    lengths = np.linalg.norm(normals, axis = 1)
+    normals[lengths > 0] /= lengths[lengths > 0, None]
+    offsets = -np.sum(normals * vertices[faces[:, 0]], axis = 1)
+    return np.column_stack((normals, offsets))
+
+def scatter_quadrics(indices, planes, nb_vertices, weight = 1.0):
+    """
+    Returns the (N, 4, 4) sums of the quadrics pp^T of the planes p over the
+    vertices they are attached to, indices[i] being the vertices of planes[i].
+    """
+    quadrics = (weight * planes[:, :, None] * planes[:, None, :]).reshape(-1, 16)
+    counts = indices.shape[1]
+    indices = indices.ravel()
+    return np.stack([np.bincount(indices, np.repeat(quadrics[:, k], counts), nb_vertices)
+                     for k in range(16)], axis = 1).reshape(-1, 4, 4)
+
+def mesh_edges(faces, nb_vertices):
+    """
+    Returns the (E, 2) array of the edges of faces, each one once with its
+    smallest vertex first, and the number of faces around each edge.
+    """
+    edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    keys = np.sort(np.minimum(edges[:, 0], edges[:, 1]) * nb_vertices
+                   + np.maximum(edges[:, 0], edges[:, 1]))
+    first = np.ones(len(keys), bool)
+    first[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(first)
+    counts = np.diff(np.append(starts, len(keys)))
+    return np.stack(np.divmod(keys[starts], nb_vertices), axis = 1).reshape(-1, 2), counts
+
+def boundary_edges(faces):
+    """
+    Returns the (E, 2) array of the edges that belong to one face only, as
+    ordered in their face, and the index of that face.
+    """
+    edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    nb_vertices = int(faces.max()) + 1 if len(faces) > 0 else 0
+    keys = np.minimum(edges[:, 0], edges[:, 1]) * nb_vertices + np.maximum(edges[:, 0], edges[:, 1])
+    order = np.argsort(keys, kind = 'stable')
+    sorted_keys = keys[order]
+    single = np.ones(len(keys), bool)
+    single[1:] &= sorted_keys[1:] != sorted_keys[:-1]
+    single[:-1] &= sorted_keys[:-1] != sorted_keys[1:]
+    positions = order[single]
+    return edges[positions], positions // 3
+
+def vertex_quadrics(vertices, faces, boundary_weight = BOUNDARY_WEIGHT):
+    """
+    Returns the (N, 4, 4) quadrics of the vertices: the sum of the quadrics of
+    the planes of the faces around them, plus the quadrics of planes
+    orthogonal to the boundary edges, weighted by boundary_weight.
+    """
+    planes = face_planes(vertices, faces)
+    quadrics = scatter_quadrics(faces, planes, len(vertices))
+
+    if boundary_weight > 0 and len(faces) > 0:
+        edges, edge_faces = boundary_edges(faces)
+        directions = vertices[edges[:, 1]] - vertices[edges[:, 0]]
+        normals = np.cross(directions, planes[edge_faces, :3])
+        lengths = np.linalg.norm(normals, axis = 1)
+        normals[lengths > 0] /= lengths[lengths > 0, None]
+        offsets = -np.sum(normals * vertices[edges[:, 0]], axis = 1)
+        quadrics += scatter_quadrics(edges, np.column_stack((normals, offsets)),
+                                     len(vertices), boundary_weight)
+
+    return quadrics
+
+def normal(ux, uy, uz, vx, vy, vz):
+    """
+    Returns the cross product of two vectors given by their coordinates.
+    """
+    return (uy*vz - uz*vy, uz*vx - ux*vz, ux*vy - uy*vx)
+
+def quadric_errors(quadrics, positions):
+    """
+    Returns v^T Q v for each quadric Q and homogeneous position v.
+    """
+    homogeneous = np.column_stack((positions, np.ones(len(positions))))
+    errors = np.einsum('ni,nij,nj->n', homogeneous, quadrics, homogeneous)
+    return np.maximum(errors, 0)
+
+def optimal_positions(quadrics, first, second):
+    """
+    Returns the positions minimizing the quadrics of edges and their errors.
+
+    The minimum is found by solving the symmetric 3x3 system of each quadric
+    with Cramer's rule, and is taken among the two ends and the middle of the
+    edge when the system is singular.
+    """
+    a00, a01, a02 = quadrics[:, 0, 0], quadrics[:, 0, 1], quadrics[:, 0, 2]
+    a11, a12, a22 = quadrics[:, 1, 1], quadrics[:, 1, 2], quadrics[:, 2, 2]
+    b = -quadrics[:, :3, 3]
+    cofactors = np.stack((a11*a22 - a12*a12, a02*a12 - a01*a22, a01*a12 - a02*a11,
+                          a02*a12 - a01*a22, a00*a22 - a02*a02, a01*a02 - a00*a12,
+                          a01*a12 - a02*a11, a01*a02 - a00*a12, a00*a11 - a01*a01),
+                         axis = 1).reshape(-1, 3, 3)
+    determinants = a00*cofactors[:, 0, 0] + a01*cofactors[:, 0, 1] + a02*cofactors[:, 0, 2]
+    # Relative test, so that the scale of the mesh does not matter
+    scales = np.maximum(np.maximum(np.abs(a00), np.abs(a11)), np.abs(a22))
+    solvable = np.abs(determinants) > 1e-9 * scales**3
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        positions = np.einsum('nij,nj->ni', cofactors, b) / determinants[:, None]
+    errors = np.where(solvable, quadric_errors(quadrics, np.where(solvable[:, None], positions, 0)), np.inf)
+
+    singular = np.flatnonzero(~solvable)
+    if len(singular) > 0:
+        for candidate in (first[singular], second[singular], (first[singular] + second[singular]) / 2):
+            candidate_errors = quadric_errors(quadrics[singular], candidate)
+            better = candidate_errors < errors[singular]
+            positions[singular[better]] = candidate[better]
+            errors[singular[better]] = candidate_errors[better]
+
+    return positions, errors
+
+def quadric_error(q, x, y, z):
+    """
+    Returns v^T Q v for a quadric given as a flat list of its 16 coefficients
+    and the homogeneous position v = (x, y, z, 1).
+    """
+    error = (q[0]*x*x + q[5]*y*y + q[10]*z*z + q[15]
+             + 2*(q[1]*x*y + q[2]*x*z + q[6]*y*z + q[3]*x + q[7]*y + q[11]*z))
+    return max(error, 0.0)
+
+def optimal_position(q, first, second):
+    """
+    Returns the position minimizing the quadric of an edge and its error, as
+    optimal_positions, for a quadric given as a flat list of its 16
+    coefficients. Plain float arithmetic is much cheaper than numpy for the
+    few edges evaluated after each collapse.
+    """
+    a00, a01, a02, b0 = q[0], q[1], q[2], -q[3]
+    a11, a12, b1 = q[5], q[6], -q[7]
+    a22, b2 = q[10], -q[11]
+    c00 = a11*a22 - a12*a12
+    c01 = a02*a12 - a01*a22
+    c02 = a01*a12 - a02*a11
+    determinant = a00*c00 + a01*c01 + a02*c02
+    scale = max(abs(a00), abs(a11), abs(a22))
+    if abs(determinant) > 1e-9 * scale**3:
+        c11 = a00*a22 - a02*a02
+        c12 = a01*a02 - a00*a12
+        c22 = a00*a11 - a01*a01
+        position = [(c00*b0 + c01*b1 + c02*b2) / determinant,
+                    (c01*b0 + c11*b1 + c12*b2) / determinant,
+                    (c02*b0 + c12*b1 + c22*b2) / determinant]
+        return position, quadric_error(q, *position)
+
+    best, best_error = None, float('inf')
+    middle = [(u + v) / 2 for u, v in zip(first, second)]
+    for candidate in (first, second, middle):
+        error = quadric_error(q, *candidate)
+        if error < best_error:
+            best, best_error = candidate, error
+    return best, best_error
+
+def saliency_factors(saliency, weight):
+    """
+    Returns the factors 1 + weight * s of the quadrics, with s the saliency of
+    the vertices scaled to [0, 1]. Vertices of infinite saliency get the
+    largest factor.
+    """
+    saliency = np.asarray(saliency, np.float64)
+    finite = np.isfinite(saliency)
+    scaled = np.ones(len(saliency))
+    if np.any(finite):
+        lowest, highest = saliency[finite].min(), saliency[finite].max()
+        if highest > lowest:
+            scaled[finite] = (saliency[finite] - lowest) / (highest - lowest)
+        else:
+            scaled[finite] = 0
+    return 1 + weight * scaled
+
+def initial_quadrics(mesh, saliency, saliency_weight, boundary_weight):
+    """
+    Returns the quadrics of the vertices of a mesh, scaled by
+    saliency_factors(saliency, saliency_weight) if the saliency is given.
+    """
+    quadrics = vertex_quadrics(mesh.vertices, mesh.faces[mesh.visible], boundary_weight)
+    if saliency is not None and saliency_weight > 0:
+        quadrics *= saliency_factors(saliency, saliency_weight)[:, None, None]
+    return quadrics
+
+class QuadricDecimater:
+    """
+    Simplifies a mesh.Mesh by collapsing its edges in increasing order of
+    quadric error.
+
+    Each edge is collapsed to the position minimizing the sum of the quadrics
+    of its ends. The candidate edges are kept in a CollapseQueue, and only the
+    edges around the kept vertex are evaluated again after a collapse. A
+    collapse is skipped if it would make the mesh non manifold or flip a face.
+    """
+    def __init__(self, mesh, saliency = None, saliency_weight = 0.0,
+                 boundary_weight = BOUNDARY_WEIGHT, quadrics = None):
+        """
+        Computes the quadrics of a mesh and the cost of all its edges.
+
+        If the saliency of the vertices is given, their quadrics are scaled by
+        saliency_factors(saliency, saliency_weight), so that salient regions
+        are simplified later. The quadrics of a mesh already simplified can
+        be given instead, and are then updated in place.
+        """
+        self.mesh = mesh
+        if quadrics is None:
+            quadrics = initial_quadrics(mesh, saliency, saliency_weight, boundary_weight)
+        self.quadrics = quadrics
+        self.records = []
+
+        edges, _ = mesh_edges(mesh.faces[mesh.visible], len(mesh.vertices))
+        positions, errors = self.evaluate(edges)
+        edges = [tuple(edge) for edge in edges.tolist()]
+        self.positions = dict(zip(edges, positions.tolist()))
+        self.queue = CollapseQueue(zip(edges, errors.tolist()))
+
+    def evaluate(self, edges):
+        """
+        Returns the optimal positions and errors of a (E, 2) array of edges.
+        """
+        edges = np.asarray(edges, np.int64).reshape(-1, 2)
+        quadrics = self.quadrics[edges[:, 0]] + self.quadrics[edges[:, 1]]
+        return optimal_positions(quadrics, self.mesh.vertices[edges[:, 0]],
+                                 self.mesh.vertices[edges[:, 1]])
+
+    def update(self, kept, neighbours):
+        """
+        Evaluates again the edges from the vertex kept to its neighbours, and
+        pushes them in the queue.
+        """
+        vertices = self.mesh.vertices[[kept] + neighbours].tolist()
+        quadrics = (self.quadrics[neighbours] + self.quadrics[kept]).reshape(-1, 16).tolist()
+        for neighbour, quadric, vertex in zip(neighbours, quadrics, vertices[1:]):
+            edge = (kept, neighbour) if kept < neighbour else (neighbour, kept)
+            if kept < neighbour:
+                position, error = optimal_position(quadric, vertices[0], vertex)
+            else:
+                position, error = optimal_position(quadric, vertex, vertices[0])
+            self.positions[edge] = position
+            self.queue.push(edge, error)
+
+    def neighbours(self, vertex):
+        """
+        Returns the set of the vertices sharing a face with a vertex.
+        """
+        faces = self.mesh.adjacency.vertex_faces[vertex]
+        neighbours = set(self.mesh.faces[list(faces)].ravel().tolist())
+        neighbours.discard(vertex)
+        return neighbours
+
+    def can_collapse(self, kept, removed, position, kept_neighbours, removed_neighbours):
+        """
+        Tells whether collapsing an edge to position keeps the mesh manifold
+        and the orientation of its faces.
+        """
+        vertex_faces = self.mesh.adjacency.vertex_faces
+        shared = vertex_faces[kept] & vertex_faces[removed]
+        if not shared:
+            return False
+
+        # Link condition: the common neighbours are the opposite vertices
+        opposite = set(self.mesh.faces[list(shared)].ravel().tolist())
+        opposite.discard(kept)
+        opposite.discard(removed)
+        if kept_neighbours & removed_neighbours != opposite:
+            return False
+
+        around = list((vertex_faces[kept] | vertex_faces[removed]) - shared)
+        if not around:
+            return True
+        faces = self.mesh.faces[around]
+        moved = ((faces == kept) | (faces == removed)).tolist()
+        for points, flags in zip(self.mesh.vertices[faces].tolist(), moved):
+            (ax, ay, az), (bx, by, bz), (cx, cy, cz) = points
+            before = normal(bx - ax, by - ay, bz - az, cx - ax, cy - ay, cz - az)
+            points = [position if flag else point for point, flag in zip(points, flags)]
+            (ax, ay, az), (bx, by, bz), (cx, cy, cz) = points
+            after = normal(bx - ax, by - ay, bz - az, cx - ax, cy - ay, cz - az)
+            if before[0]*after[0] + before[1]*after[1] + before[2]*after[2] <= 0:
+                return False
+        return True
+
+    def decimate(self, target_faces):
+        """
+        Collapses edges until the mesh has at most target_faces visible faces
+        or no edge can be collapsed, and returns the records of the collapses.
+        """
+        nb_faces = int(np.count_nonzero(self.mesh.visible))
+        while nb_faces > target_faces and len(self.queue) > 0:
+            (kept, removed), _ = self.queue.pop()
+            position = self.positions.pop((kept, removed))
+            kept_neighbours = self.neighbours(kept)
+            removed_neighbours = self.neighbours(removed)
+            if not self.can_collapse(kept, removed, position, kept_neighbours, removed_neighbours):
+                continue
+
+            for neighbour in removed_neighbours:
+                edge = (removed, neighbour) if removed < neighbour else (neighbour, removed)
+                self.queue.remove(edge)
+                self.positions.pop(edge, None)
+
+            record = self.mesh.collapse(kept, removed, position)
+            self.quadrics[kept] += self.quadrics[removed]
+            nb_faces -= len(record.removed_faces)
+            self.records.append(record)
+
+            neighbours = (kept_neighbours | removed_neighbours) - {kept, removed}
+            neighbours = [neighbour for neighbour in neighbours
+                          if self.mesh.adjacency.vertex_faces[neighbour]
+                          & self.mesh.adjacency.vertex_faces[kept]]
+            if neighbours:
+                self.update(kept, neighbours)
+
+        return self.records
+
+class BatchQuadricDecimater:
+    """
+    Simplifies a mesh.Mesh by collapsing its edges in rounds of independent
+    collapses, each round being computed on whole arrays.
+
+    An edge is collapsed in a round when its quadric error is the smallest of
+    all the edges around its ends and their neighbours, so that the collapses
+    of a round touch disjoint sets of faces. This trades the strict order of
+    QuadricDecimater for far fewer Python operations on large meshes. When
+    the collapses of a round would all go past the target number of faces,
+    a QuadricDecimater finishes the simplification.
+    """
+    def __init__(self, mesh, saliency = None, saliency_weight = 0.0,
+                 boundary_weight = BOUNDARY_WEIGHT):
+        """
+        Computes the quadrics of a mesh, as QuadricDecimater.
+        """
+        self.mesh = mesh
+        self.quadrics = initial_quadrics(mesh, saliency, saliency_weight, boundary_weight)
+        self.records = []
+        # Keys of the edges that could not be collapsed since the last
+        # collapses around them
+        self.rejected = np.empty(0, np.int64)
+
+    def select(self, edges, errors):
+        """
+        Returns the indices of the edges that are the cheapest of their
+        neighbourhood, by increasing error.
+        """
+        nb_vertices = len(self.mesh.vertices)
+        ranks = np.empty(len(edges), np.int64)
+        ranks[np.argsort(errors)] = np.arange(len(edges))
+        ranks[~np.isfinite(errors)] = len(edges)
+
+        lowest = np.full(nb_vertices, len(edges), np.int64)
+        np.minimum.at(lowest, edges[:, 0], ranks)
+        np.minimum.at(lowest, edges[:, 1], ranks)
+        around = lowest.copy()
+        np.minimum.at(around, edges[:, 0], lowest[edges[:, 1]])
+        np.minimum.at(around, edges[:, 1], lowest[edges[:, 0]])
+
+        selected = (ranks < len(edges)) & (ranks == around[edges[:, 0]]) & (ranks == around[edges[:, 1]])
+        selected = np.flatnonzero(selected)
+        return selected[np.argsort(ranks[selected])]
+
+    def check(self, faces, all_edges, edges, counts, boundary, positions):
+        """
+        Returns the mask of the independent collapses of edges to positions
+        that keep the mesh manifold and the orientation of its faces.
+        """
+        nb_vertices = len(self.mesh.vertices)
+        owners = np.full(nb_vertices, -1, np.int64)
+        owners[edges[:, 0]] = np.arange(len(edges))
+        owners[edges[:, 1]] = np.arange(len(edges))
+
+        # Manifold edges only, not joining two boundaries through the inside
+        valid = (counts <= 2) & ~(boundary[edges[:, 0]] & boundary[edges[:, 1]] & (counts == 2))
+
+        # Link condition: as many common neighbours as faces around the edge
+        pairs = []
+        for end, other in ((0, 1), (1, 0)):
+            owned = owners[all_edges[:, end]]
+            keep = (owned >= 0) & (all_edges[:, other] != edges[np.maximum(owned, 0), 0]) \
+                & (all_edges[:, other] != edges[np.maximum(owned, 0), 1])
+            pairs.append(owned[keep] * nb_vertices + all_edges[keep, other])
+        keys = np.sort(np.concatenate(pairs))
+        common = keys[1:][keys[1:] == keys[:-1]] // nb_vertices
+        valid &= np.bincount(common, minlength = len(edges)) == counts
+
+        # No face flips
+        corners = owners[faces]
+        touched = np.flatnonzero(np.any(corners >= 0, axis = 1))
+        corners = corners[touched]
+        owner = corners.max(axis = 1)
+        moved = corners >= 0
+        around = np.sum(moved, axis = 1) == 1
+        points = self.mesh.vertices[faces[touched[around]]]
+        before = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+        points[moved[around]] = positions[owner[around]]
+        after = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+        flipped = np.einsum('ij,ij->i', before, after) <= 0
+        valid &= np.bincount(owner[around][flipped], minlength = len(edges)) == 0
+        return valid
+
+    def collapse(self, live, edges, positions):
+        """
+        Collapses independent edges, the second vertex of each edge into the
+        first one, and appends their records. The visible faces are given by
+        their indices live.
+        """
+        mesh = self.mesh
+        kept, removed = edges[:, 0], edges[:, 1]
+        records = [CollapseRecord(a, b, kept_position, removed_position)
+                   for a, b, kept_position, removed_position
+                   in zip(kept.tolist(), removed.tolist(), mesh.vertices[kept], mesh.vertices[removed])]
+
+        owners = np.full(len(mesh.vertices), -1, np.int64)
+        owners[kept] = np.arange(len(edges))
+        owners[removed] = np.arange(len(edges))
+        corners = owners[mesh.faces[live]]
+        touched = np.any(corners >= 0, axis = 1)
+        faces = live[touched]
+        owner = corners[touched].max(axis = 1)
+        is_removed = mesh.faces[faces] == removed[owner][:, None]
+        shared = np.any(mesh.faces[faces] == kept[owner][:, None], axis = 1) & np.any(is_removed, axis = 1)
+
+        # Faces grouped by collapse, by increasing index as in Mesh.collapse
+        edited, corner = np.nonzero(is_removed & ~shared[:, None])
+        for name, rows, values in (('removed_faces', np.flatnonzero(shared), mesh.faces[faces[shared]].tolist()),
+                                   ('edited_faces', edited, corner.tolist())):
+            order = np.argsort(owner[rows], kind = 'stable')
+            entries = list(zip(faces[rows].tolist(), values))
+            entries = [entries[index] for index in order.tolist()]
+            bounds = np.searchsorted(owner[rows][order], np.arange(len(edges) + 1)).tolist()
+            for record, start, end in zip(records, bounds[:-1], bounds[1:]):
+                setattr(record, name, entries[start:end])
+
+        mesh.visible[faces[shared]] = False
+        mesh.faces[faces[edited], corner] = kept[owner[edited]]
+        mesh.vertices[kept] = positions
+        mesh.removed[removed] = True
+        self.quadrics[kept] += self.quadrics[removed]
+        self.records.extend(records)
+
+    def decimate(self, target_faces):
+        """
+        Collapses edges until the mesh has at most target_faces visible faces
+        or no edge can be collapsed, and returns the records of the collapses.
+        """
+        mesh = self.mesh
+        nb_vertices = len(mesh.vertices)
+        nb_faces = int(np.count_nonzero(mesh.visible))
+        # Edges of the previous round, by increasing key, and their evaluation
+        keys = np.empty(0, np.int64)
+        positions = np.empty((0, 3))
+        errors = np.empty(0)
+        moved = np.zeros(nb_vertices, bool)
+        # Whether the last collapses remove more faces than left to the target
+        finish = False
+        while nb_faces > target_faces:
+            live = np.flatnonzero(mesh.visible)
+            faces = mesh.faces[live]
+            edges, counts = mesh_edges(faces, nb_vertices)
+            boundary = np.zeros(nb_vertices, bool)
+            boundary[edges[counts == 1].ravel()] = True
+
+            # Only the edges that are new or around a moved vertex are evaluated
+            previous_keys, previous_positions, previous_errors = keys, positions, errors
+            keys = edges[:, 0] * nb_vertices + edges[:, 1]
+            matches = np.minimum(np.searchsorted(previous_keys, keys), max(len(previous_keys) - 1, 0))
+            stale = moved[edges[:, 0]] | moved[edges[:, 1]]
+            if len(previous_keys) > 0:
+                stale |= previous_keys[matches] != keys
+                positions = previous_positions[matches]
+                errors = previous_errors[matches]
+            else:
+                stale[:] = True
+                positions = np.empty((len(edges), 3))
+                errors = np.empty(len(edges))
+            stale = np.flatnonzero(stale)
+            quadrics = self.quadrics[edges[stale, 0]] + self.quadrics[edges[stale, 1]]
+            positions[stale], errors[stale] = optimal_positions(quadrics, mesh.vertices[edges[stale, 0]],
+                                                                mesh.vertices[edges[stale, 1]])
+            candidates = errors.copy()
+            candidates[np.isin(keys, self.rejected)] = np.inf
+
+            selected = self.select(edges, candidates)
+            if len(selected) == 0:
+                break
+            valid = self.check(faces, edges, edges[selected], counts[selected], boundary, positions[selected])
+            self.rejected = np.union1d(self.rejected, keys[selected[~valid]])
+            selected = selected[valid]
+
+            # Stop at the target number of faces
+            removed_faces = np.cumsum(counts[selected])
+            selected = selected[:np.searchsorted(removed_faces, nb_faces - target_faces, 'right')]
+            if len(selected) == 0:
+                if np.any(valid):
+                    finish = True
+                    break
+                continue
+
+            self.collapse(live, edges[selected], positions[selected])
+            nb_faces -= int(counts[selected].sum())
+            moved[:] = False
+            moved[edges[selected].ravel()] = True
+
+            # The collapses change the neighbourhoods and positions the edges
+            # around them were checked against, which may now be collapsed
+            around = np.zeros(nb_vertices, bool)
+            around[faces[np.any(moved[faces], axis = 1)].ravel()] = True
+            self.rejected = self.rejected[~(around[self.rejected // nb_vertices] |
+                                            around[self.rejected % nb_vertices])]
+
+        mesh.adjacency = DynamicAdjacency(mesh.faces, nb_vertices, mesh.visible)
+        if mesh.geometry is not None:
+            mesh.geometry.refresh()
+        if finish:
+            # The few faces left are removed one collapse at a time
+            decimater = QuadricDecimater(mesh, quadrics = self.quadrics)
+            self.records.extend(decimater.decimate(target_faces))
+        return self.records
+
+def decimate(model, ratio, saliency = None, saliency_weight = 0.0, batched = False, faces = None):
+    """
+    Simplifies an obja model to ratio times its number of faces, or to faces
+    faces if given, and returns the simplified mesh.Mesh and the records of
+    its collapses.
+
+    The collapses are done in rounds by a BatchQuadricDecimater if batched is
+    set, and one at a time by a QuadricDecimater otherwise.
+    """
+    mesh = Mesh.from_model(model)
+    decimater = (BatchQuadricDecimater if batched else QuadricDecimater)(mesh, saliency, saliency_weight)
+    if faces is None:
+        faces = int(ratio * np.count_nonzero(mesh.visible))
+    records = decimater.decimate(faces)
+    return mesh, records
+
+def simplify_file(input_path, output_path, ratio = 0.1, saliency_weight = 0.0, batched = False,
+                  faces = None, workers = None, cache = None):
+    """
+    Simplifies the model of a file (see decimate) and writes the progressive
+    obja and the index of its levels of detail (see lod.py). The saliency, if
+    weighted, is computed by workers processes (see
+    saliency.parallel_saliency).
+
+    The obja is written aside and renamed once complete, so that an
+    interrupted simplification leaves no partial output. With a cache.Cache,
+    the obja, its index and the saliency are looked up by the hash of the
+    model and of the parameters before being computed, and stored afterwards.
+    """
+    model = obja.parse_array_file(input_path)
+
+    files = {'model.obja': output_path, 'model.obja.lod': lod.index_path(output_path)}
+    if cache is not None:
+        from cache import cache_key, mesh_key
+        mesh_hash = mesh_key(model)
+        key = cache_key(mesh_hash, ratio = ratio, faces = faces, saliency_weight = saliency_weight,
+                        batched = batched, r = 2, bins = 25)
+        if cache.fetch(key, files):
+            return
+
+    saliency = None
+    if saliency_weight > 0:
+        from adjacency import Adjacency
+        from saliency import compute_curvatures, parallel_saliency
+        if cache is not None:
+            # The saliency does not depend on the parameters of the decimation
+            saliency_key = cache_key(mesh_hash, r = 2, bins = 25)
+            saliency = cache.get_array(saliency_key, 'saliency')
+        if saliency is None:
+            adjacency = Adjacency.from_model(model)
+            curvatures = compute_curvatures(model.vertices, adjacency)
+            saliency = parallel_saliency(model.vertices, adjacency, curvatures, 2, 25, workers = workers)
+            if cache is not None:
+                cache.put_array(saliency_key, 'saliency', saliency)
+
+    mesh, records = decimate(model, ratio, saliency, saliency_weight, batched, faces)
+    temporary = output_path + '.tmp'
+    with open(temporary, 'w') as output:
+        write_progressive(output, mesh, records)
+    os.replace(temporary, output_path)
+    lod.build_index(output_path)
+    if cache is not None:
+        cache.put(key, files)
+
+def main(args = None):
+    """
+    Simplifies the model given as first parameter and writes the progressive
+    obja in the file given as second parameter. The optional third parameter
+    is the ratio of faces to keep (0.1 by default), and the fourth one the
+    weight of the saliency in the cost of the collapses (0 by default). The
+    --batched option collapses the edges in rounds, which is much faster on
+    large models. The index of the levels of detail of the output is written
+    next to it (see lod.py). The --cache option reuses the results of the
+    same simplification of the same model (see cache.py).
+    """
+    if args is None:
+        args = sys.argv[1:]
+    batched = '--batched' in args
+    cached = '--cache' in args
+    args = [arg for arg in args if arg not in ('--batched', '--cache')]
+    if len(args) < 2:
+        print("usage: qem.py [--batched] [--cache] input.obj output.obja [ratio] [saliency_weight]",
+              file = sys.stderr)
+        sys.exit(1)
+
+    ratio = float(args[2]) if len(args) > 2 else 0.1
+    saliency_weight = float(args[3]) if len(args) > 3 else 0.0
+    cache = None
+    if cached:
+        from cache import Cache
+        cache = Cache()
+    simplify_file(args[0], args[1], ratio, saliency_weight, batched, cache = cache)
+
+if __name__ == '__main__':
+    main()
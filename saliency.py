@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+"""
+Vectorized kernels of the mesh saliency computation.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
+import numpy as np
+from adjacency import Adjacency, DynamicAdjacency
+from geometry import face_areas
+
+def edge_arrays(adjacency, indices = None):
+    """
+    Returns the (rows, cols) arrays of the edges going from the given vertices
+    (all of them by default) to each of their neighbours.
+    """
+    if indices is None:
+        if isinstance(adjacency, DynamicAdjacency):
+            adjacency = adjacency.to_adjacency()
+        valences = adjacency.valences()
+        rows = np.repeat(np.arange(adjacency.nb_vertices), valences)
+        return rows, adjacency.ring_indices
+
+    neighbours = [adjacency.neighbours(index) for index in indices]
+    rows = np.repeat(np.asarray(indices, np.int64), [len(elt) for elt in neighbours])
+    cols = np.concatenate(neighbours + [np.empty(0, np.int64)]).astype(np.int64)
+    return rows, cols
+
+def curvature_kernel(vertices, rows, cols, indices):
+    """
+    Returns the curvature of the given vertices from the edges leaving them.
+
+    The curvature of vertex i with neighbours N is
+    |sum over j in N of (v_i - v_j / |v_j - v_i|)| / |N|, and 0 if i has no
+    neighbour.
+    """
+    # Sums are scattered into the rank of each row among the indices
+    ranks = np.searchsorted(indices, rows)
+    lengths = np.linalg.norm(vertices[cols] - vertices[rows], axis = 1)
+    terms = vertices[rows] - vertices[cols] / lengths[:, None]
+    sums = np.stack([np.bincount(ranks, terms[:, k], len(indices)) for k in range(3)], axis = 1)
+    counts = np.bincount(ranks, minlength = len(indices))
+    curvatures = np.zeros(len(indices))
+    connected = counts > 0
+    curvatures[connected] = np.linalg.norm(sums[connected], axis = 1) / counts[connected]
+    return curvatures
+
+def compute_curvatures(vertices, adjacency):
+    """
+    Returns the curvature of every vertex, computed in one pass over the edges
+    of the mesh.
+    """
+    vertices = np.asarray(vertices, np.float64)
+    rows, cols = edge_arrays(adjacency)
+    return curvature_kernel(vertices, rows, cols, np.arange(len(vertices)))
+
+def update_curvatures(curvatures, vertices, adjacency, indices):
+    """
+    Recomputes in place the curvature of the given vertices only, and returns
+    the curvatures.
+    """
+    indices = np.unique(np.asarray(indices, np.int64))
+    rows, cols = edge_arrays(adjacency, indices)
+    curvatures[indices] = curvature_kernel(np.asarray(vertices, np.float64), rows, cols, indices)
+    return curvatures
+
+def vertex_areas(vertices, adjacency, indices = None):
+    """
+    Returns a third of the area of the faces around the given vertices (all of
+    them by default).
+    """
+    vertices = np.asarray(vertices, np.float64)
+    if indices is None:
+        if isinstance(adjacency, DynamicAdjacency):
+            adjacency = adjacency.to_adjacency()
+        rows = np.repeat(np.arange(adjacency.nb_vertices), np.diff(adjacency.face_offsets))
+        faces = adjacency.face_indices
+        size = adjacency.nb_vertices
+    else:
+        around = [adjacency.faces(index) for index in indices]
+        rows = np.repeat(np.arange(len(around)), [len(elt) for elt in around])
+        faces = np.concatenate(around + [np.empty(0, np.int64)]).astype(np.int64)
+        size = len(around)
+    areas = face_areas(vertices, adjacency.face_array[faces])
+    return np.bincount(rows, areas, size) / 3
+
+def ring_arrays(adjacency, indices, r):
+    """
+    Returns the vertices at most r edges away from each of the given vertices,
+    themselves excluded, as (offsets, members) arrays in compressed sparse row
+    form.
+    """
+    indices = np.asarray(indices, np.int64)
+    if isinstance(adjacency, DynamicAdjacency):
+        rings = [np.sort(adjacency.ring(index, r)) for index in indices.tolist()]
+        offsets = np.zeros(len(rings) + 1, np.int64)
+        np.cumsum([len(ring) for ring in rings], out = offsets[1:])
+        return offsets, np.concatenate(rings + [np.empty(0, np.int64)]).astype(np.int64)
+
+    # Pairs (row, vertex) grown one ring at a time through the neighbours
+    rows = np.arange(len(indices))
+    members = indices
+    valences = adjacency.valences()
+    for _ in range(r):
+        counts = valences[members]
+        firsts = np.cumsum(counts) - counts
+        positions = np.repeat(adjacency.ring_offsets[members] - firsts, counts) + np.arange(counts.sum())
+        rows = np.concatenate((rows, np.repeat(rows, counts)))
+        members = np.concatenate((members, adjacency.ring_indices[positions]))
+        keys = np.sort(rows * adjacency.nb_vertices + members)
+        first = np.ones(len(keys), bool)
+        first[1:] = keys[1:] != keys[:-1]
+        rows, members = np.divmod(keys[first], adjacency.nb_vertices)
+
+    outside = members != indices[rows]
+    rows, members = rows[outside], members[outside]
+    offsets = np.zeros(len(indices) + 1, np.int64)
+    np.cumsum(np.bincount(rows, minlength = len(indices)), out = offsets[1:])
+    return offsets, members
+
+def entropy_kernel(offsets, curvatures, areas, bins):
+    """
+    Returns the entropy of the curvature of each neighbourhood, given the
+    curvature and area of their members in compressed sparse row form.
+
+    As in compute_entropy, the curvatures of a neighbourhood are sampled with
+    bins values from their minimum to their maximum, each member is binned to
+    the largest sample below its curvature, and the probability of a sample is
+    the area of the members binned to a sample within 0.1 % of it over the area
+    of the neighbourhood. An empty neighbourhood has an entropy of 0.
+    """
+    counts = np.diff(offsets)
+    nb_rows = len(counts)
+    rows = np.repeat(np.arange(nb_rows), counts)
+    nonempty = counts > 0
+
+    minima = np.zeros(nb_rows)
+    maxima = np.zeros(nb_rows)
+    minima[nonempty] = np.minimum.reduceat(curvatures, offsets[:-1][nonempty])
+    maxima[nonempty] = np.maximum.reduceat(curvatures, offsets[:-1][nonempty])
+    sigmas = np.linspace(minima, maxima, bins, axis = 1)
+
+    binned = np.sum(sigmas[rows] <= curvatures[:, None], axis = 1) - 1
+    bin_areas = np.bincount(rows * bins + binned, areas, nb_rows * bins).reshape(nb_rows, bins)
+    total_areas = np.bincount(rows, areas, nb_rows)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        # match[i, j, k]: the samples j and k of neighbourhood i are the same
+        match = np.abs(sigmas[:, :, None] - sigmas[:, None, :]) / sigmas[:, None, :] <= 1e-3
+        p = np.einsum('ij,ijk->ik', bin_areas, match) / total_areas[:, None]
+        terms = np.where(p > 1e-8, p*np.log2(p), 0)
+    return -np.sum(terms, axis = 1)
+
+SALIENCY_CHUNK = 16384
+
+def compute_saliency(vertices, adjacency, curvatures, r, bins, indices = None, areas = None):
+    """
+    Returns the entropy of the curvature over the r-ring of the given vertices
+    (all of them by default), weighted by the vertex areas.
+
+    The vertex areas of the whole mesh may be given, otherwise they are
+    computed once, for the whole mesh when many vertices are asked for and for
+    the vertices in their rings only otherwise. The vertices are processed in
+    chunks to bound memory.
+    """
+    vertices = np.asarray(vertices, np.float64)
+    curvatures = np.asarray(curvatures, np.float64)
+    if indices is None:
+        indices = np.arange(len(vertices))
+    indices = np.asarray(indices, np.int64)
+
+    if 8 * len(indices) > len(vertices):
+        if isinstance(adjacency, DynamicAdjacency):
+            adjacency = adjacency.to_adjacency()
+        if areas is None:
+            areas = vertex_areas(vertices, adjacency)
+
+    saliency = np.zeros(len(indices))
+    for start in range(0, len(indices), SALIENCY_CHUNK):
+        chunk = indices[start:start + SALIENCY_CHUNK]
+        saliency[start:start + len(chunk)] = chunk_saliency(vertices, adjacency, curvatures, areas,
+                                                            chunk, r, bins)
+    return saliency
+
+def chunk_saliency(vertices, adjacency, curvatures, areas, chunk, r, bins):
+    """
+    Returns the saliency of a chunk of vertices, the areas of the vertices in
+    their rings being computed from the vertices if areas is None.
+    """
+    offsets, members = ring_arrays(adjacency, chunk, r)
+    if areas is None:
+        unique, inverse = np.unique(members, return_inverse = True)
+        member_areas = vertex_areas(vertices, adjacency, unique)[inverse]
+    else:
+        member_areas = areas[members]
+    return entropy_kernel(offsets, curvatures[members], member_areas, bins)
+
+# Arrays shared with a worker process of parallel_saliency, and their memory
+WORKER = {}
+
+def attach_arrays(specs, nb_vertices):
+    """
+    Initializes a worker process of parallel_saliency: maps the arrays shared
+    by the parent process, given as name: (memory name, shape, type).
+    """
+    for name, (memory, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(memory)
+        WORKER[name] = np.ndarray(shape, dtype, buffer = block.buf)
+        WORKER.setdefault('blocks', []).append(block)
+    adjacency = Adjacency.__new__(Adjacency)
+    adjacency.nb_vertices = nb_vertices
+    adjacency.ring_offsets = WORKER['ring_offsets']
+    adjacency.ring_indices = WORKER['ring_indices']
+    WORKER['adjacency'] = adjacency
+
+def saliency_task(start, end, r, bins):
+    """
+    Computes in a worker process the saliency of the shared indices between
+    start and end, into the shared saliency array.
+    """
+    chunk = WORKER['indices'][start:end]
+    WORKER['saliency'][start:end] = chunk_saliency(None, WORKER['adjacency'], WORKER['curvatures'],
+                                                   WORKER['areas'], chunk, r, bins)
+    return end - start
+
+def parallel_saliency(vertices, adjacency, curvatures, r, bins, indices = None, areas = None,
+                      workers = None):
+    """
+    Returns the same saliency as compute_saliency, the chunks of vertices
+    being spread over a pool of workers processes (one per processor by
+    default).
+
+    The neighbour index, curvatures, vertex areas and indices are put in
+    shared memory once and mapped by the workers, which write the saliency of
+    their chunks in a shared array: each task only receives the bounds of its
+    chunk, and the result does not depend on the order the tasks end in.
+    """
+    vertices = np.asarray(vertices, np.float64)
+    if indices is None:
+        indices = np.arange(len(vertices))
+    indices = np.asarray(indices, np.int64)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(indices) <= SALIENCY_CHUNK:
+        return compute_saliency(vertices, adjacency, curvatures, r, bins, indices, areas)
+
+    if isinstance(adjacency, DynamicAdjacency):
+        adjacency = adjacency.to_adjacency()
+    if areas is None:
+        areas = vertex_areas(vertices, adjacency)
+    arrays = {
+        'ring_offsets': adjacency.ring_offsets,
+        'ring_indices': adjacency.ring_indices,
+        'curvatures': np.asarray(curvatures, np.float64),
+        'areas': np.asarray(areas, np.float64),
+        'indices': indices,
+        'saliency': np.zeros(len(indices)),
+    }
+
+    # A few chunks per worker, so that they end about together
+    size = min(SALIENCY_CHUNK, -(-len(indices) // (4 * workers)))
+    starts = list(range(0, len(indices), size))
+    ends = starts[1:] + [len(indices)]
+
+    blocks = []
+    try:
+        specs = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer = block.buf)[...] = array
+            specs[name] = (block.name, array.shape, array.dtype.str)
+        with ProcessPoolExecutor(workers, initializer = attach_arrays,
+                                 initargs = (specs, adjacency.nb_vertices)) as pool:
+            for _ in pool.map(saliency_task, starts, ends, repeat(r), repeat(bins)):
+                pass
+        return np.ndarray(len(indices), np.float64, buffer = blocks[-1].buf).copy()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
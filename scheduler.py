@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+Priority queue scheduling the collapses of a simplification.
+"""
+
+import heapq
+import itertools
+
+class CollapseQueue:
+    """
+    A priority queue of collapse candidates (vertices, edges...) keyed on their
+    cost.
+
+    Changing the cost of a candidate pushes a new entry stamped with a new
+    version instead of searching the heap for the old one. Outdated entries are
+    skipped lazily when they reach the top of the heap, so every operation
+    costs O(log n).
+    """
+    def __init__(self, costs = ()):
+        """
+        Creates a queue from (candidate, cost) pairs.
+        """
+        self.counter = itertools.count()
+        self.stamps = dict()
+        self.heap = []
+        for item, cost in costs:
+            stamp = next(self.counter)
+            self.stamps[item] = stamp
+            self.heap.append((cost, stamp, item))
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        """
+        Returns the number of candidates in the queue.
+        """
+        return len(self.stamps)
+
+    def __contains__(self, item):
+        return item in self.stamps
+
+    def push(self, item, cost):
+        """
+        Adds a candidate to the queue, or changes its cost.
+        """
+        stamp = next(self.counter)
+        self.stamps[item] = stamp
+        heapq.heappush(self.heap, (cost, stamp, item))
+        if len(self.heap) > 2 * len(self.stamps) + 1024:
+            self._compact()
+
+    def _compact(self):
+        """
+        Rebuilds the heap from its up to date entries only.
+        """
+        self.heap = [entry for entry in self.heap if self.stamps.get(entry[2]) == entry[1]]
+        heapq.heapify(self.heap)
+
+    def remove(self, item):
+        """
+        Removes a candidate from the queue, if it is in it.
+        """
+        self.stamps.pop(item, None)
+
+    def _discard_outdated(self):
+        """
+        Pops the outdated entries from the top of the heap.
+        """
+        while self.heap and self.stamps.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+    def peek(self):
+        """
+        Returns the (candidate, cost) pair of lowest cost without removing it.
+        """
+        self._discard_outdated()
+        if not self.heap:
+            raise IndexError("peek from an empty queue")
+        cost, _, item = self.heap[0]
+        return item, cost
+
+    def pop(self):
+        """
+        Removes and returns the (candidate, cost) pair of lowest cost.
+        """
+        self._discard_outdated()
+        if not self.heap:
+            raise IndexError("pop from an empty queue")
+        cost, _, item = heapq.heappop(self.heap)
+        del self.stamps[item]
+        return item, cost
@@ -31,10 +31,116 @@ import re
 import cgi
 import threading
 import socket
+import select
 import errno
+from collections import OrderedDict
+import assets
+import lod
+import variants
 
 DATA_DIR = getcwd()
 
+# Number of files kept open between range requests
+OPEN_FILES = 64
+
+# Size of the chunks copied when os.sendfile cannot be used
+COPY_CHUNK = 64*1024
+
+
+class SharedFile(object):
+    """ A file kept open by OpenFiles, with the number of requests using it.
+    """
+
+    def __init__(self, f, fs, key):
+        self.file = f
+        self.stat = fs
+        self.key = key
+        self.users = 0
+        self.cached = True
+
+    def fileno(self):
+        return self.file.fileno()
+
+
+class OpenFiles(object):
+    """ The files most recently served by range requests, kept open between
+    requests so that the many small ranges fetched by the viewer do not
+    reopen them.
+
+    The files are shared by the threads of the server, so they must only be
+    read with positional reads (os.sendfile, os.pread). Each request using a
+    file holds it from open() to release(), and a file dropped from the
+    cache, or replaced because it changed on disk, is closed by the last
+    release(), or at once if no request uses it.
+    """
+
+    def __init__(self, capacity=OPEN_FILES):
+        self.capacity = capacity
+        self.files = OrderedDict()
+        self.lock = threading.Lock()
+
+    def open(self, path):
+        """ Returns the SharedFile of the file at path, opened again if it
+        was replaced or modified since it was opened. It must be given back
+        to release() once the request is done with it.
+        """
+        fs = os.stat(path)
+        key = (fs.st_dev, fs.st_ino, fs.st_size, fs.st_mtime)
+        with self.lock:
+            shared = self.files.get(path)
+            if shared is not None and shared.key == key:
+                self.files.move_to_end(path)
+                shared.users += 1
+                return shared
+        f = open(path, 'rb')
+        fs = fstat(f.fileno())
+        shared = SharedFile(f, fs, (fs.st_dev, fs.st_ino, fs.st_size, fs.st_mtime))
+        shared.users = 1
+        with self.lock:
+            dropped = []
+            if path in self.files:
+                dropped.append(self.files.pop(path))
+            self.files[path] = shared
+            while len(self.files) > self.capacity:
+                dropped.append(self.files.popitem(last=False)[1])
+            for other in dropped:
+                other.cached = False
+                if other.users == 0:
+                    other.file.close()
+        return shared
+
+    def release(self, shared):
+        """ Tells that a request is done with a SharedFile given by open().
+        """
+        with self.lock:
+            shared.users -= 1
+            if shared.users == 0 and not shared.cached:
+                shared.file.close()
+
+    def close(self):
+        """ Closes the files that no request uses, and the others once
+        released.
+        """
+        with self.lock:
+            for shared in self.files.values():
+                shared.cached = False
+                if shared.users == 0:
+                    shared.file.close()
+            self.files.clear()
+
+
+open_files = OpenFiles()
+
+# Prefixes served by /lod/ requests
+lod_prefixes = lod.PrefixCache()
+
+# Compressed variants of the files served
+compressed_variants = variants.VariantCache()
+
+# Content of the files most recently served
+asset_cache = assets.AssetCache()
+
+
 class ThreadingHTTPServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
     pass
 
@@ -47,39 +153,123 @@ class RequestHandler(SimpleHTTPRequestHandler):
 
     def do_GET(self):
         """ Overridden to handle HTTP Range requests. """
+        if self.path.startswith('/lod/'):
+            return self.send_lod()
         self.range_from, self.range_to = self._get_range_header()
-        if self.range_from is None:
-            # nothing to do here
-            return SimpleHTTPRequestHandler.do_GET(self)
         f = self.send_range_head()
-        if f:
-            self.copy_file_range(f, self.wfile)
-            f.close()
+        if f is None:
+            return
+        try:
+            if isinstance(f, bytes):
+                self.wfile.write(memoryview(f)[self.range_from:self.range_to + 1])
+            else:
+                self.copy_file_range(f, self.wfile)
+        finally:
+            self._release(f)
+
+    def do_HEAD(self):
+        """ Overridden to handle /lod/ and HTTP Range requests. """
+        if self.path.startswith('/lod/'):
+            return self.send_lod(head=True)
+        self.range_from, self.range_to = self._get_range_header()
+        f = self.send_range_head(head=True)
+        if f is not None:
+            self._release(f)
+
+    def send_lod(self, head=False):
+        """ Sends the prefix of a model giving a level of detail, requested
+        as /lod/<model>?faces=N or /lod/<model>?bytes=B (see lod.py).
+        """
+        path, _, query = self.path[4:].partition('?')
+        path = self.translate_path(path)
+        try:
+            offset, faces = lod.prefix_target(query.split('#', 1)[0])
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return
+        try:
+            prefix = lod_prefixes.get(path, offset, faces)
+        except lod.LodError as e:
+            self.send_error(422, str(e))
+            return
+        except (IOError, OSError):
+            self.send_error(404, "File not found")
+            return
+        self.send_response(200)
+        self.send_header("Content-type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(prefix)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(prefix)
+
+    def send_compressed(self, path, ctype, tag):
+        """ Sends the whole file compressed with gzip (see variants.py) when
+        the client accepts it. Returns False if nothing was sent.
+        """
+        if not variants.accepts_gzip(self.headers.get("Accept-Encoding")):
+            return False
+        try:
+            variant = compressed_variants.get(path)
+        except (IOError, OSError):
+            return False
+        if variant is None:
+            return False
+
+        self.send_response(200)
+        self.send_header("Content-type", ctype)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(variant.whole)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Last-Modified", self.date_time_string(variant.stat.st_mtime))
+        self.send_header("ETag", assets.variant_etag(tag, "gzip"))
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        self.wfile.write(variant.whole)
+        return True
 
     def copy_file_range(self, in_file, out_file):
-        """ Copy only the range in self.range_from/to. """
-        in_file.seek(self.range_from)
+        """ Copy only the range in self.range_from/to.
+
+        The range is sent by the kernel with os.sendfile when possible, and
+        copied through positional reads otherwise, so that in_file can be
+        shared between threads.
+        """
         # Add 1 because the range is inclusive
         left_to_copy = 1 + self.range_to - self.range_from
-        buf_length = 64*1024
         bytes_copied = 0
+        in_fd = self._fileno(in_file)
+        if in_fd is not None and hasattr(os, 'sendfile'):
+            out_file.flush()
+            bytes_copied = self._sendfile(in_fd, left_to_copy)
         while bytes_copied < left_to_copy:
-            read_buf = in_file.read(min(buf_length, left_to_copy - bytes_copied))
+            size = min(COPY_CHUNK, left_to_copy - bytes_copied)
+            if in_fd is not None:
+                read_buf = os.pread(in_fd, size, self.range_from + bytes_copied)
+            else:
+                in_file.seek(self.range_from + bytes_copied)
+                read_buf = in_file.read(size)
             if len(read_buf) == 0:
                 break
             out_file.write(read_buf)
             bytes_copied += len(read_buf)
         return bytes_copied
 
-    def send_range_head(self):
+    def send_range_head(self, head=False):
         """Common code for GET and HEAD commands.
 
-        This sends the response code and MIME headers.
+        This sends the response code and MIME headers, or the whole
+        response for conditional requests of unchanged files (see
+        assets.py) and compressed files (see variants.py).
 
-        Return value is either a file object (which has to be copied
-        to the outputfile by the caller unless the command was HEAD,
-        and must be closed by the caller under all circumstances), or
-        None, in which case the caller has nothing further to do.
+        Return value is either the content of the file (bytes, kept in
+        memory by asset_cache), a file object (which has to be copied
+        to the outputfile by the caller unless the command was HEAD),
+        or None, in which case the caller has nothing further to do.
+        What is returned must be given to _release() by the caller under
+        all circumstances. The range to copy is in self.range_from/to.
 
         """
         path = self.translate_path(self.path)
@@ -106,14 +296,75 @@ class RequestHandler(SimpleHTTPRequestHandler):
                 path = path[:-5]
 
         ctype = self.guess_type(path)
+        tag = None
         try:
-            # Always read in binary mode. Opening files in text mode may cause
-            # newline translations, making the actual size of the content
-            # transmitted *less* than the content-length!
-            f = open(path, 'rb')
-        except IOError:
+            if not exists(path):
+                # The blocks of a compressed file or their offsets
+                resource = compressed_variants.resource(path)
+                if resource is None:
+                    raise IOError(path)
+                fs, f, tag, ctype = resource
+            else:
+                fs, f = asset_cache.get(path)
+            if f is None:
+                # Always read in binary mode. Opening files in text mode may
+                # cause newline translations, making the actual size of the
+                # content transmitted *less* than the content-length!
+                f = open_files.open(path)
+                fs = f.stat
+        except (IOError, OSError):
             self.send_error(404, "File not found")
             return None
+        headers_sent = False
+        try:
+            headers_sent = self._send_file_head(path, ctype, fs, head, tag, len(f) if tag else None)
+        finally:
+            if not headers_sent:
+                self._release(f)
+        return f if headers_sent else None
+
+    def _send_file_head(self, path, ctype, fs, head, tag=None, file_size=None):
+        """ Sends the headers of a file whose os.stat is fs, or the whole
+        response (see send_range_head), in which case it returns False.
+        The tag and size of a resource made from the file (see
+        variants.VariantCache.resource) are given, and it is never
+        compressed.
+        """
+        compressible = tag is None
+        if compressible:
+            file_size = fs.st_size
+            tag = assets.etag(fs)
+            tags = (tag, assets.variant_etag(tag, "gzip"))
+        else:
+            tags = (tag,)
+        last_modified = self.date_time_string(fs.st_mtime)
+        if_none_match = self.headers.get("If-None-Match")
+        if assets.none_match(if_none_match, tags) or (
+                if_none_match is None and self.range_from is None and
+                not assets.modified_since(self.headers.get("If-Modified-Since"), fs.st_mtime)):
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Last-Modified", last_modified)
+            if compressible:
+                self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return False
+        # Ranges are of the file itself, never of its gzip variant
+        if not assets.range_applies(self.headers.get("If-Range"), (tag,), last_modified):
+            # The client holds another version: it gets the whole file
+            self.range_from = self.range_to = None
+        if self.range_from is not None and self.range_from >= file_size:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */%d" % file_size)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return False
+
+        # A whole file is compressed, but HEAD gives the size of the file
+        # itself, used by the viewer
+        if compressible and not head and self.range_from is None and \
+           self.send_compressed(path, ctype, tag):
+            return False
 
         if self.range_from is None:
             self.send_response(200)
@@ -121,8 +372,6 @@ class RequestHandler(SimpleHTTPRequestHandler):
             self.send_response(206)
 
         self.send_header("Content-type", ctype)
-        fs = fstat(f.fileno())
-        file_size = fs.st_size
         if self.range_from is not None:
             if self.range_to is None or self.range_to >= file_size:
                 self.range_to = file_size-1
@@ -135,9 +384,14 @@ class RequestHandler(SimpleHTTPRequestHandler):
                              (1 + self.range_to - self.range_from))
         else:
             self.send_header("Content-Length", str(file_size))
-        self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.range_from, self.range_to = 0, file_size-1
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("ETag", tag)
+        if compressible:
+            self.send_header("Vary", "Accept-Encoding")
         self.end_headers()
-        return f
+        return True
 
     def list_directory(self, path):
         """Helper to produce a directory listing (absent index.html).
@@ -199,6 +453,49 @@ class RequestHandler(SimpleHTTPRequestHandler):
 
     # Private interface ######################################################
 
+    def _release(self, f):
+        """ Gives back what send_range_head returned: the shared files to
+        open_files, and the listings are closed.
+        """
+        if isinstance(f, SharedFile):
+            open_files.release(f)
+        elif not isinstance(f, bytes):
+            f.close()
+
+    def _fileno(self, f):
+        """ Returns the file descriptor of a file, or None for in-memory files.
+        """
+        try:
+            return f.fileno()
+        except (AttributeError, ValueError, IOError):
+            return None
+
+    def _sendfile(self, in_fd, count):
+        """ Sends count bytes of a file from self.range_from with os.sendfile,
+        and returns the number of bytes sent, which is less if the file is
+        shorter or if os.sendfile is not supported for this file or socket.
+        """
+        out_fd = self.connection.fileno()
+        timeout = self.connection.gettimeout()
+        sent = 0
+        while sent < count:
+            try:
+                n = os.sendfile(out_fd, in_fd, self.range_from + sent, count - sent)
+            except BlockingIOError:
+                # The socket has a timeout, hence is non-blocking
+                if not select.select([], [out_fd], [], timeout)[1]:
+                    raise socket.timeout("timed out")
+                continue
+            except OSError as e:
+                if sent == 0 and e.errno in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+                                             errno.EOPNOTSUPP):
+                    return 0
+                raise
+            if n == 0:
+                break
+            sent += n
+        return sent
+
     def _get_range_header(self):
         """ Returns request Range start and end if specified.
         If Range header is not specified returns (None, None)
@@ -244,6 +541,11 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
 
+    if '--async' in args:
+        # One coroutine per connection instead of one thread
+        import async_server
+        return async_server.main([arg for arg in args if arg != '--async'])
+
     PORT = 8000
     if len(args)>0:
         PORT = int(args[-1])
@@ -0,0 +1,81 @@
+"""
+Tests of the adjacency indices against the face sweeps they replace.
+"""
+
+import os
+import numpy as np
+import pytest
+import obja
+from adjacency import Adjacency, DynamicAdjacency, PatchedAdjacency, face_array
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module')
+def suzanne():
+    return obja.parse_file(os.path.join(ROOT, 'example', 'suzanne.obj'))
+
+def reference(faces, nb_vertices, visible):
+    """
+    Returns the faces and neighbours of each vertex as dictionaries of sets,
+    found by sweeping all the faces.
+    """
+    around = {vertex: set() for vertex in range(nb_vertices)}
+    neighbours = {vertex: set() for vertex in range(nb_vertices)}
+    for index, face in enumerate(faces.tolist()):
+        if visible[index]:
+            for vertex in face:
+                around[vertex].add(index)
+                neighbours[vertex].update(face)
+    for vertex in neighbours:
+        neighbours[vertex].discard(vertex)
+    return around, neighbours
+
+def reference_ring(neighbours, vertex, r):
+    ring = {vertex}
+    for _ in range(r):
+        ring.update(*[neighbours[elt] for elt in list(ring)])
+    return ring - {vertex}
+
+def assert_matches(adjacency, faces, nb_vertices, visible):
+    around, neighbours = reference(faces, nb_vertices, visible)
+    for vertex in range(nb_vertices):
+        assert adjacency.faces(vertex).tolist() == sorted(around[vertex])
+        if hasattr(adjacency, 'neighbours'):
+            assert sorted(adjacency.neighbours(vertex).tolist()) == sorted(neighbours[vertex])
+
+def test_adjacency(suzanne):
+    faces, visible = face_array(suzanne)
+    visible = visible.copy()
+    visible[::7] = False
+    adjacency = Adjacency(faces, len(suzanne.vertices), visible)
+    assert_matches(adjacency, faces, len(suzanne.vertices), visible)
+    _, neighbours = reference(faces, len(suzanne.vertices), visible)
+    assert adjacency.valences().tolist() == [len(neighbours[vertex]) for vertex in range(len(neighbours))]
+    for vertex in range(0, len(suzanne.vertices), 17):
+        for r in (1, 2, 3):
+            assert set(adjacency.ring(vertex, r)) == reference_ring(neighbours, vertex, r)
+
+def test_degenerate_faces():
+    adjacency = Adjacency([[0, 0, 1], [1, 2, 2], [0, 1, 2]], 4)
+    assert adjacency.faces(0).tolist() == [0, 2]
+    assert adjacency.faces(2).tolist() == [1, 2]
+    assert adjacency.neighbours(0).tolist() == [1, 2]
+    assert adjacency.faces(3).tolist() == [] and adjacency.faces(10).tolist() == []
+
+@pytest.mark.parametrize('kind', [DynamicAdjacency, PatchedAdjacency])
+def test_edited_adjacency(suzanne, kind):
+    faces, visible = face_array(suzanne)
+    faces, visible = faces.copy(), visible.copy()
+    nb_vertices = len(suzanne.vertices)
+    adjacency = kind(faces, nb_vertices, visible)
+    rng = np.random.default_rng(0)
+    for face in rng.choice(len(faces), 200, replace = False).tolist():
+        adjacency.remove_face(face, faces[face].tolist())
+        if rng.random() < 0.5:
+            visible[face] = False
+        else:
+            faces[face] = rng.choice(nb_vertices, 3, replace = False)
+            adjacency.add_face(face, faces[face].tolist())
+    assert_matches(adjacency, faces, nb_vertices, visible)
+    if kind is DynamicAdjacency:
+        assert_matches(adjacency.to_adjacency(), faces, nb_vertices, visible)
@@ -0,0 +1,48 @@
+"""
+Tests of the simplification of whole directories.
+"""
+
+import os
+import shutil
+import time
+import batch
+import lod
+import qem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPTIONS = {'ratio': 0.5, 'faces': None, 'saliency_weight': 0.0, 'batched': False}
+
+def test_run_jobs(tmp_path):
+    source = str(tmp_path / 'suzanne.obj')
+    shutil.copy(os.path.join(ROOT, 'example', 'suzanne.obj'), source)
+    output = str(tmp_path / 'results' / 'suzanne.obja')
+    job = (source, output)
+    assert not batch.up_to_date(source, output, OPTIONS)
+    assert batch.run_jobs([job], OPTIONS, workers = 1) == {job: 'done'}
+    assert os.path.exists(output) and os.path.exists(lod.index_path(output))
+    assert batch.up_to_date(source, output, OPTIONS)
+
+    # Other parameters, or an input modified since, build the output again
+    assert not batch.up_to_date(source, output, dict(OPTIONS, ratio = 0.2))
+    later = os.path.getmtime(batch.parameters_path(output)) + 10
+    os.utime(source, (later, later))
+    assert not batch.up_to_date(source, output, OPTIONS)
+
+def test_run_jobs_timeout(tmp_path, monkeypatch):
+    def simplify_file(input_path, output_path, **options):
+        # Stopped while writing its output aside (the workers are forked)
+        for path in batch.temporary_paths(output_path):
+            with open(path, 'w') as file:
+                file.write('partial')
+        time.sleep(60)
+    monkeypatch.setattr(qem, 'simplify_file', simplify_file)
+    jobs = [(str(tmp_path / 'a.obj'), str(tmp_path / 'a.obja')),
+            (str(tmp_path / 'b.obj'), str(tmp_path / 'b.obja'))]
+    reported = []
+    start = time.monotonic()
+    statuses = batch.run_jobs(jobs, OPTIONS, workers = 2, timeout = 0.5,
+                              report = lambda job, status, duration: reported.append(job))
+    assert time.monotonic() - start < 30
+    assert statuses == {job: 'timeout' for job in jobs} and sorted(reported) == jobs
+    assert os.listdir(str(tmp_path)) == []
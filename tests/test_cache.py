@@ -0,0 +1,70 @@
+"""
+Tests of the content addressed cache of simplification results.
+"""
+
+import os
+import numpy as np
+import pytest
+import cache
+import lod
+import obja
+import qem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_keys():
+    model = obja.parse_array_file(os.path.join(ROOT, 'example', 'suzanne.obj'))
+    key = cache.mesh_key(model)
+    assert cache.mesh_key(obja.parse_array_file(os.path.join(ROOT, 'example', 'suzanne.obj'))) == key
+    model.vertices[0, 0] += 1e-9
+    assert cache.mesh_key(model) != key
+    assert cache.cache_key(key, ratio = 0.1, faces = None) == cache.cache_key(key, faces = None, ratio = 0.1)
+    assert cache.cache_key(key, ratio = 0.1) != cache.cache_key(key, ratio = 0.2)
+
+def test_hit_and_miss(tmp_path):
+    store = cache.Cache(str(tmp_path / 'cache'))
+    source = tmp_path / 'model.obja'
+    source.write_text('v 0 0 0\n')
+    destination = str(tmp_path / 'copy.obja')
+    assert not store.fetch('ab12', {'model.obja': destination})
+    store.put('ab12', {'model.obja': str(source)})
+    assert store.fetch('ab12', {'model.obja': destination})
+    with open(destination) as file:
+        assert file.read() == 'v 0 0 0\n'
+    # Times are kept, for the index of an obja
+    assert os.path.getmtime(destination) == os.path.getmtime(str(source))
+    assert not store.fetch('ab12', {'model.obja': destination, 'other': destination})
+
+    assert store.get_array('cd34', 'saliency') is None
+    store.put_array('cd34', 'saliency', np.arange(5.0))
+    assert store.get_array('cd34', 'saliency').tolist() == [0, 1, 2, 3, 4]
+    assert len(store.entries()) == 2
+
+def test_eviction(tmp_path):
+    store = cache.Cache(str(tmp_path / 'cache'), max_size = 2500)
+    for number, key in enumerate(('aa', 'bb')):
+        store.put_array(key, 'data', np.zeros(100))
+        os.utime(store.entry(key), (number, number))
+    # Reading the oldest entry makes the other one the least recently used
+    assert store.get_array('aa', 'data') is not None
+    store.put_array('cc', 'data', np.zeros(100))
+    assert store.get_array('bb', 'data') is None
+    assert store.get_array('aa', 'data') is not None and store.get_array('cc', 'data') is not None
+    assert not os.listdir(os.path.join(store.directory, '.tmp'))
+
+def test_simplify_file(tmp_path, monkeypatch):
+    store = cache.Cache(str(tmp_path / 'cache'))
+    source = os.path.join(ROOT, 'example', 'suzanne.obj')
+    first, second = str(tmp_path / 'first.obja'), str(tmp_path / 'second.obja')
+    qem.simplify_file(source, first, 0.5, cache = store)
+
+    def decimate(*args, **kwargs):
+        raise AssertionError("not cached")
+    monkeypatch.setattr(qem, 'decimate', decimate)
+    qem.simplify_file(source, second, 0.5, cache = store)
+    with open(first, 'rb') as expected, open(second, 'rb') as actual:
+        assert actual.read() == expected.read()
+    # The index fetched along is up to date for the copy
+    lod.LodIndex(second)
+    with pytest.raises(AssertionError):
+        qem.simplify_file(source, second, 0.4, cache = store)
@@ -0,0 +1,104 @@
+"""
+Tests of the compaction of progressive obja streams.
+"""
+
+import os
+import random
+import numpy as np
+import pytest
+import compact
+import mesh
+import obja
+import qem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def random_stream(rng):
+    """
+    Returns the lines of a random valid obja stream cut into steps by s
+    instructions.
+    """
+    lines = []
+    nb_vertices = nb_faces = 0
+    number = lambda: repr(rng.random())
+    while len(lines) < 150:
+        kind = rng.random()
+        if kind < 0.25 or nb_vertices < 3:
+            lines.append('v {} {} {}\n'.format(number(), number(), number()))
+            nb_vertices += 1
+        elif kind < 0.45:
+            lines.append('f {} {} {}\n'.format(*[rng.randint(1, nb_vertices) for _ in range(3)]))
+            nb_faces += 1
+        elif kind < 0.52:
+            lines.append('ev {} {} {} {}\n'.format(rng.randint(1, nb_vertices), number(), number(), number()))
+        elif kind < 0.57:
+            lines.append('tv {} {} {} {}\n'.format(rng.randint(1, nb_vertices), number(), number(), number()))
+        elif nb_faces == 0:
+            continue
+        elif kind < 0.65:
+            lines.append('af {} {} {} {}\n'.format(rng.randint(1, nb_faces + 1),
+                                                   *[rng.randint(1, nb_vertices) for _ in range(3)]))
+            nb_faces += 1
+        elif kind < 0.72:
+            lines.append('ef {} {} {} {}\n'.format(rng.randint(1, nb_faces),
+                                                   *[rng.randint(1, nb_vertices) for _ in range(3)]))
+        elif kind < 0.8:
+            lines.append('efv {} {} {}\n'.format(rng.randint(1, nb_faces), rng.randint(1, 3),
+                                                 rng.randint(1, nb_vertices)))
+        elif kind < 0.88:
+            lines.append('df {}\n'.format(rng.randint(1, nb_faces)))
+        else:
+            lines.append('s {}\n'.format(rng.randint(0, 10 ** 6)))
+    return lines
+
+def state(lines):
+    """
+    Returns the vertices, faces and visibility given by lines.
+    """
+    model = obja.ArrayModel()
+    model.parse_bytes(''.join(lines).encode())
+    return model.vertices, model.faces, model.visible
+
+@pytest.mark.parametrize('seed', range(20))
+def test_compact_checkpoints(seed, tmp_path):
+    lines = random_stream(random.Random(seed))
+    if not any(line.startswith('s ') for line in lines):
+        lines.append('s 0\n')
+    path = str(tmp_path / 'stream.obja')
+    compacted = str(tmp_path / 'compact.obja')
+    with open(path, 'w') as file:
+        file.write(''.join(lines))
+    compact.compact(path, compacted)
+    assert compact.verify(path, compacted) == sum(line.startswith('s ') for line in lines) + 1
+
+    # Each s instruction is at a checkpoint of the text of both files
+    with open(compacted) as file:
+        output = file.readlines()
+    markers = [i for i, line in enumerate(lines) if line.startswith('s ')]
+    output_markers = [i for i, line in enumerate(output) if line.startswith('s ')]
+    assert [lines[i] for i in markers] == [output[i] for i in output_markers]
+    for i, j in zip(markers + [len(lines)], output_markers + [len(output)]):
+        for expected, actual in zip(state(lines[:i]), state(output[:j])):
+            assert np.array_equal(expected, actual)
+
+def test_compact_without_steps(tmp_path):
+    path = str(tmp_path / 'model.obja')
+    with open(path, 'w') as file:
+        file.write('v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n')
+    with pytest.raises(ValueError):
+        compact.compact(path, str(tmp_path / 'compact.obja'))
+
+def test_compact_progressive(tmp_path):
+    bunny = obja.parse_array_file(os.path.join(ROOT, 'example', 'bunny.obj'))
+    simplified, records = qem.decimate(bunny, 0, faces = 496)
+    path = str(tmp_path / 'bunny.obja')
+    compacted = str(tmp_path / 'compact.obja')
+    with open(path, 'w') as output:
+        mesh.write_progressive(output, simplified, records)
+    with open(path) as file:
+        sizes = [int(line.split()[1]) for line in file if line.startswith('s ')]
+    assert sizes[-1] == os.path.getsize(path) - len('s {}\n'.format(sizes[-1]))
+    assert all(b - a >= mesh.STEP_SIZE for a, b in zip(sizes[1:], sizes[2:-1]))
+
+    compact.compact(path, compacted)
+    assert compact.verify(path, compacted) == len(sizes) + 1
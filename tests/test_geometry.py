@@ -0,0 +1,60 @@
+"""
+Tests of the face and vertex areas and of their updates by GeometryCache.
+"""
+
+import io
+import os
+import numpy as np
+import pytest
+import geometry
+import mesh
+import obja
+import qem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module')
+def bunny():
+    return obja.parse_array_file(os.path.join(ROOT, 'example', 'bunny.obj'))
+
+def assert_same_geometry(cache, model):
+    """
+    Checks that the arrays of a cache updated along edits are those computed
+    from scratch.
+    """
+    expected = geometry.GeometryCache(model)
+    assert np.allclose(cache.normals, expected.normals, rtol = 0, atol = 1e-15)
+    assert np.allclose(cache.areas, expected.areas, rtol = 0, atol = 1e-15)
+    assert np.allclose(cache.vertex_areas, expected.vertex_areas, rtol = 0, atol = 1e-15)
+
+def test_face_areas():
+    rng = np.random.default_rng(0)
+    vertices = rng.random((100, 3))
+    faces = rng.integers(0, 100, (300, 3))
+    areas = geometry.face_areas(vertices, faces)
+    cross = np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]], vertices[faces[:, 2]] - vertices[faces[:, 0]])
+    assert np.allclose(areas, 0.5 * np.linalg.norm(cross, axis = 1))
+    assert areas.tolist() == [obja.Face(*face).area(vertices) for face in faces.tolist()]
+    # A right triangle in the xy plane
+    assert geometry.face_areas(np.array([[0., 0, 0], [2, 0, 0], [0, 3, 0]]), [[0, 1, 2]]).tolist() == [3.0]
+
+def test_collapses(bunny):
+    simplified = mesh.Mesh.from_model(bunny)
+    cache = geometry.get_geometry(simplified)
+    decimater = qem.QuadricDecimater(simplified)
+    for target in (60000, 20000, 5000):
+        decimater.decimate(target)
+        assert_same_geometry(cache, simplified)
+
+def test_progressive_stream(bunny):
+    simplified, records = qem.decimate(bunny, 0, faces = 496)
+    output = io.StringIO()
+    mesh.write_progressive(output, simplified, records)
+    text = output.getvalue().encode()
+
+    model = obja.ArrayModel()
+    cache = geometry.get_geometry(model)
+    # Vertex splits add, insert and edit faces, and move vertices
+    for start, end in obja.line_chunks(text, len(text) // 7):
+        model.parse_bytes(text[start:end])
+        assert_same_geometry(cache, model)
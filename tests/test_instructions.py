@@ -0,0 +1,45 @@
+"""
+Tests of the streaming of instructions against the parsing of prefixes.
+"""
+
+import os
+import numpy as np
+import pytest
+import instructions
+import obja
+import objb
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUNNY = os.path.join(ROOT, 'example', 'bunny.obja')
+
+@pytest.fixture(scope = 'module')
+def bunny(tmp_path_factory):
+    """
+    The lines of example/bunny.obja, one instruction each, and the path of
+    the obja and of its objb encoding in float64.
+    """
+    with open(BUNNY) as file:
+        lines = file.read().splitlines(True)
+    binary = str(tmp_path_factory.mktemp('instructions') / 'bunny.objb')
+    objb.obja_to_objb(BUNNY, binary, True)
+    return lines, BUNNY, binary
+
+@pytest.mark.parametrize('end', [0, 1, 100, 2503, 2504, 5000, 7471, 8000, 9000, None])
+def test_load_until_prefix(bunny, end, monkeypatch):
+    # Small chunks and batches, so that the end falls inside them
+    monkeypatch.setattr(obja, 'PARSE_CHUNK', 4096)
+    monkeypatch.setattr(instructions, 'INSTRUCTION_BATCH', 97)
+    lines, text, binary = bunny
+    prefix = obja.ArrayModel()
+    prefix.parse_bytes(''.join(lines[:end]).encode())
+    for path in (text, binary):
+        model = instructions.load_until(path, end)
+        for name in ('vertices', 'faces', 'visible'):
+            assert np.array_equal(getattr(model, name), getattr(prefix, name)), (path, name)
+
+def test_read_instructions_batches(bunny):
+    lines, text, _ = bunny
+    batches = list(instructions.read_instructions(text, batch_size = 100))
+    assert all(0 < len(records) <= 100 for _, records in batches)
+    assert sum(len(records) for _, records in batches) == len(lines)
@@ -0,0 +1,91 @@
+"""
+Tests of the level of detail index against parsing the prefixes of files.
+"""
+
+import io
+import os
+import random
+import shutil
+import numpy as np
+import pytest
+import lod
+import mesh
+import obja
+import qem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module', params = ['markers', 'splits'])
+def stream(request, tmp_path_factory):
+    """
+    A progressive file cut by s instructions, written by
+    mesh.write_progressive, or one without them (example/bunny.obja).
+    """
+    path = str(tmp_path_factory.mktemp('lod') / 'bunny.obja')
+    if request.param == 'splits':
+        shutil.copy(os.path.join(ROOT, 'example', 'bunny.obja'), path)
+        return path
+    bunny = obja.parse_array_file(os.path.join(ROOT, 'example', 'bunny.obj'))
+    simplified, records = qem.decimate(bunny, 0, faces = 496)
+    with open(path, 'w') as output:
+        mesh.write_progressive(output, simplified, records)
+    return path
+
+def parse_prefix(path, end):
+    model = obja.ArrayModel()
+    with open(path, 'rb') as file:
+        model.parse_bytes(file.read(end))
+    return model
+
+def assert_same_model(expected, actual):
+    for name in ('vertices', 'faces', 'visible'):
+        assert np.array_equal(getattr(expected, name), getattr(actual, name)), name
+    assert expected.line == actual.line
+
+def test_snapshots(stream):
+    index = lod.build_index(stream, interval = 1 << 15, save = False)
+    assert index.offsets[0] == 0 and index.offsets[-1] == os.path.getsize(stream)
+    for k in range(len(index)):
+        assert_same_model(parse_prefix(stream, int(index.offsets[k])), index.snapshot(k))
+
+def test_load(stream):
+    index = lod.build_index(stream, interval = 1 << 15)
+    rng = random.Random(0)
+    with open(stream, 'rb') as file:
+        data = file.read()
+    for offset in [0, 1, len(data), len(data) + 10] + [rng.randrange(len(data)) for _ in range(10)]:
+        end = data.rfind(b"\n", 0, offset) + 1 if offset < len(data) else len(data)
+        assert_same_model(parse_prefix(stream, end), index.load(offset = offset))
+
+    for offset, size in list(zip(index.marker_offsets.tolist(), index.marker_sizes.tolist()))[::10]:
+        assert_same_model(parse_prefix(stream, offset), index.load(size = size))
+        assert index.end(offset = offset + 1) == offset
+    # The index written next to the file gives the same models
+    assert_same_model(index.load(offset = len(data) // 2), lod.load_lod(stream, offset = len(data) // 2))
+
+@pytest.mark.parametrize('faces', [0, 495, 600, 3000, 10 ** 6])
+def test_faces(stream, faces):
+    index = lod.build_index(stream, interval = 1 << 15, save = False)
+    end = index.end(faces = faces)
+    model = index.load(faces = faces)
+    assert_same_model(parse_prefix(stream, end), model)
+    visible = np.count_nonzero(model.visible)
+    assert visible <= faces or end == 0
+    if len(index.marker_offsets) > 0:
+        # Cut at the last s instruction not showing too many faces
+        assert end in index.marker_offsets.tolist() + [0, os.path.getsize(stream)]
+    with open(stream, 'rb') as file:
+        data = file.read()
+    # A vertex split is never cut
+    assert end == len(data) or data[end:end + 2] in (b"v ", b"s ")
+
+def test_out_of_date(stream, tmp_path):
+    path = str(tmp_path / 'model.obja')
+    shutil.copy(stream, path)
+    lod.build_index(path)
+    lod.LodIndex(path)
+    with open(path, 'a') as file:
+        file.write('v 0 0 0\n')
+    with pytest.raises(ValueError):
+        lod.LodIndex(path)
+    assert lod.open_index(path).nb_vertices[-1] == parse_prefix(path, os.path.getsize(path)).nb_vertices
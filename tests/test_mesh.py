@@ -0,0 +1,88 @@
+"""
+Tests of the edge collapses made in place by mesh.Mesh.
+"""
+
+import os
+import numpy as np
+import pytest
+import mesh
+import obja
+from adjacency import Adjacency
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module')
+def suzanne():
+    return obja.parse_array_file(os.path.join(ROOT, 'example', 'suzanne.obj'))
+
+def triangles(vertices, faces):
+    """
+    Returns the sorted triangles of faces, each as the sorted coordinates of
+    its corners.
+    """
+    corners = np.asarray(vertices)[np.asarray(faces, np.int64).reshape(-1, 3)].round(9).tolist()
+    return sorted(tuple(sorted(map(tuple, triangle))) for triangle in corners)
+
+def reference_collapse(vertices, faces, kept, removed, position):
+    """
+    Returns the vertices and faces after an edge collapse, rebuilt from all
+    the faces.
+    """
+    vertices = vertices.copy()
+    vertices[kept] = position
+    faces = [[kept if vertex == removed else vertex for vertex in face]
+             for face in faces.tolist() if not (kept in face and removed in face)]
+    return vertices, faces
+
+def assert_adjacency(edited):
+    expected = Adjacency(edited.faces, len(edited.vertices), edited.visible)
+    for vertex in range(len(edited.vertices)):
+        assert edited.adjacency.faces(vertex).tolist() == expected.faces(vertex).tolist()
+
+def random_edges(edited, rng, count):
+    """
+    Yields count random edges of the visible faces of a mesh, collapsing each
+    before picking the next one.
+    """
+    for _ in range(count):
+        face = rng.choice(np.flatnonzero(edited.visible))
+        kept, removed = rng.choice(edited.faces[face], 2, replace = False).tolist()
+        yield kept, removed
+
+def test_collapse(suzanne):
+    edited = mesh.Mesh.from_model(suzanne)
+    vertices, faces = edited.vertices.copy(), edited.faces[edited.visible]
+    rng = np.random.default_rng(0)
+    for kept, removed in random_edges(edited, rng, 50):
+        position = (edited.vertices[kept] + edited.vertices[removed]) / 2
+        vertices, faces = reference_collapse(vertices, np.array(faces), kept, removed, position)
+        record = edited.collapse(kept, removed, position)
+        assert edited.removed[removed] and not edited.visible[[face for face, _ in record.removed_faces]].any()
+        assert triangles(edited.vertices, edited.faces[edited.visible]) == triangles(vertices, faces)
+    assert_adjacency(edited)
+
+def test_undo(suzanne):
+    edited = mesh.Mesh.from_model(suzanne)
+    original = edited.vertices.copy(), edited.faces.copy(), edited.visible.copy()
+    rng = np.random.default_rng(1)
+    records = []
+    states = []
+    for kept, removed in random_edges(edited, rng, 200):
+        states.append((edited.vertices.copy(), edited.faces.copy(), edited.visible.copy()))
+        records.append(edited.collapse(kept, removed, edited.vertices[removed]))
+    assert_adjacency(edited)
+    for record, state in zip(reversed(records), reversed(states)):
+        edited.undo(record)
+        for expected, actual in zip(state, (edited.vertices, edited.faces, edited.visible)):
+            assert np.array_equal(expected, actual)
+    for expected, actual in zip(original, (edited.vertices, edited.faces, edited.visible)):
+        assert np.array_equal(expected, actual)
+    assert not edited.removed.any()
+    assert_adjacency(edited)
+
+def test_isolated_vertices():
+    # Two triangles sharing the edge 1-2, and a lone triangle
+    edited = mesh.Mesh(np.eye(6, 3), [[0, 1, 2], [1, 3, 2], [3, 4, 5]])
+    record = edited.collapse(1, 2)
+    assert edited.visible.tolist() == [False, False, True]
+    assert edited.isolated_vertices(record) == [0, 1]
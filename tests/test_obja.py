@@ -0,0 +1,156 @@
+"""
+Tests of the parsing of obja files in an obja.ArrayModel, of the insertion
+of faces (af, ef, efv, df) and of the bulk writers of obja.Output.
+"""
+
+import os
+import random
+import numpy as np
+import pytest
+import obja
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def random_stream(rng, nb_vertices = 20, nb_instructions = 300):
+    """
+    Returns the lines of a random stream of face instructions, af included.
+    """
+    lines = ['v {} {} {}'.format(rng.random(), rng.random(), rng.random()) for _ in range(nb_vertices)]
+    vertex = lambda: rng.randint(1, nb_vertices)
+    nb_faces = 0
+    for _ in range(nb_instructions):
+        kind = rng.random()
+        if kind < 0.3 or nb_faces == 0:
+            lines.append('f {} {} {}'.format(vertex(), vertex(), vertex()))
+            nb_faces += 1
+        elif kind < 0.6:
+            lines.append('af {} {} {} {}'.format(rng.randint(1, nb_faces + 1), vertex(), vertex(), vertex()))
+            nb_faces += 1
+        elif kind < 0.75:
+            lines.append('efv {} {} {}'.format(rng.randint(1, nb_faces), rng.randint(1, 3), vertex()))
+        elif kind < 0.85:
+            lines.append('ef {} {} {} {}'.format(rng.randint(1, nb_faces), vertex(), vertex(), vertex()))
+        else:
+            lines.append('df {}'.format(rng.randint(1, nb_faces)))
+    return lines
+
+def list_faces(lines):
+    """
+    Returns the faces and visibility given by lines, applied to a list of
+    faces, af shifting the following ones.
+    """
+    faces = []
+    for line in lines:
+        split = line.split()
+        if split[0] == 'v':
+            continue
+        numbers = [int(x) - 1 for x in split[1:]]
+        if split[0] == 'f':
+            faces.append(numbers + [True])
+        elif split[0] == 'af':
+            faces.insert(numbers[0], numbers[1:] + [True])
+        elif split[0] == 'efv':
+            faces[numbers[0]][numbers[1]] = numbers[2]
+        elif split[0] == 'ef':
+            faces[numbers[0]][:3] = numbers[1:]
+        elif split[0] == 'df':
+            faces[numbers[0]][3] = False
+    return np.array([face[:3] for face in faces]), np.array([face[3] for face in faces])
+
+@pytest.mark.parametrize('seed', range(10))
+def test_insertions_match_list(seed, monkeypatch):
+    # Small blocks, so that they are split
+    monkeypatch.setattr(obja, 'ORDER_BLOCK', 4)
+    lines = random_stream(random.Random(seed))
+    faces, visible = list_faces(lines)
+
+    parsed = obja.ArrayModel()
+    parsed.parse_bytes(('\n'.join(lines) + '\n').encode())
+    by_line = obja.ArrayModel()
+    for line in lines:
+        by_line.parse_line(line)
+    for model in (parsed, by_line):
+        assert np.array_equal(model.faces, faces)
+        assert np.array_equal(model.visible, visible)
+
+def test_face_order(monkeypatch):
+    monkeypatch.setattr(obja, 'ORDER_BLOCK', 4)
+    rng = random.Random(0)
+    order = obja.FaceOrder(10)
+    slots = list(range(10))
+    for slot in range(10, 200):
+        index = rng.randint(0, len(slots))
+        order.insert(index, slot)
+        slots.insert(index, slot)
+        if slot % 7 == 0:
+            order.extend([slot + 1000])
+            slots.append(slot + 1000)
+        indices = [rng.randrange(len(slots)) for _ in range(3)]
+        assert order.select(indices).tolist() == [slots[i] for i in indices]
+    assert len(order) == len(slots)
+    assert order.slots().tolist() == slots
+
+@pytest.mark.parametrize('chunk', [16, 4096])
+@pytest.mark.parametrize('name', ['example/bunny.obj', 'example/suzanne.obja'])
+def test_parse_file_by_chunks(name, chunk, monkeypatch):
+    path = os.path.join(ROOT, name)
+    with open(path, 'rb') as file:
+        whole = obja.ArrayModel()
+        whole.parse_bytes(file.read())
+    monkeypatch.setattr(obja, 'PARSE_CHUNK', chunk)
+    model = obja.parse_array_file(path)
+    for name in ('vertices', 'faces', 'visible'):
+        assert np.array_equal(getattr(model, name), getattr(whole, name)), name
+
+def write_elements(bulk, vertices, faces, moves, precision, random_color = False, buffer_size = 0):
+    """
+    Returns the text written by an obja.Output adding vertices and faces,
+    then moving vertices and editing faces, with the bulk methods or one
+    element at a time.
+    """
+    written = []
+    class Text:
+        def write(self, text):
+            written.append(text)
+    random.seed(0)
+    with obja.Output(Text(), random_color, buffer_size, precision) as output:
+        # Vertices and faces have indices of their own, in any order
+        vertex_indices = np.arange(len(vertices))[::-1] * 3
+        face_indices = np.arange(len(faces)) * 2 + 1
+        faces = vertex_indices[faces]
+        edited = np.arange(0, len(faces), 3)
+        moved = np.arange(0, len(vertices), 5)
+        if bulk:
+            output.add_vertices(vertex_indices, vertices)
+            output.add_faces(face_indices, faces)
+            output.edit_vertices(vertex_indices[moved], moves[moved])
+            output.edit_face_vertices(face_indices[edited], edited % 3 + 1, faces[edited, 0])
+            output.edit_faces(face_indices[edited], faces[edited][:, ::-1])
+        else:
+            for index, vertex in zip(vertex_indices.tolist(), vertices):
+                output.add_vertex(index, vertex)
+            for index, face in zip(face_indices.tolist(), faces.tolist()):
+                output.add_face(index, obja.Face(*face))
+            for index, vertex in zip(vertex_indices[moved].tolist(), moves[moved]):
+                output.edit_vertex(index, vertex)
+            for index, corner, vertex in zip(face_indices[edited].tolist(), (edited % 3 + 1).tolist(),
+                                             faces[edited, 0].tolist()):
+                output.edit_face_vertex(index, corner, vertex)
+            for index, face in zip(face_indices[edited].tolist(), faces[edited][:, ::-1].tolist()):
+                output.edit_face(index, obja.Face(*face))
+    return ''.join(written)
+
+@pytest.mark.parametrize('precision', [None, 0, 3, 6])
+@pytest.mark.parametrize('random_color', [False, True])
+def test_bulk_output(precision, random_color, monkeypatch):
+    # Small chunks and buffer, so that lines are formatted in several chunks
+    monkeypatch.setattr(obja, 'OUTPUT_CHUNK', 7)
+    rng = np.random.default_rng(0)
+    vertices = rng.normal(0, 10, (100, 3)) * 10.0 ** rng.integers(-3, 4, (100, 1))
+    vertices[:3] = [[0.0, -0.0, 1.5], [-1e-9, 123456.0, 2.5], [0.1, -0.25, 1e6]]
+    faces = rng.integers(0, 100, (150, 3))
+    moves = rng.normal(0, 1, (100, 3))
+    expected = write_elements(False, vertices, faces, moves, precision, random_color)
+    assert write_elements(True, vertices, faces, moves, precision, random_color) == expected
+    assert write_elements(True, vertices, faces, moves, precision, random_color, 100) == expected
+    assert expected.count('\n') == 100 + 150 * (2 if random_color else 1) + 20 + 2 * 50
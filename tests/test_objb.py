@@ -0,0 +1,98 @@
+"""
+Tests of the round trips between obja and objb files.
+"""
+
+import os
+import random
+import numpy as np
+import pytest
+import obja
+import objb
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def assert_same_model(model, other, vertices = True):
+    """
+    Checks that two models are the same, but for their coordinates unless
+    vertices is set.
+    """
+    if vertices:
+        assert np.array_equal(model.vertices, other.vertices)
+    assert np.array_equal(model.faces, other.faces)
+    assert np.array_equal(model.visible, other.visible)
+
+def random_stream(rng):
+    """
+    Returns a random valid obja stream using every instruction.
+    """
+    lines = []
+    nb_vertices = nb_faces = 0
+    number = lambda: repr(rng.random())
+    while len(lines) < 200:
+        kind = rng.random()
+        if kind < 0.25 or nb_vertices < 3:
+            lines.append('v {} {} {}'.format(number(), number(), number()))
+            nb_vertices += 1
+        elif kind < 0.45:
+            lines.append('f {} {} {}'.format(*[rng.randint(1, nb_vertices) for _ in range(3)]))
+            nb_faces += 1
+        elif kind < 0.5:
+            lines.append('ev {} {} {} {}'.format(rng.randint(1, nb_vertices), number(), number(), number()))
+        elif kind < 0.55:
+            lines.append('tv {} {} {} {}'.format(rng.randint(1, nb_vertices), number(), number(), number()))
+        elif nb_faces == 0:
+            continue
+        elif kind < 0.65:
+            lines.append('af {} {} {} {}'.format(rng.randint(1, nb_faces + 1),
+                                                 *[rng.randint(1, nb_vertices) for _ in range(3)]))
+            nb_faces += 1
+        elif kind < 0.72:
+            lines.append('ef {} {} {} {}'.format(rng.randint(1, nb_faces),
+                                                 *[rng.randint(1, nb_vertices) for _ in range(3)]))
+        elif kind < 0.8:
+            lines.append('efv {} {} {}'.format(rng.randint(1, nb_faces), rng.randint(1, 3),
+                                               rng.randint(1, nb_vertices)))
+        elif kind < 0.87:
+            lines.append('df {}'.format(rng.randint(1, nb_faces)))
+        elif kind < 0.92:
+            lines.append('fc {} 0.5 0.25 1'.format(rng.randint(1, nb_faces)))
+        elif kind < 0.96:
+            lines.append('s {}'.format(rng.randint(0, 10 ** 6)))
+        else:
+            lines.append('# comment')
+    return '\n'.join(lines) + '\n'
+
+@pytest.mark.parametrize('name', ['example/bunny.obj', 'example/bunny.obja',
+                                  'example/suzanne.obja', 'results/cube.obja'])
+def test_round_trip_files(name, tmp_path):
+    path = os.path.join(ROOT, name)
+    binary = str(tmp_path / 'model.objb')
+    text = str(tmp_path / 'model.obja')
+    objb.obja_to_objb(path, binary)
+    objb.objb_to_obja(binary, text)
+    model = obja.parse_array_file(path)
+    assert_same_model(model, objb.load(binary))
+    assert_same_model(model, obja.parse_array_file(text))
+
+@pytest.mark.parametrize('double', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_round_trip_streams(seed, double, tmp_path):
+    path = str(tmp_path / 'stream.obja')
+    binary = str(tmp_path / 'stream.objb')
+    text = str(tmp_path / 'again.obja')
+    with open(path, 'w') as file:
+        file.write(random_stream(random.Random(seed)))
+    objb.obja_to_objb(path, binary, double)
+    objb.objb_to_obja(binary, text)
+
+    # The text written from the objb is encoded again to the same records
+    again = str(tmp_path / 'again.objb')
+    objb.obja_to_objb(text, again, double)
+    with open(binary, 'rb') as first, open(again, 'rb') as second:
+        assert first.read() == second.read()
+
+    # Single precision translations (tv) are added to float64 coordinates
+    # parsed from text, which the objb does not hold exactly
+    decoded = objb.load(binary)
+    assert_same_model(decoded, obja.parse_array_file(text), double)
+    assert_same_model(decoded, obja.parse_array_file(path), double)
@@ -0,0 +1,67 @@
+"""
+Tests of the quadric error metric decimation and of its progressive replay.
+"""
+
+import os
+import numpy as np
+import pytest
+import mesh
+import obja
+import qem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module')
+def bunny():
+    return obja.parse_array_file(os.path.join(ROOT, 'example', 'bunny.obj'))
+
+def triangles(model):
+    """
+    Returns the sorted triangles of the visible faces of a model, each as the
+    sorted coordinates of its corners.
+    """
+    corners = model.vertices[model.faces[model.visible]].round(6).tolist()
+    return sorted(tuple(sorted(map(tuple, triangle))) for triangle in corners)
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_replay_gives_original(bunny, batched, tmp_path):
+    simplified, records = qem.decimate(bunny, 0, batched = batched, faces = 496)
+    path = str(tmp_path / 'bunny.obja')
+    with open(path, 'w') as output:
+        mesh.write_progressive(output, simplified, records)
+    replayed = obja.parse_array_file(path)
+    assert triangles(replayed) == triangles(bunny)
+
+@pytest.mark.parametrize('batched', [False, True])
+@pytest.mark.parametrize('target', [101, 496, 1000])
+def test_target_faces(bunny, batched, target):
+    # A collapse removes one or two faces
+    simplified, _ = qem.decimate(bunny, 0, batched = batched, faces = target)
+    assert target - 2 <= np.count_nonzero(simplified.visible) <= target
+
+def distances(model, simplified):
+    """
+    Returns the distance of each vertex of a model to the closest vertex left
+    in its simplified mesh.
+    """
+    kept = simplified.vertices[np.unique(simplified.faces[simplified.visible])]
+    return np.concatenate([np.linalg.norm(chunk[:, None] - kept[None], axis = 2).min(axis = 1)
+                           for chunk in np.array_split(model.vertices, 20)])
+
+@pytest.mark.parametrize('target', [101, 496, 2000])
+def test_batched_quality(bunny, target):
+    simplified, _ = qem.decimate(bunny, 0, faces = target)
+    batched = mesh.Mesh.from_model(bunny)
+    decimater = qem.BatchQuadricDecimater(batched)
+    decimater.decimate(target)
+    assert target - 2 <= np.count_nonzero(batched.visible) <= target
+
+    # Close to collapsing the edges one at a time
+    expected, actual = distances(bunny, simplified), distances(bunny, batched)
+    assert actual.mean() <= 1.1 * expected.mean()
+    assert actual.max() <= 1.25 * expected.max()
+
+    # The edges rejected before collapses around them are checked again
+    nb_vertices = len(batched.vertices)
+    assert not np.any(batched.removed[decimater.rejected // nb_vertices])
+    assert not np.any(batched.removed[decimater.rejected % nb_vertices])
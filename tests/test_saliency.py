@@ -0,0 +1,128 @@
+"""
+Tests of the vectorized curvature and saliency kernels against the loops of
+the original scripts.
+"""
+
+import os
+import numpy as np
+import pytest
+import obja
+import saliency
+from adjacency import Adjacency, DynamicAdjacency
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module')
+def suzanne():
+    return obja.parse_file(os.path.join(ROOT, 'example', 'suzanne.obj'))
+
+def find_neighbours(model, vertex_index):
+    neighbours = set()
+    for face in model.faces:
+        indices = [face.a, face.b, face.c]
+        if vertex_index in indices:
+            neighbours.update(indices)
+    neighbours.discard(vertex_index)
+    return neighbours
+
+def find_neighbours_r(model, vertex_index, r):
+    neighbours = {vertex_index}
+    for _ in range(r):
+        for elt in neighbours.copy():
+            neighbours.update(find_neighbours(model, elt))
+    neighbours.remove(vertex_index)
+    return list(neighbours)
+
+def reference_curvature(model, vertex_index):
+    """
+    The curvature of a vertex as computed by the original scripts, operator
+    precedence included.
+    """
+    vertex = model.vertices[vertex_index]
+    neighbours = find_neighbours_r(model, vertex_index, 1)
+    if len(neighbours) == 0:
+        return 0
+    curvature = np.zeros((3,))
+    for neighbour_index in neighbours:
+        neighbour = model.vertices[neighbour_index]
+        curvature += vertex - neighbour / np.linalg.norm(neighbour - vertex)
+    return np.linalg.norm(curvature) / len(neighbours)
+
+def test_curvatures(suzanne):
+    adjacency = Adjacency.from_model(suzanne)
+    curvatures = saliency.compute_curvatures(suzanne.vertices, adjacency)
+    expected = [reference_curvature(suzanne, index) for index in range(len(suzanne.vertices))]
+    assert np.allclose(curvatures, expected, rtol = 1e-12, atol = 1e-12)
+
+def test_update_curvatures(suzanne):
+    vertices = np.array(suzanne.vertices)
+    faces = np.array([[face.a, face.b, face.c] for face in suzanne.faces])
+    visible = np.ones(len(faces), bool)
+    adjacency = DynamicAdjacency(faces, len(vertices), visible)
+    curvatures = saliency.compute_curvatures(vertices, adjacency)
+
+    # Moves a few vertices and hides a face
+    rng = np.random.default_rng(0)
+    moved = rng.choice(len(vertices), 20, replace = False)
+    vertices[moved] += rng.normal(0, 0.01, (20, 3))
+    adjacency.remove_face(0, faces[0].tolist())
+    visible[0] = False
+    touched = set(faces[0].tolist())
+    for vertex in moved.tolist():
+        touched.add(vertex)
+        touched.update(adjacency.neighbours(vertex).tolist())
+    saliency.update_curvatures(curvatures, vertices, adjacency, sorted(touched))
+    assert np.allclose(curvatures, saliency.compute_curvatures(vertices, adjacency.to_adjacency()),
+                       rtol = 1e-12, atol = 1e-12)
+
+def reference_saliency(model, curvatures, vertex_index, r):
+    """
+    The saliency of a vertex as computed by the original scripts: the entropy
+    of the curvatures of its r-ring, weighted by the vertex areas.
+    """
+    neighbours = find_neighbours_r(model, vertex_index, r)
+    curv = [curvatures[neighbour] for neighbour in neighbours]
+    sigmas = np.linspace(np.min(curv), np.max(curv), 25)
+    total_areas = [sum(face.area(model.vertices) for face in model.faces
+                       if idx in (face.a, face.b, face.c)) / 3 for idx in neighbours]
+    total_area = np.sum(total_areas)
+    entropy = 0
+    for sigma in sigmas:
+        areas = 0
+        for i, curvature in enumerate(curv):
+            if abs(sigmas[sigmas <= curvature].max() - sigma)/sigma <= 1e-3:
+                areas += total_areas[i]
+        p = areas/total_area
+        if p > 1e-8:
+            entropy -= p*np.log2(p)
+    return entropy
+
+@pytest.mark.parametrize('r', [1, 2])
+def test_saliency(suzanne, r):
+    adjacency = Adjacency.from_model(suzanne)
+    curvatures = saliency.compute_curvatures(suzanne.vertices, adjacency)
+    indices = np.arange(0, len(suzanne.vertices), 7)
+    expected = [reference_saliency(suzanne, curvatures, index, r) for index in indices.tolist()]
+    everything = saliency.compute_saliency(suzanne.vertices, adjacency, curvatures, r, 25)
+    assert np.allclose(everything[indices], expected, rtol = 1e-9, atol = 1e-12)
+
+    # With the areas of the rings only, of a dynamic index too
+    few = indices[:len(suzanne.vertices) // 10]
+    assert np.allclose(saliency.compute_saliency(suzanne.vertices, adjacency, curvatures, r, 25, few),
+                       everything[few], rtol = 1e-12, atol = 1e-12)
+    faces = np.array([[face.a, face.b, face.c] for face in suzanne.faces])
+    dynamic = DynamicAdjacency(faces, len(suzanne.vertices))
+    assert np.allclose(saliency.compute_saliency(suzanne.vertices, dynamic, curvatures, r, 25, few),
+                       everything[few], rtol = 1e-12, atol = 1e-12)
+
+def test_parallel_saliency(suzanne, monkeypatch):
+    # Small chunks, so that several tasks are spread over the workers
+    monkeypatch.setattr(saliency, 'SALIENCY_CHUNK', 64)
+    adjacency = Adjacency.from_model(suzanne)
+    curvatures = saliency.compute_curvatures(suzanne.vertices, adjacency)
+    expected = saliency.compute_saliency(suzanne.vertices, adjacency, curvatures, 2, 25)
+    actual = saliency.parallel_saliency(suzanne.vertices, adjacency, curvatures, 2, 25, workers = 3)
+    assert np.array_equal(actual, expected)
+    indices = np.arange(5, len(suzanne.vertices), 3)
+    actual = saliency.parallel_saliency(suzanne.vertices, adjacency, curvatures, 2, 25, indices, workers = 2)
+    assert np.array_equal(actual, expected[indices])
@@ -0,0 +1,54 @@
+"""
+Tests of the collapse priority queue.
+"""
+
+import random
+import pytest
+from scheduler import CollapseQueue
+
+def reference_pop(entries):
+    """
+    Removes and returns the (candidate, cost) pair of lowest cost from a
+    dictionary of (cost, order) values, the first pushed among equal costs.
+    """
+    item = min(entries, key = entries.get)
+    return item, entries.pop(item)[0]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_operations(seed):
+    rng = random.Random(seed)
+    costs = [(item, rng.randint(0, 50)) for item in range(100)]
+    queue = CollapseQueue(costs)
+    entries = {item: (cost, order) for order, (item, cost) in enumerate(costs)}
+    order = len(costs)
+    for _ in range(5000):
+        kind = rng.random()
+        item = rng.randrange(150)
+        if kind < 0.5:
+            cost = rng.randint(0, 50)
+            queue.push(item, cost)
+            entries[item] = (cost, order)
+            order += 1
+        elif kind < 0.7:
+            queue.remove(item)
+            entries.pop(item, None)
+        elif entries:
+            assert queue.peek() == reference_pop(dict(entries))
+            assert queue.pop() == reference_pop(entries)
+        assert len(queue) == len(entries)
+        assert (item in queue) == (item in entries)
+    while entries:
+        assert queue.pop() == reference_pop(entries)
+    with pytest.raises(IndexError):
+        queue.pop()
+    with pytest.raises(IndexError):
+        queue.peek()
+
+def test_stale_entries_compacted():
+    queue = CollapseQueue((item, item) for item in range(10))
+    # Each update leaves a stale entry in the heap until it is compacted
+    for step in range(100000):
+        queue.push(step % 10, step)
+        assert len(queue.heap) <= 2 * len(queue) + 1025
+    assert len(queue) == 10
+    assert [queue.pop() for _ in range(10)] == [(item, 99990 + item) for item in range(10)]
@@ -0,0 +1,227 @@
+"""
+Tests of the Range, conditional and /lod/ requests of server.py and
+async_server.py.
+"""
+
+import asyncio
+import errno
+import gzip
+import http.client
+import json
+import os
+import shutil
+import threading
+import zlib
+import pytest
+import async_server
+import lod
+import server
+import variants
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope = 'module')
+def served(tmp_path_factory):
+    """
+    A directory holding example/bunny.obja, an invalid obja file and a binary
+    file.
+    """
+    directory = tmp_path_factory.mktemp('served')
+    shutil.copy(os.path.join(ROOT, 'example', 'bunny.obja'), str(directory / 'bunny.obja'))
+    (directory / 'broken.obja').write_bytes(b"v 0 0 0\nf 1 2 x\n")
+    (directory / 'random.bin').write_bytes(os.urandom(5000))
+    return directory
+
+@pytest.fixture(scope = 'module', params = ['threaded', 'async'])
+def port(request, served):
+    """
+    The port of server.py or async_server.py serving the directory.
+    """
+    if request.param == 'threaded':
+        httpd = server.get_server(port = 0, serve_path = str(served))
+        threading.Thread(target = httpd.serve_forever, daemon = True).start()
+        yield httpd.server_address[1]
+        httpd.shutdown()
+        httpd.server_close()
+        return
+    ready = threading.Event()
+    ports = []
+    def ready_port(port):
+        ports.append(port)
+        ready.set()
+    streaming = async_server.StreamingServer(str(served))
+    threading.Thread(target = lambda: asyncio.run(streaming.serve(0, '127.0.0.1', ready_port)),
+                     daemon = True).start()
+    assert ready.wait(10)
+    yield ports[0]
+
+def request(port, path, headers = {}, method = 'GET'):
+    """
+    Returns the response and the body of a request.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout = 10)
+    try:
+        connection.request(method, path, headers = headers)
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+@pytest.fixture(scope = 'module')
+def bunny(served):
+    return (served / 'bunny.obja').read_bytes()
+
+def test_range(port, bunny):
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=10-2047'})
+    assert response.status == 206
+    assert response.getheader('Content-Range') == 'bytes 10-2047/{}'.format(len(bunny))
+    assert body == bunny[10:2048]
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=2048-'})
+    assert response.status == 206 and body == bunny[2048:]
+
+def test_range_not_compressed(port, bunny):
+    headers = {'Range': 'bytes=0-1023', 'Accept-Encoding': 'gzip'}
+    response, body = request(port, '/bunny.obja', headers)
+    assert response.status == 206 and response.getheader('Content-Encoding') is None
+    assert body == bunny[:1024]
+
+def test_range_not_satisfiable(port, bunny):
+    response, _ = request(port, '/bunny.obja', {'Range': 'bytes={}-'.format(len(bunny))})
+    assert response.status == 416
+    assert response.getheader('Content-Range') == 'bytes */{}'.format(len(bunny))
+
+def test_if_range(port, bunny):
+    response, _ = request(port, '/bunny.obja')
+    tag = response.getheader('ETag')
+    last_modified = response.getheader('Last-Modified')
+    for validator, status in ((tag, 206), (last_modified, 206), ('"old"', 200), ('W/' + tag, 200)):
+        response, body = request(port, '/bunny.obja', {'Range': 'bytes=10-19', 'If-Range': validator})
+        assert response.status == status, validator
+        assert body == (bunny[10:20] if status == 206 else bunny)
+
+def test_not_modified(port, bunny):
+    response, body = request(port, '/bunny.obja')
+    assert response.status == 200 and body == bunny
+    tag = response.getheader('ETag')
+    last_modified = response.getheader('Last-Modified')
+    for headers in ({'If-None-Match': tag}, {'If-None-Match': '"x", W/' + tag},
+                    {'If-Modified-Since': last_modified}):
+        response, body = request(port, '/bunny.obja', headers)
+        assert response.status == 304 and body == b"", headers
+    response, _ = request(port, '/bunny.obja', {'If-None-Match': '"x"'})
+    assert response.status == 200
+    response, _ = request(port, '/bunny.obja', {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert response.status == 200
+
+def test_compressed(port, bunny):
+    response, body = request(port, '/bunny.obja', {'Accept-Encoding': 'gzip'})
+    assert response.status == 200 and response.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(body) == bunny
+    tag = response.getheader('ETag')
+    response, _ = request(port, '/bunny.obja', {'Accept-Encoding': 'gzip', 'If-None-Match': tag})
+    assert response.status == 304
+    # HEAD gives the size of the file itself, read by the viewer
+    response, body = request(port, '/bunny.obja', {'Accept-Encoding': 'gzip'}, 'HEAD')
+    assert response.getheader('Content-Encoding') is None and body == b""
+    assert response.getheader('Content-Length') == str(len(bunny))
+    response, _ = request(port, '/random.bin', {'Accept-Encoding': 'gzip'})
+    assert response.getheader('Content-Encoding') is None
+
+def test_compressed_blocks(port, bunny):
+    response, body = request(port, '/bunny.obja.gz.json')
+    assert response.status == 200
+    table = json.loads(body)
+    assert table['size'] == len(bunny)
+    offsets, block = table['offsets'], table['block']
+    response, blocks = request(port, '/bunny.obja.gz')
+    assert response.status == 200 and response.getheader('Content-Encoding') is None
+    assert gzip.decompress(blocks) == bunny and len(blocks) == offsets[-1]
+
+    for k in (0, 1, len(offsets) - 2):
+        headers = {'Range': 'bytes={}-{}'.format(offsets[k], offsets[k + 1] - 1)}
+        response, member = request(port, '/bunny.obja.gz', headers)
+        assert response.status == 206
+        assert response.getheader('Content-Range') == 'bytes {}-{}/{}'.format(
+            offsets[k], offsets[k + 1] - 1, len(blocks))
+        assert zlib.decompress(member, 31) == bunny[k * block:(k + 1) * block]
+
+    response, _ = request(port, '/bunny.obja.gz', {'Range': 'bytes={}-'.format(len(blocks))})
+    assert response.status == 416
+    tag = request(port, '/bunny.obja.gz')[0].getheader('ETag')
+    response, _ = request(port, '/bunny.obja.gz', {'If-None-Match': tag})
+    assert response.status == 304
+    assert request(port, '/random.bin.gz')[0].status == 404
+    assert request(port, '/missing.obja.gz.json')[0].status == 404
+
+def test_variant_size_cap(served):
+    cache = variants.VariantCache(max_file = 1000)
+    assert cache.get(str(served / 'bunny.obja')) is None
+    assert cache.resource(str(served / 'bunny.obja.gz')) is None
+    assert variants.VariantCache().get(str(served / 'bunny.obja')) is not None
+
+def test_sendfile(port, bunny, served, monkeypatch):
+    # Only the small files are served from memory
+    calls = []
+    def sendfile(*args):
+        calls.append(args)
+        return send(*args)
+    send = os.sendfile
+    monkeypatch.setattr(os, 'sendfile', sendfile)
+    response, body = request(port, '/random.bin', {'Range': 'bytes=100-'})
+    assert response.status == 206 and body == (served / 'random.bin').read_bytes()[100:]
+    assert not calls
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=100-'})
+    assert response.status == 206 and body == bunny[100:]
+    assert calls
+
+@pytest.mark.parametrize('failure', ['missing', 'unsupported'])
+def test_sendfile_fallback(port, bunny, failure, monkeypatch):
+    if failure == 'missing':
+        monkeypatch.delattr(os, 'sendfile')
+    else:
+        def sendfile(*args):
+            raise OSError(errno.EINVAL, 'Invalid argument')
+        monkeypatch.setattr(os, 'sendfile', sendfile)
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=10-100000'})
+    assert response.status == 206 and body == bunny[10:100001]
+    response, body = request(port, '/bunny.obja')
+    assert response.status == 200 and body == bunny
+
+def test_parse_ranges():
+    parse = async_server.parse_ranges
+    assert parse('bytes=0-9,20-29', 100) == [(0, 9), (20, 29)]
+    assert parse('bytes=20-29,0-9,5-14,15-19', 100) == [(0, 29)]
+    assert parse('bytes=-10,50-', 100) == [(50, 99)]
+    assert parse('bytes=0-0,2-2', 100) == [(0, 0), (2, 2)]
+    assert parse('bytes=200-300', 100) == []
+    ranges = ','.join('{0}-{0}'.format(2 * k) for k in range(async_server.MAX_RANGES))
+    assert len(parse('bytes=' + ranges, 100)) == async_server.MAX_RANGES
+    assert parse('bytes=' + ranges + ',98-99', 100) is None
+
+@pytest.mark.parametrize('port', ['async'], indirect = True)
+def test_multiple_ranges(port, bunny):
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=100-199,0-149,150-'})
+    assert response.status == 206 and body == bunny
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=0-9,20-29'})
+    assert response.status == 206
+    assert response.getheader('Content-Type').startswith('multipart/byteranges')
+    assert bunny[:10] in body and bunny[20:30] in body
+    ranges = ','.join('{0}-{0}'.format(2 * k) for k in range(async_server.MAX_RANGES + 1))
+    response, body = request(port, '/bunny.obja', {'Range': 'bytes=' + ranges})
+    assert response.status == 200 and body == bunny
+
+def test_lod(port, bunny, served):
+    index = lod.build_index(str(served / 'bunny.obja'), save = False)
+    for query, end in (('faces=1000', index.end(faces = 1000)), ('bytes=5000', index.end(offset = 5000))):
+        response, body = request(port, '/lod/bunny.obja?' + query)
+        assert response.status == 200 and body == bunny[:end] and 0 < end < len(bunny)
+        response, body = request(port, '/lod/bunny.obja?' + query, method = 'HEAD')
+        assert response.getheader('Content-Length') == str(end) and body == b""
+    assert request(port, '/lod/bunny.obja?faces=1000000')[1] == bunny
+
+@pytest.mark.parametrize('path, status', [
+    ('/lod/bunny.obja', 400), ('/lod/bunny.obja?faces=x', 400), ('/lod/bunny.obja?faces=1&bytes=2', 400),
+    ('/lod/missing.obja?faces=1', 404), ('/lod/random.bin?faces=1', 422), ('/lod/broken.obja?faces=1', 422),
+])
+def test_lod_errors(port, path, status):
+    assert request(port, path)[0].status == status
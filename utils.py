@@ -1,5 +1,7 @@
 import copy
-from obja import Model, parse_file, Face
+from obja import Model, parse_file, Face, Output
+from adjacency import get_adjacency
+from saliency import compute_curvatures as vectorized_curvatures, compute_saliency
 import numpy as np
 import time
 
@@ -18,44 +20,16 @@ def compute_vertex_normal(model, vertex_index):
 
 def compute_curvatures(model, vertices):
     # Compute curvature at each vertex
-    curvatures = []
-    for vertex_index, vertex in enumerate(vertices):
-        neighbours = find_neighbours_r(model, vertex_index, 1)
-        curvature = np.zeros((3,))
-        for neighbour_index in neighbours:
-            neighbour = model.vertices[neighbour_index]
-            curvature += vertex-neighbour/np.linalg.norm(neighbour-vertex)
-
-        curv = np.linalg.norm(curvature)/len(neighbours)
-        curvatures.append(curv)
-    return curvatures
+    return vectorized_curvatures(vertices, get_adjacency(model))
 
 def find_faces(model, vertex_index):
-    faces = []
-    for face in model.faces:
-        indices = [face.a, face.b, face.c]
-        if vertex_index in indices:
-            faces.append(face)
-    return faces
+    return [model.faces[k] for k in get_adjacency(model).faces(vertex_index)]
 
 def find_neighbours(model, vertex_index):
-    neighbours = set()
-    for face in model.faces:
-        indices = [face.a, face.b, face.c]
-        if vertex_index in indices:
-            for index in indices:
-                neighbours.add(index)
-    neighbours.discard(vertex_index)
-    return neighbours
+    return set(get_adjacency(model).neighbours(vertex_index).tolist())
 
 def find_neighbours_r(model, vertex_index, r):
-    neighbours = {vertex_index}
-    for _ in range(r):
-        temp = neighbours.copy()
-        for elt in temp:
-            neighbours.update(find_neighbours(model, elt))
-    neighbours.remove(vertex_index)
-    return list(neighbours)
+    return get_adjacency(model).ring(vertex_index, r)
 
 def sampling(curvatures, num):
     min_curvature = np.min(curvatures)
@@ -70,17 +44,8 @@ def compute_vertex_area(model, vertex_index):
     return vertex_area
 
 def saliency_map(model, mesh_curvatures, vertices, r, i):
-    saliency = []
-    for vertex_index in vertices:
-        neighbours = find_neighbours_r(model, vertex_index, r)
-        if len(neighbours) == 0:
-            print(vertex_index)
-            print(i)
-        curv = [mesh_curvatures[neighbour] for neighbour in neighbours]
-        sigmas = sampling(curv, 25)
-        entropy = compute_entropy(model, sigmas, curv, neighbours)
-        saliency.append(entropy)
-    return saliency
+    return compute_saliency(model.vertices, get_adjacency(model), mesh_curvatures, r, 25,
+                            list(vertices)).tolist()
 
 def compute_entropy(model, sigmas, curv, neighbours):
     total_areas = [compute_vertex_area(model, idx) for idx in neighbours]
@@ -176,28 +141,6 @@ for i in range(len(saliency)):
     saliency[i] /= max_saliency
 
 with open(".\\results\\subdivided_cube_result.obj", 'w') as f:
-    for i, vertex in enumerate(model.vertices):
-        f.write("v")
-        f.write(" ")
-        f.write(str(vertex[0]))
-        f.write(" ")
-        f.write(str(vertex[1]))
-        f.write(" ")
-        f.write(str(vertex[2]))
-        # f.write(" ")
-        # f.write(str(saliency[i]))
-        # f.write(" ")
-        # f.write("0")
-        # f.write(" ")
-        # f.write("0")
-        f.write("\n")
-    
-    for face in model.faces:
-        f.write("f")
-        f.write(" ")
-        f.write(str(face.a + 1))
-        f.write(" ")
-        f.write(str(face.b + 1))
-        f.write(" ")
-        f.write(str(face.c + 1))
-        f.write("\n")
\ No newline at end of file
+    output = Output(f)
+    output.add_vertices(range(len(model.vertices)), model.vertices)
+    output.add_faces(range(len(model.faces)), [[face.a, face.b, face.c] for face in model.faces])
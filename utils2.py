@@ -1,6 +1,11 @@
 from cmath import inf
 import copy
 from obja import Model, parse_file, Face
+from adjacency import get_adjacency
+from geometry import get_geometry
+from saliency import compute_curvatures as vectorized_curvatures, compute_saliency, update_curvatures
+from scheduler import CollapseQueue
+from mesh import Mesh, write_mesh
 import numpy as np
 import time
 
@@ -11,55 +16,23 @@ def compute_face_normals(model, faces):
     return [face.normal(model.vertices) for face in faces]
 
 def compute_vertex_normal(model, vertex_index):
-    faces = find_faces(model, vertex_index)
-    normals = compute_face_normals(model, faces)
+    normals = get_geometry(model).normals[get_adjacency(model).faces(vertex_index)]
     vertex_normal = np.mean(normals, axis=0)
     vertex_normal /= np.linalg.norm(vertex_normal)
     return vertex_normal
 
 def compute_curvatures(model, vertices):
     # Compute curvature at each vertex
-    curvatures = []
-    for vertex_index, vertex in enumerate(vertices):
-        neighbours = find_neighbours_r(model, vertex_index, 1)
-        if len(neighbours) == 0:
-            curvatures.append(0)
-        else:
-            curvature = np.zeros((3,))
-            for neighbour_index in neighbours:
-                neighbour = model.vertices[neighbour_index]
-                curvature += vertex-neighbour/np.linalg.norm(neighbour-vertex)
-
-            curv = np.linalg.norm(curvature)/len(neighbours)
-            curvatures.append(curv)
-    return curvatures
+    return vectorized_curvatures(vertices, get_adjacency(model))
 
 def find_faces(model, vertex_index):
-    faces = []
-    for face in model.faces:
-        indices = [face.a, face.b, face.c]
-        if vertex_index in indices:
-            faces.append(face)
-    return faces
+    return [Face(*model.faces[k]) for k in get_adjacency(model).faces(vertex_index)]
 
 def find_neighbours(model, vertex_index):
-    neighbours = set()
-    for face in model.faces:
-        indices = [face.a, face.b, face.c]
-        if vertex_index in indices:
-            for index in indices:
-                neighbours.add(index)
-    neighbours.discard(vertex_index)
-    return neighbours
+    return set(get_adjacency(model).neighbours(vertex_index).tolist())
 
 def find_neighbours_r(model, vertex_index, r):
-    neighbours = {vertex_index}
-    for _ in range(r):
-        temp = neighbours.copy()
-        for elt in temp:
-            neighbours.update(find_neighbours(model, elt))
-    neighbours.remove(vertex_index)
-    return list(neighbours)
+    return get_adjacency(model).ring(vertex_index, r)
 
 def sampling(curvatures, num):
     min_curvature = np.min(curvatures)
@@ -68,20 +41,11 @@ def sampling(curvatures, num):
     return sampled  
 
 def compute_vertex_area(model, vertex_index):
-    faces = find_faces(model, vertex_index)
-    areas = compute_areas(model, faces)
-    vertex_area = np.sum(areas)/3
-    return vertex_area
+    return get_geometry(model).vertex_areas[vertex_index]
 
 def saliency_map(model, mesh_curvatures, vertices, r, i):
-    saliency = []
-    for vertex_index in vertices:
-        neighbours = find_neighbours_r(model, vertex_index, r)
-        curv = [mesh_curvatures[neighbour] for neighbour in neighbours]
-        sigmas = sampling(curv, 25)
-        entropy = compute_entropy(model, sigmas, curv, neighbours)
-        saliency.append(entropy)
-    return saliency
+    return compute_saliency(model.vertices, get_adjacency(model), mesh_curvatures, r, 25,
+                            list(vertices), get_geometry(model).vertex_areas).tolist()
 
 def compute_entropy(model, sigmas, curv, neighbours):
     total_areas = [compute_vertex_area(model, idx) for idx in neighbours]
@@ -100,71 +64,53 @@ def compute_entropy(model, sigmas, curv, neighbours):
     return entropy
 
 def edge_collapse(model, vertex_index, saliency):
-    output = Model()
     neighbours = find_neighbours_r(model, vertex_index, 1)
     neighbour_saliencies = [saliency[neighbour] for neighbour in neighbours]
     remove_index = neighbours[np.argmin(neighbour_saliencies)]
-    decrement = vertex_index > remove_index
-
-    for i in range(len(model.vertices)):
-        if (i == vertex_index):
-            output.vertices.append((model.vertices[i] + model.vertices[remove_index])/2)
-        elif (i != remove_index and i != vertex_index):
-            output.vertices.append(model.vertices[i])
-        
-    for face in model.faces:
-        indices = [face.a, face.b, face.c]    
-        if ((vertex_index in indices) and (remove_index in indices)):
-            continue
-        for i in range(3):
-            if (indices[i] == remove_index):
-                indices[i] = vertex_index
-            if (indices[i] > remove_index):
-                indices[i] -= 1    
-        output.faces.append(Face(indices[0], indices[1], indices[2]))
-
-    return output, remove_index, decrement
+
+    vtx = (model.vertices[vertex_index] + model.vertices[remove_index])/2
+    record = model.collapse(vertex_index, remove_index, vtx)
+
+    return remove_index, record
 
 
 # Testing
 path = "example\\bunny.obj"
-model = parse_file(path)
+model = Mesh.from_model(parse_file(path))
 
 # Preprocessing
-# Remove vertices that have no neighbours
-temp = []
-for i in range(len(model.vertices)):
-    if len(find_neighbours_r(model, i, 1)) > 0:
-        temp.append(model.vertices[i])
-model.vertices = temp
+# Vertices that have no neighbours are never collapsed
+connected = [i for i in range(len(model.vertices)) if len(find_neighbours_r(model, i, 1)) > 0]
 
 
 nb_edge_collapse = 1500
 r = 2
 t1 = time.time()
 mesh_curvatures = compute_curvatures(model, model.vertices)
-saliency = saliency_map(model, mesh_curvatures, range(len(model.vertices)), r, 0)
+saliency = [+inf] * len(model.vertices)
+for idx, entropy in zip(connected, saliency_map(model, mesh_curvatures, connected, r, 0)):
+    saliency[idx] = entropy
 t2 = time.time()
 print("time 1 : ", t2 - t1)
 t3 = time.time()
+queue = CollapseQueue((idx, saliency[idx]) for idx in connected)
 for i in range(nb_edge_collapse):
-    vertex_index = np.argmin(saliency)
-    #new_model, remove_index, decrement = edge_collapse(model, vertex_index, saliency)
-    model, remove_index, decrement = edge_collapse(model, vertex_index, saliency)
-    mesh_curvatures = compute_curvatures(model, model.vertices)
-    #model = copy.deepcopy(new_model)
-    saliency.pop(remove_index)
-    if decrement:
-        vertex_index -= 1
+    if len(queue) == 0:
+        break
+    vertex_index, _ = queue.pop()
+    remove_index, record = edge_collapse(model, vertex_index, saliency)
+    for idx in [remove_index] + model.isolated_vertices(record):
+        saliency[idx] = +inf
+        queue.remove(idx)
+    touched = [vertex_index, remove_index] + find_neighbours_r(model, vertex_index, 1)
+    update_curvatures(mesh_curvatures, model.vertices, get_adjacency(model), touched)
     local_vertices = find_neighbours_r(model, vertex_index, r)
     if len(local_vertices) != 0:
         local_vertices.append(vertex_index)
         local_saliency = saliency_map(model, mesh_curvatures, local_vertices, r, i)
         for cpt, idx in enumerate(local_vertices):
             saliency[idx] = local_saliency[cpt]
-    for j in range(len(model.vertices)):
-        if len(find_neighbours_r(model, j, 1)) == 0:
-            saliency[j] = +inf
+            queue.push(idx, saliency[idx])
 t4 = time.time()
 print("time 2 : ", t4 - t3)
 
@@ -180,28 +126,4 @@ print("time 2 : ", t4 - t3)
 #     saliency[i] /= max_saliency
 
 with open(".\\results\\bunny_test.obj", 'w') as f:
-    for i, vertex in enumerate(model.vertices):
-        f.write("v")
-        f.write(" ")
-        f.write(str(vertex[0]))
-        f.write(" ")
-        f.write(str(vertex[1]))
-        f.write(" ")
-        f.write(str(vertex[2]))
-        # f.write(" ")
-        # f.write(str(saliency[i]))
-        # f.write(" ")
-        # f.write("0")
-        # f.write(" ")
-        # f.write("0")
-        f.write("\n")
-    
-    for face in model.faces:
-        f.write("f")
-        f.write(" ")
-        f.write(str(face.a + 1))
-        f.write(" ")
-        f.write(str(face.b + 1))
-        f.write(" ")
-        f.write(str(face.c + 1))
-        f.write("\n")
\ No newline at end of file
+    write_mesh(f, model)